@@ -2,7 +2,19 @@ import logging
 import numpy as np
 import typing
 
-from decaf import net
+if typing.TYPE_CHECKING:
+    from decaf import net
+
+
+# The phases a network runs in. In the train phase, layers compute what training needs (e.g. dropout drops its input);
+# in the test phase, layers may skip training-only computations.
+PHASE_TRAIN = 'train'
+PHASE_TEST = 'test'
+
+# The layouts of the images in a blob: channels-last (num, height, width, channels), and channel-first (num, channels,
+# height, width).
+LAYOUT_NHWC = 'NHWC'
+LAYOUT_NCHW = 'NCHW'
 
 
 class DecafError(Exception):
@@ -19,6 +31,37 @@ class InvalidNetError(DecafError):
     pass
 
 
+# The number of buffers allocated by all the blobs so far, see num_allocations().
+_num_allocations = 0
+
+
+def num_allocations():
+    """
+    Returns the number of data and diff buffers the blobs have allocated so far. A network running at a steady state
+    should not allocate, even when the batch size changes within the largest batch it has seen.
+    """
+    return _num_allocations
+
+
+def _take(buffer: typing.Optional[np.ndarray],
+          shape: tuple,
+          dtype: np.dtype):
+    """
+    Returns a zeroed array of the given shape viewing the front of buffer, and the buffer itself. A new buffer is only
+    allocated if the old one is missing, has a different dtype, or is too small.
+    """
+    size = int(np.prod(shape))
+    if buffer is None or buffer.dtype != dtype or buffer.size < size:
+        global _num_allocations
+        _num_allocations += 1
+        logging.debug('Blob allocated {0} dtype {1}'.format(str(shape), str(dtype)))
+        buffer = np.zeros(size, dtype)
+        return buffer, buffer.reshape(shape)
+    array = buffer[:size].reshape(shape)
+    array[...] = 0
+    return buffer, array
+
+
 class Filler(object):
     """
     This is the class that implements util functions to fill a blob.
@@ -48,8 +91,22 @@ class Blob(object):
 
     The diff matrix will not be created unless you explicitly run init_diff, as many Blobs do not need the gradients
     to be computed.
+
+    Blobs are accessed in the inner loop of every forward and backward pass, so they are kept light: the attributes
+    are declared in __slots__, and data() and diff() return the stored arrays themselves instead of new views. Callers
+    may change the values in place, but should never change the shape of the returned arrays in place (use reshape()
+    instead).
+
+    The data and diff are views of buffers that only grow: when the shape changes to one that fits in the buffer, e.g.
+    for a smaller batch, the blob hands out a view of the front of the buffer instead of allocating a new array.
+
+    The blob counts the changes of its data in version(), so that layers can keep caches derived from it, like a
+    sparse copy of a weight. mirror(), init_data() and update() count as changes. Code that writes the data in place,
+    like a solver that sets the parameters, should call mark_changed() afterwards.
     """
 
+    __slots__ = ('_data', '_diff', '_filler', '_data_buffer', '_diff_buffer', '_version')
+
     def __init__(self,
                  shape: typing.Optional[tuple] = None,
                  dtype: np.dtype = np.float64,
@@ -57,6 +114,9 @@ class Blob(object):
         self._data: typing.Optional[np.ndarray] = None
         self._diff: typing.Optional[np.ndarray] = None
         self._filler: Filler = filler
+        self._data_buffer: typing.Optional[np.ndarray] = None
+        self._diff_buffer: typing.Optional[np.ndarray] = None
+        self._version: int = 0
         if shape is not None:
             self.init_data(shape, dtype)
 
@@ -64,7 +124,11 @@ class Blob(object):
                input_array: np.ndarray,
                shape: typing.Optional[tuple] = None):
         # Create the data as a view of the input array. This is useful to save space and avoid duplication for data
-        # layers.
+        # layers. scipy.sparse matrices have no views, and are kept as they are.
+        self._version += 1
+        if not isinstance(input_array, np.ndarray):
+            self._data = input_array
+            return
         self._data = input_array.view()
         if shape is not None:
             self._data.shape = shape
@@ -78,24 +142,50 @@ class Blob(object):
         if shape is not None:
             self._diff.shape = shape
 
+    def detach_data(self):
+        """
+        Forgets the data, e.g. a view mirrored from another array, so that the next init_data() hands out a view of
+        the blob's own buffer instead of clearing the mirrored array in place.
+        """
+        self._data = None
+        self._version += 1
+
+    def release_data(self):
+        """Forgets the data and frees the blob's own data buffer."""
+        self.detach_data()
+        self._data_buffer = None
+
+    def detach_diff(self):
+        """Forgets the diff, like detach_data()."""
+        self._diff = None
+
+    def mark_changed(self):
+        """Records that the data was changed in place. See version()."""
+        self._version += 1
+
+    def version(self):
+        """Returns a number that changes whenever the data changes, as far as the blob is told."""
+        return self._version
+
     def has_data(self):
         """Checks if the blob has data."""
         return self._data is not None
 
     def data(self):
-        """Returns a view of the data."""
-        return self._data.view()
+        """Returns the data. If the blob holds a scipy.sparse matrix, the matrix itself is returned."""
+        return self._data
 
     def has_diff(self):
         """Checks if the blob has diff."""
         return self._diff is not None
 
     def diff(self):
-        """Return a view of the diff."""
-        return self._diff.view()
+        """Return the diff."""
+        return self._diff
 
     def update(self):
         self._data += self._diff
+        self._version += 1
 
     def resize(self,
                shape: tuple,
@@ -103,10 +193,8 @@ class Blob(object):
         if self._data.shape == shape and self._data.dtype == dtype:
             pass
         else:
-            # Blob resize should not happen often. If it happens, we log it
-            # so the user can know if multiple resize take place.
-            logging.info('Blob resized to {0} dtype {1}'.format(str(shape), str(dtype)))
-            self._data = np.zeros(shape, dtype=dtype)
+            self._data_buffer, self._data = _take(self._data_buffer, shape, dtype)
+            self._version += 1
 
     def init_data(self,
                   shape: tuple,
@@ -118,7 +206,8 @@ class Blob(object):
         if self.has_data() and self._data.shape == shape and self._data.dtype == dtype:
             self._data[:] = 0
         else:
-            self._data = np.zeros(shape, dtype)
+            self._data_buffer, self._data = _take(self._data_buffer, shape, dtype)
+        self._version += 1
         if self._filler is not None:
             self._filler.fill(self._data)
         return self.data()
@@ -132,9 +221,10 @@ class Blob(object):
         if not self.has_data():
             raise ValueError('The data should be initialized first!')
         if self.has_diff() and self._diff.shape == self._data.shape and self._diff.dtype == self._data.dtype:
+            # the diff may be a view into another array (see mirror_diff), so it is cleared in place.
             self._diff[:] = 0
         else:
-            self._diff = np.zeros(self._data.shape, self._data.dtype)
+            self._diff_buffer, self._diff = _take(self._diff_buffer, self._data.shape, self._data.dtype)
         return self.diff()
 
 
@@ -156,6 +246,18 @@ class Layer(object):
         self.spec: dict = kwargs
         self.name: str = self.spec['name']
         self._param: list = []
+        self._r_param: list = []
+        self._phase: str = PHASE_TRAIN
+
+    def set_phase(self,
+                  phase: str):
+        """
+        Sets the phase of the layer, either PHASE_TRAIN or PHASE_TEST. Layers that behave differently at test time
+        should check self._phase in their forward and backward passes.
+        """
+        if phase not in (PHASE_TRAIN, PHASE_TEST):
+            raise DecafError('Unknown phase: {}'.format(phase))
+        self._phase = phase
 
     def forward(self,
                 bottom: typing.List[Blob],
@@ -200,6 +302,76 @@ class Layer(object):
         """
         return self._param
 
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        """
+        Returns the list of the shapes of the top blobs, given the list of the shapes of the bottom blobs, without
+        running the layer. Net.finish() uses this to infer the shapes of all the blobs before the first execution.
+        """
+        raise NotImplementedError('{} does not implement shape inference.'.format(type(self).__name__))
+
+    def param_shapes(self,
+                     input_shapes: typing.List[tuple]):
+        """
+        Returns the list of the shapes of the parameters, in the same order as param(), given the list of the shapes of
+        the bottom blobs.
+        """
+        if self._param:
+            raise NotImplementedError('{} does not implement shape inference.'.format(type(self).__name__))
+        return []
+
+    def scratch_bytes(self,
+                      input_shapes: typing.List[tuple],
+                      itemsize: int):
+        """
+        Returns the number of bytes of the intermediate storage the layer uses besides its top blobs and parameters,
+        e.g. masks and im2col buffers, given the list of the shapes of the bottom blobs and the size of one element.
+        """
+        return 0
+
+    def forward_r(self,
+                  bottom: typing.List[Blob],
+                  top: typing.List[Blob],
+                  bottom_r: typing.List[Blob],
+                  top_r: typing.List[Blob]):
+        """
+        Computes the R operator of the forward pass (Pearlmutter, Fast exact multiplication by the Hessian, 1994).
+
+        The R operator is the directional derivative along a direction in the parameter space. The data of bottom_r
+        holds the directional derivatives of the bottom data (a bottom_r blob without data stands for zero), and the
+        data of r_param() holds the direction of the parameters of this layer. The layer writes the directional
+        derivative of its top data into the data of top_r. It is called after forward() and backward() have run at
+        the current parameters.
+        """
+        raise NotImplementedError('{} does not implement the R operator.'.format(type(self).__name__))
+
+    def backward_r(self,
+                   bottom: typing.List[Blob],
+                   top: typing.List[Blob],
+                   bottom_r: typing.List[Blob],
+                   top_r: typing.List[Blob],
+                   propagate_down: bool,
+                   gauss_newton: bool):
+        """
+        Computes the R operator of the backward pass.
+
+        The diff of top_r holds the directional derivative of the top diff. The layer writes the directional derivative
+        of the gradient of its parameters, i.e. the Hessian-vector product, into the diff of r_param(), and if
+        propagate_down is True, that of the bottom diff into the diff of bottom_r.
+
+        If gauss_newton is True, the terms that come from the curvature of the layer itself (the ones that involve the
+        top diff) are dropped, which gives the Gauss-Newton-vector product instead, which is positive semi-definite for
+        convex losses.
+        """
+        raise NotImplementedError('{} does not implement the R operator.'.format(type(self).__name__))
+
+    def r_param(self):
+        """
+        Returns the blobs that hold the direction of the parameters in their data, and the Hessian-vector product in
+        their diff, in the same order as param().
+        """
+        return self._r_param
+
 
 class DataLayer(Layer):
     """
@@ -233,6 +405,46 @@ class DataLayer(Layer):
         """
         pass
 
+    def forward_r(self,
+                  bottom: typing.List[Blob],
+                  top: typing.List[Blob],
+                  bottom_r: typing.List[Blob],
+                  top_r: typing.List[Blob]):
+        """
+        The data does not depend on the parameters, so its R operator is zero, and top_r is left without data.
+        """
+        pass
+
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        """
+        Returns the shapes of the blobs the layer emits. Data layers that can not tell them ahead of time raise
+        NotImplementedError, and their shapes have to be passed to Net.finish().
+        """
+        raise NotImplementedError('{} can not tell the shapes of its data.'.format(type(self).__name__))
+
+    def output_dtypes(self):
+        """
+        Returns the dtypes of the blobs the layer emits, or None if the layer can not tell them ahead of time.
+        """
+        return None
+
+    def num_data(self):
+        """
+        Returns the total number of data points the layer emits, or None if the layer can not emit its data in ranges.
+        Layers that return a number should implement set_range().
+        """
+        return None
+
+    def set_range(self,
+                  start: typing.Optional[int] = None,
+                  stop: typing.Optional[int] = None):
+        """
+        Restricts the output of the following forward passes to the data points in [start, stop). Calling it without
+        arguments emits all the data again. This allows solvers to go through the data in chunks.
+        """
+        raise NotImplementedError
+
 
 class LossLayer(Layer):
     """
@@ -256,6 +468,23 @@ class LossLayer(Layer):
                  propagate_down: bool):
         return self._loss
 
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        """A loss layer has no top blobs."""
+        return []
+
+    def backward_r(self,
+                   bottom: typing.List[Blob],
+                   top: typing.List[Blob],
+                   bottom_r: typing.List[Blob],
+                   top_r: typing.List[Blob],
+                   propagate_down: bool,
+                   gauss_newton: bool):
+        """
+        Like the gradient, the R operator of the loss is computed in forward_r().
+        """
+        pass
+
     def update(self):
         pass
 
@@ -268,7 +497,7 @@ class Solver(object):
     def __init__(self, **kwargs):
         self.spec: dict = kwargs
 
-    def solve(self, my_net: net.Net):
+    def solve(self, my_net: 'net.Net'):
         """
         The solve function takes a net as an input, and optimizes its parameters.
         """
@@ -290,6 +519,19 @@ class Regularizer(object):
     def reg(self, blob: Blob, num_data):
         """
         Compute the regularization term from the blob's data field, and add the regularization term to its diff directly
+
+        Both the returned term and its gradient are scaled by num_data, the number of data points the loss is computed
+        on, so that the regularizer keeps the same relative strength for any batch size.
+        """
+        raise NotImplementedError
+
+    def reg_r(self,
+              blob: Blob,
+              r_blob: Blob,
+              num_data):
+        """
+        Adds the product of the Hessian of the regularization term at the blob's data with the direction in r_blob's
+        data to r_blob's diff. See Layer.backward_r().
         """
         raise NotImplementedError
 
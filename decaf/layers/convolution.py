@@ -1,7 +1,9 @@
+import numpy as np
 import typing
 
-from decaf.base import Layer, Blob, Regularizer, Filler
+from decaf.base import Layer, Blob, Regularizer, Filler, LAYOUT_NHWC, LAYOUT_NCHW
 from decaf.layers import padding, im2col, innerproduct
+from decaf.util import blasdot
 
 
 class ConvolutionLayer(Layer):
@@ -25,10 +27,20 @@ class ConvolutionLayer(Layer):
             memory: the approximate memory budget guideline (in bytes).
                 This is used to determine how many intermediate storage we can keep. Default 1e7 (10 megabytes).
                 CURRENTLY, THE MEMORY IS NOT USED AND THE CONVOLUTION ALWAYS RUNS PER-IMAGE.
+            layout: the layout of the input and output images, LAYOUT_NHWC (num, height, width, channels) or
+                LAYOUT_NCHW (num, channels, height, width). Default LAYOUT_NHWC. In the LAYOUT_NCHW layout, the kernels
+                have shape (num_kernels, channels, ksize, ksize) instead of (num_kernels, ksize, ksize, channels), and
+                every image is convolved as one product of the kernels with its channel-first im2col matrix, without
+                any transpose.
 
         When computing convolutions, we will always start from the top left corner, and any row/columns on the right and
         bottom sides that do not fit the stride will be discarded. To enforce the 'same' mode to return results of the
         same size as the data, we require the 'same' mode to be paired with an odd number as the kernel size.
+
+        When there is no padding and the patches do not overlap, i.e. for 1x1 kernels, or for a stride equal to the
+        kernel size in the 'valid' mode, the patches are read as a strided view of the input and im2col is skipped. For
+        1x1 kernels with stride 1 the view needs no copy at all, and in the LAYOUT_NHWC layout the whole batch is then a
+        single product of the (num * height * width, channels) input and the kernels.
         """
         Layer.__init__(self, **kwargs)
         self._num_kernels: int = self.spec['num_kernels']
@@ -38,8 +50,11 @@ class ConvolutionLayer(Layer):
         self._reg: typing.Optional[Regularizer] = self.spec.get('reg', None)
         self._filler: typing.Optional[Filler] = self.spec.get('filler', None)
         self._memory: int = self.spec.get('memory', 1e7)
-        if self._ksize <= 1:
-            raise ValueError('Invalid kernel size. Kernel size should > 1.')
+        self._layout: str = self.spec.get('layout', LAYOUT_NHWC)
+        if self._layout not in (LAYOUT_NHWC, LAYOUT_NCHW):
+            raise ValueError('Unknown layout: {}'.format(self._layout))
+        if self._ksize < 1:
+            raise ValueError('Invalid kernel size. Kernel size should > 0.')
         if self._mode == 'same' and self._ksize % 2 == 0:
             raise ValueError('The "same" mode should have an odd kernel size.')
         # since the im2col operation often creates large intermediate matrices, we will have intermediate blobs to store
@@ -47,6 +62,7 @@ class ConvolutionLayer(Layer):
         self._single_data: typing.List[Blob] = [Blob()]
         self._padded: typing.List[Blob] = [Blob()]
         self._col: typing.List[Blob] = [Blob()]
+        self._col_flat: typing.List[Blob] = [Blob()]
         self._conv_out: typing.List[Blob] = [Blob()]
         # set up the parameter - it's the same as the inner product param, but we will have our own copy since the inner
         # product param (especially the diff) will be overwritten when we run on an per-image basis.
@@ -61,11 +77,16 @@ class ConvolutionLayer(Layer):
             pad = int(self._ksize / 2)
         else:
             raise ValueError('Unknown mode: {}'.format(self._mode))
+        # without padding and overlaps, the patches are a view of the input (see _patches).
+        self._direct: bool = pad == 0 and (self._ksize == 1 or self._stride == self._ksize)
+        self._pointwise: bool = self._ksize == 1 and self._stride == 1
         # construct the layers
-        self._pad_layer: padding.PaddingLayer = padding.PaddingLayer(name=self.name + '_pad', pad=pad)
+        self._pad_layer: padding.PaddingLayer = padding.PaddingLayer(name=self.name + '_pad', pad=pad,
+                                                                     layout=self._layout)
         self._im2col_layer: im2col.Im2colLayer = im2col.Im2colLayer(name=self.name + '_im2col',
                                                                     psize=self._ksize,
-                                                                    stride=self._stride)
+                                                                    stride=self._stride,
+                                                                    layout=self._layout)
         self._ip_layer: innerproduct.InnerProductLayer = \
             innerproduct.InnerProductLayer(name=self.name + '_ip', num_output=self._num_kernels, bias=False)
 
@@ -74,20 +95,80 @@ class ConvolutionLayer(Layer):
         self._single_data = [Blob()]
         self._padded = [Blob()]
         self._col = [Blob()]
+        self._col_flat = [Blob()]
         self._conv_out = [Blob()]
         return self.__dict__
 
+    def _shapes(self,
+                input_shape: tuple):
+        """Returns the 4-dimensional input shape, and the shapes of the padded input and of the patches."""
+        if len(input_shape) == 3:
+            # only one channel
+            if self._layout == LAYOUT_NCHW:
+                input_shape = (input_shape[0], 1) + tuple(input_shape[1:])
+            else:
+                input_shape = tuple(input_shape) + (1,)
+        padded_shape = self._pad_layer.output_shapes([input_shape])[0]
+        col_shape = self._im2col_layer.output_shapes([padded_shape])[0]
+        return input_shape, padded_shape, col_shape
+
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        col_shape = self._shapes(input_shapes[0])[2]
+        if self._layout == LAYOUT_NCHW:
+            return [(col_shape[0], self._num_kernels) + col_shape[2:]]
+        return [col_shape[:3] + (self._num_kernels,)]
+
+    def param_shapes(self,
+                     input_shapes: typing.List[tuple]):
+        if self._layout == LAYOUT_NCHW:
+            channels = self._shapes(input_shapes[0])[0][1]
+            return [(self._num_kernels, channels, self._ksize, self._ksize)]
+        channels = self._shapes(input_shapes[0])[0][3]
+        return [(self._num_kernels, self._ksize, self._ksize, channels)]
+
+    def scratch_bytes(self,
+                      input_shapes: typing.List[tuple],
+                      itemsize: int):
+        """
+        The buffers of one image: the diff of the input, the padded input and its diff, the patches and their diff,
+        the output of the inner product, and the flat kernels and their diff (the last two only in the LAYOUT_NHWC
+        layout). The diffs of the input side are only allocated when the gradient w.r.t. the input is computed, so
+        this is an upper bound.
+        """
+        input_shape, padded_shape, col_shape = self._shapes(input_shapes[0])
+        if self._direct:
+            # the gathered patches and their diff, for the whole batch in the LAYOUT_NHWC layout.
+            if self._pointwise:
+                return 0
+            col_size = int(np.prod(col_shape if self._layout == LAYOUT_NHWC else col_shape[1:]))
+            return 2 * col_size * itemsize
+        image_size = int(np.prod(input_shape[1:]))
+        padded_size = int(np.prod(padded_shape[1:])) if self._pad_layer.spec['pad'] else 0
+        col_size = int(np.prod(col_shape[1:]))
+        if self._layout == LAYOUT_NCHW:
+            return (image_size + 2 * padded_size + 2 * col_size) * itemsize
+        out_size = col_shape[1] * col_shape[2] * self._num_kernels
+        kernel_size = col_shape[3] * self._num_kernels
+        return (image_size + 2 * padded_size + 2 * col_size + out_size + 2 * kernel_size) * itemsize
+
     def forward(self,
                 bottom: typing.List[Blob],
                 top: typing.List[Blob]):
         """Runs the forward pass."""
+        if self._direct:
+            return self._forward_direct(bottom, top)
+        if self._layout == LAYOUT_NCHW:
+            return self._forward_nchw(bottom, top)
         # cache objects to avoid the [0] index.
         single_data = self._single_data[0]
+        col_blob = self._col[0]
+        col_flat_blob = self._col_flat[0]
         conv_out_blob = self._conv_out[0]
         bottom_data = bottom[0].data()
         if bottom_data.ndim == 3:
             # only one channel
-            bottom_data.shape = bottom_data.shape + (1,)
+            bottom_data = bottom_data.reshape(bottom_data.shape + (1,))
         if not self._kernels.has_data():
             self._kernels.init_data((self._num_kernels, self._ksize, self._ksize, bottom_data.shape[-1]),
                                     bottom_data.dtype)
@@ -100,12 +181,15 @@ class ConvolutionLayer(Layer):
             single_data.mirror(bottom_data[i:i+1])
             self._pad_layer.forward(self._single_data, self._padded)
             self._im2col_layer.forward(self._padded, self._col)
-            self._ip_layer.forward(self._col, self._conv_out)
+            # the inner product runs on the (height * width, ksize * ksize * channels) matrix of patches.
+            col_shape = col_blob.data().shape
+            col_flat_blob.mirror(col_blob.data(), (col_shape[1] * col_shape[2], col_shape[3]))
+            self._ip_layer.forward(self._col_flat, self._conv_out)
             if i == 0:
                 # initialize the top_data
-                top_data = top[0].init_data((bottom_data.shape[0],) + conv_out_blob.data().shape[1:],
+                top_data = top[0].init_data((bottom_data.shape[0], col_shape[1], col_shape[2], self._num_kernels),
                                             conv_out_blob.data().dtype)
-            top_data[i] = conv_out_blob.data()
+            top_data[i].flat = conv_out_blob.data().flat
         return
 
     def backward(self,
@@ -113,13 +197,19 @@ class ConvolutionLayer(Layer):
                  top: typing.List[Blob],
                  propagate_down: bool):
         """Runs the backward pass."""
+        if self._direct:
+            return self._backward_direct(bottom, top, propagate_down)
+        if self._layout == LAYOUT_NCHW:
+            return self._backward_nchw(bottom, top, propagate_down)
         single_data = self._single_data[0]
+        col_blob = self._col[0]
+        col_flat_blob = self._col_flat[0]
         conv_out_blob = self._conv_out[0]
         top_diff = top[0].diff()
         bottom_data = bottom[0].data()
         if bottom_data.ndim == 3:
             # only one channel
-            bottom_data.shape = bottom_data.shape + (1,)
+            bottom_data = bottom_data.reshape(bottom_data.shape + (1,))
         kernel_diff = self._kernels.init_diff()
         if propagate_down:
             bottom_diff = bottom[0].init_diff()
@@ -128,10 +218,13 @@ class ConvolutionLayer(Layer):
             single_data.mirror(bottom_data[i:i+1])
             self._pad_layer.forward(self._single_data, self._padded)
             self._im2col_layer.forward(self._padded, self._col)
-            conv_out_blob.mirror(top_diff[i:i+1])
-            self._ip_layer.backward(self._col, self._conv_out, propagate_down)
+            col_shape = col_blob.data().shape
+            col_flat_blob.mirror(col_blob.data(), (col_shape[1] * col_shape[2], col_shape[3]))
+            conv_out_blob.mirror_diff(top_diff[i], (col_shape[1] * col_shape[2], self._num_kernels))
+            self._ip_layer.backward(self._col_flat, self._conv_out, propagate_down)
             kernel_diff.flat += self._ip_layer.param()[0].diff().flatten()
             if propagate_down:
+                col_blob.mirror_diff(col_flat_blob.diff(), col_shape)
                 self._im2col_layer.backward(self._padded, self._col, True)
                 self._pad_layer.backward(self._single_data, self._padded, True)
                 bottom_diff[i].flat = single_data.diff().flat
@@ -141,6 +234,170 @@ class ConvolutionLayer(Layer):
         else:
             return 0.
 
+    def _forward_nchw(self,
+                      bottom: typing.List[Blob],
+                      top: typing.List[Blob]):
+        """Runs the forward pass in the LAYOUT_NCHW layout."""
+        single_data = self._single_data[0]
+        col_blob = self._col[0]
+        bottom_data = bottom[0].data()
+        if bottom_data.ndim == 3:
+            # only one channel
+            bottom_data = bottom_data.reshape((bottom_data.shape[0], 1) + bottom_data.shape[1:])
+        if not self._kernels.has_data():
+            self._kernels.init_data((self._num_kernels, bottom_data.shape[1], self._ksize, self._ksize),
+                                    bottom_data.dtype)
+        # the kernels are already ordered like the rows of the channel-first im2col matrix.
+        kernels = self._kernels.data().reshape(self._num_kernels, -1)
+        for i in range(bottom_data.shape[0]):
+            single_data.mirror(bottom_data[i:i+1])
+            self._pad_layer.forward(self._single_data, self._padded)
+            self._im2col_layer.forward(self._padded, self._col)
+            col_shape = col_blob.data().shape
+            if i == 0:
+                top_data = top[0].init_data((bottom_data.shape[0], self._num_kernels) + col_shape[2:],
+                                            bottom_data.dtype)
+            blasdot.dot(kernels, col_blob.data().reshape(col_shape[1], -1),
+                        out=top_data[i].reshape(self._num_kernels, -1))
+
+    def _backward_nchw(self,
+                       bottom: typing.List[Blob],
+                       top: typing.List[Blob],
+                       propagate_down: bool):
+        """Runs the backward pass in the LAYOUT_NCHW layout."""
+        single_data = self._single_data[0]
+        col_blob = self._col[0]
+        top_diff = top[0].diff()
+        bottom_data = bottom[0].data()
+        if bottom_data.ndim == 3:
+            # only one channel
+            bottom_data = bottom_data.reshape((bottom_data.shape[0], 1) + bottom_data.shape[1:])
+        kernels = self._kernels.data().reshape(self._num_kernels, -1)
+        kernel_diff = self._kernels.init_diff().reshape(self._num_kernels, -1)
+        if propagate_down:
+            bottom_diff = bottom[0].init_diff()
+        for i in range(bottom_data.shape[0]):
+            single_data.mirror(bottom_data[i:i+1])
+            self._pad_layer.forward(self._single_data, self._padded)
+            self._im2col_layer.forward(self._padded, self._col)
+            col_shape = col_blob.data().shape
+            col = col_blob.data().reshape(col_shape[1], -1)
+            image_diff = top_diff[i].reshape(self._num_kernels, -1)
+            kernel_diff += blasdot.dot(image_diff, col.T)
+            if propagate_down:
+                col_diff = col_blob.init_diff()
+                blasdot.dot(kernels.T, image_diff, out=col_diff.reshape(col_shape[1], -1))
+                self._im2col_layer.backward(self._padded, self._col, True)
+                self._pad_layer.backward(self._single_data, self._padded, True)
+                bottom_diff[i].flat = single_data.diff().flat
+        if self._reg is not None:
+            return self._reg.reg(self._kernels, bottom_data.shape[0])
+        else:
+            return 0.
+
+    def _as_4d(self,
+               array: np.ndarray):
+        """Adds the channel axis to single-channel images."""
+        if array.ndim == 4:
+            return array
+        if self._layout == LAYOUT_NCHW:
+            return array.reshape((array.shape[0], 1) + array.shape[1:])
+        return array.reshape(array.shape + (1,))
+
+    def _patches(self,
+                 images: np.ndarray):
+        """
+        Returns the patches of the images as a strided view, of shape (num, out_height, out_width, ksize, ksize,
+        channels) in the LAYOUT_NHWC layout and (num, channels, ksize, ksize, out_height, out_width) in the LAYOUT_NCHW
+        layout. It is only used when the patches do not overlap, so the view of a diff can also be written to.
+        """
+        ksize, stride = self._ksize, self._stride
+        if self._layout == LAYOUT_NCHW:
+            num, channels, height, width = images.shape
+            num_stride, channel_stride, height_stride, width_stride = images.strides
+            shape = (num, channels, ksize, ksize, (height - ksize) // stride + 1, (width - ksize) // stride + 1)
+            strides = (num_stride, channel_stride, height_stride, width_stride,
+                       stride * height_stride, stride * width_stride)
+        else:
+            num, height, width, channels = images.shape
+            num_stride, height_stride, width_stride, channel_stride = images.strides
+            shape = (num, (height - ksize) // stride + 1, (width - ksize) // stride + 1, ksize, ksize, channels)
+            strides = (num_stride, stride * height_stride, stride * width_stride,
+                       height_stride, width_stride, channel_stride)
+        return np.lib.stride_tricks.as_strided(images, shape, strides)
+
+    def _columns(self,
+                 patches: np.ndarray):
+        """
+        Returns the patches as a matrix, split after their third axis: the input itself for 1x1 kernels with stride 1,
+        and a copy in the col blob otherwise.
+        """
+        shape = (int(np.prod(patches.shape[:3])), int(np.prod(patches.shape[3:])))
+        if self._pointwise:
+            return patches.reshape(shape)
+        col = self._col[0].init_data(shape, patches.dtype)
+        col.reshape(patches.shape)[...] = patches
+        return col
+
+    def _forward_direct(self,
+                        bottom: typing.List[Blob],
+                        top: typing.List[Blob]):
+        """Runs the forward pass without im2col, when the patches do not overlap."""
+        bottom_data = self._as_4d(bottom[0].data())
+        if not self._kernels.has_data():
+            self._kernels.init_data(self.param_shapes([bottom_data.shape])[0], bottom_data.dtype)
+        patches = self._patches(bottom_data)
+        if self._layout == LAYOUT_NCHW:
+            kernels = self._kernels.data().reshape(self._num_kernels, -1)
+            top_data = top[0].init_data((bottom_data.shape[0], self._num_kernels) + patches.shape[4:],
+                                        bottom_data.dtype)
+            for i in range(bottom_data.shape[0]):
+                blasdot.dot(kernels, self._columns(patches[i]), out=top_data[i].reshape(self._num_kernels, -1))
+        else:
+            # the kernels are used as the flat (ksize * ksize * channels, num_kernels) matrix, as in forward().
+            kernels = self._kernels.data().reshape(-1, self._num_kernels)
+            top_data = top[0].init_data(patches.shape[:3] + (self._num_kernels,), bottom_data.dtype)
+            blasdot.dot(self._columns(patches), kernels, out=top_data.reshape(-1, self._num_kernels))
+
+    def _backward_direct(self,
+                         bottom: typing.List[Blob],
+                         top: typing.List[Blob],
+                         propagate_down: bool):
+        """Runs the backward pass without col2im, when the patches do not overlap."""
+        bottom_data = self._as_4d(bottom[0].data())
+        top_diff = top[0].diff()
+        patches = self._patches(bottom_data)
+        if propagate_down:
+            # the pixels that are in no patch keep a zero diff.
+            diff_patches = self._patches(self._as_4d(bottom[0].init_diff()))
+        if self._layout == LAYOUT_NCHW:
+            kernels = self._kernels.data().reshape(self._num_kernels, -1)
+            kernel_diff = self._kernels.init_diff().reshape(self._num_kernels, -1)
+            for i in range(bottom_data.shape[0]):
+                col = self._columns(patches[i])
+                image_diff = top_diff[i].reshape(self._num_kernels, -1)
+                kernel_diff += blasdot.dot(image_diff, col.T)
+                if propagate_down:
+                    col_diff = diff_patches[i].reshape(col.shape) if self._pointwise else self._col[0].init_diff()
+                    blasdot.dot(kernels.T, image_diff, out=col_diff)
+                    if not self._pointwise:
+                        diff_patches[i] = col_diff.reshape(diff_patches.shape[1:])
+        else:
+            kernels = self._kernels.data().reshape(-1, self._num_kernels)
+            kernel_diff = self._kernels.init_diff().reshape(-1, self._num_kernels)
+            col = self._columns(patches)
+            top_diff = top_diff.reshape(-1, self._num_kernels)
+            blasdot.dot(col.T, top_diff, out=kernel_diff)
+            if propagate_down:
+                col_diff = diff_patches.reshape(col.shape) if self._pointwise else self._col[0].init_diff()
+                blasdot.dot(top_diff, kernels.T, out=col_diff)
+                if not self._pointwise:
+                    diff_patches[...] = col_diff.reshape(diff_patches.shape)
+        if self._reg is not None:
+            return self._reg.reg(self._kernels, bottom_data.shape[0])
+        else:
+            return 0.
+
     def update(self):
         """Updates the parameters."""
         # Only the inner product layer needs to be updated.
@@ -6,3 +6,4 @@ from decaf.layers.ndarraydatalayer import NdArrayDataLayer
 # Computation Layers
 from decaf.layers.innerproduct import InnerProductLayer
 from decaf.layers.loss import SquaredLossLayer, MultinomialLogisticLossLayer
+from decaf.layers.sampled_softmax import SampledSoftmaxLossLayer
@@ -1,5 +1,6 @@
 #include <cstring>
 #include <cmath>
+#include <cstdint>
 
 template <typename Dtype>
 inline void im2col(const Dtype* data_im,
@@ -65,6 +66,70 @@ inline void col2im(Dtype* data_im,
     }
 } // col2im
 
+// The channel-first variants: the image is stored as [nchannels, height, width], and the columns as
+// [nchannels * psize * psize, height_col, width_col], so that the convolution is the product of the
+// [nkernels, nchannels * psize * psize] kernels with the columns.
+template <typename Dtype>
+inline void im2col_nchw(const Dtype* data_im,
+                        const int height,
+                        const int width,
+                        const int nchannels,
+                        const int psize,
+                        const int stride,
+                        Dtype* data_col) {
+    int height_col = (height - psize) / stride + 1;
+    int width_col = (width - psize) / stride + 1;
+    int nrows = nchannels * psize * psize;
+#pragma omp parallel for
+    for (int row = 0; row < nrows; ++row) {
+        // the row holds image[c, offh::stride, offw::stride]
+        int offw = row % psize;
+        int offh = (row / psize) % psize;
+        int c = row / psize / psize;
+        Dtype* pointer_col = data_col + row * height_col * width_col;
+        for (int idxh = 0; idxh < height_col; ++idxh) {
+            const Dtype* pointer_im = data_im + (c * height + idxh * stride + offh) * width + offw;
+            if (stride == 1) {
+                memcpy(pointer_col, pointer_im, sizeof(Dtype) * width_col);
+            } else {
+                for (int idxw = 0; idxw < width_col; ++idxw) {
+                    pointer_col[idxw] = pointer_im[idxw * stride];
+                }
+            }
+            pointer_col += width_col;
+        }
+    }
+} // im2col_nchw
+
+template <typename Dtype>
+inline void col2im_nchw(Dtype* data_im,
+                        const int height,
+                        const int width,
+                        const int nchannels,
+                        const int psize,
+                        const int stride,
+                        const Dtype* data_col) {
+    memset(data_im, 0, sizeof(Dtype) * height * width * nchannels);
+    int height_col = (height - psize) / stride + 1;
+    int width_col = (width - psize) / stride + 1;
+    // the channels are independent, so every thread adds to its own channels.
+#pragma omp parallel for
+    for (int c = 0; c < nchannels; ++c) {
+        for (int offh = 0; offh < psize; ++offh) {
+            for (int offw = 0; offw < psize; ++offw) {
+                const Dtype* pointer_col = data_col + ((c * psize + offh) * psize + offw) * height_col * width_col;
+                for (int idxh = 0; idxh < height_col; ++idxh) {
+                    Dtype* pointer_im = data_im + (c * height + idxh * stride + offh) * width + offw;
+                    for (int idxw = 0; idxw < width_col; ++idxw) {
+                        pointer_im[idxw * stride] += pointer_col[idxw];
+                    }
+                    pointer_col += width_col;
+                }
+            }
+        }
+    }
+} // col2im_nchw
+
 
 extern "C" {
 
@@ -108,5 +173,73 @@ void col2im_double(double* data_im,
     col2im<double>(data_im, height, width, nchannels, psize, stride, data_col);
 }
 
+void im2col_nchw_float(const float* data_im,
+                       const int height,
+                       const int width,
+                       const int nchannels,
+                       const int psize,
+                       const int stride,
+                       float* data_col) {
+    im2col_nchw<float>(data_im, height, width, nchannels, psize, stride, data_col);
+}
+
+void im2col_nchw_double(const double* data_im,
+                        const int height,
+                        const int width,
+                        const int nchannels,
+                        const int psize,
+                        const int stride,
+                        double* data_col) {
+    im2col_nchw<double>(data_im, height, width, nchannels, psize, stride, data_col);
+}
+
+void col2im_nchw_float(float* data_im,
+                       const int height,
+                       const int width,
+                       const int nchannels,
+                       const int psize,
+                       const int stride,
+                       const float* data_col) {
+    col2im_nchw<float>(data_im, height, width, nchannels, psize, stride, data_col);
+}
+
+void col2im_nchw_double(double* data_im,
+                        const int height,
+                        const int width,
+                        const int nchannels,
+                        const int psize,
+                        const int stride,
+                        const double* data_col) {
+    col2im_nchw<double>(data_im, height, width, nchannels, psize, stride, data_col);
+}
+
+// int8 matrix product with int32 accumulation: c (m, n) = a (m, k) . b (k, n). Every row of b is read once per
+// block of 4 rows of a, so for the few rows of an inference request, the time goes to streaming the int8 weight.
+void int8_gemm(const int8_t* a,
+               const int8_t* b,
+               const int m,
+               const int k,
+               const int n,
+               int32_t* c) {
+    const int block = 4;
+    memset(c, 0, sizeof(int32_t) * m * n);
+    for (int row_start = 0; row_start < m; row_start += block) {
+        const int row_end = row_start + block < m ? row_start + block : m;
+        for (int idxk = 0; idxk < k; ++idxk) {
+            const int8_t* pointer_b = b + (long)idxk * n;
+            for (int idxm = row_start; idxm < row_end; ++idxm) {
+                const int32_t value = a[(long)idxm * k + idxk];
+                if (value == 0) {
+                    continue;
+                }
+                int32_t* pointer_c = c + (long)idxm * n;
+                for (int idxn = 0; idxn < n; ++idxn) {
+                    pointer_c[idxn] += value * pointer_b[idxn];
+                }
+            }
+        }
+    }
+}
+
 } // extern "C"
 
@@ -38,7 +38,7 @@ def im2col(*args):
     if args[0].dtype == np.float32:
         return _cpp_util.im2col_float(*args)
     elif args[0].dtype == np.float64:
-        return _cpp_util.im2col_float(*args)
+        return _cpp_util.im2col_double(*args)
     else:
         raise TypeError('Unsupported type: {}'.format(args[0].dtype))
 
@@ -70,6 +70,85 @@ def col2im(*args):
     if args[0].dtype == np.float32:
         return _cpp_util.col2im_float(*args)
     elif args[0].dtype == np.float64:
-        return _cpp_util.col2im_float(*args)
+        return _cpp_util.col2im_double(*args)
     else:
         raise TypeError('Unsupported type: {}'.format(args[0].dtype))
+
+
+###############################################################################
+# channel-first (NCHW) im2col and col2im operations
+################################################################################
+_cpp_util.im2col_nchw_float.restype = None
+_cpp_util.im2col_nchw_float.argtypes = [np.ctypeslib.ndpointer(dtype=np.float32, flags='C'),
+                                        ct.c_int,
+                                        ct.c_int,
+                                        ct.c_int,
+                                        ct.c_int,
+                                        ct.c_int,
+                                        np.ctypeslib.ndpointer(dtype=np.float32, flags='C')]
+
+_cpp_util.im2col_nchw_double.restype = None
+_cpp_util.im2col_nchw_double.argtypes = [np.ctypeslib.ndpointer(dtype=np.float64, flags='C'),
+                                         ct.c_int,
+                                         ct.c_int,
+                                         ct.c_int,
+                                         ct.c_int,
+                                         ct.c_int,
+                                         np.ctypeslib.ndpointer(dtype=np.float64, flags='C')]
+
+_cpp_util.col2im_nchw_float.restype = None
+_cpp_util.col2im_nchw_float.argtypes = [np.ctypeslib.ndpointer(dtype=np.float32, flags='C'),
+                                        ct.c_int,
+                                        ct.c_int,
+                                        ct.c_int,
+                                        ct.c_int,
+                                        ct.c_int,
+                                        np.ctypeslib.ndpointer(dtype=np.float32, flags='C')]
+
+_cpp_util.col2im_nchw_double.restype = None
+_cpp_util.col2im_nchw_double.argtypes = [np.ctypeslib.ndpointer(dtype=np.float64, flags='C'),
+                                         ct.c_int,
+                                         ct.c_int,
+                                         ct.c_int,
+                                         ct.c_int,
+                                         ct.c_int,
+                                         np.ctypeslib.ndpointer(dtype=np.float64, flags='C')]
+
+
+def im2col_nchw(*args):
+    """A wrapper of the channel-first im2col function."""
+    if args[0].dtype == np.float32:
+        return _cpp_util.im2col_nchw_float(*args)
+    elif args[0].dtype == np.float64:
+        return _cpp_util.im2col_nchw_double(*args)
+    else:
+        raise TypeError('Unsupported type: {}'.format(args[0].dtype))
+
+
+def col2im_nchw(*args):
+    """A wrapper of the channel-first col2im function."""
+    if args[0].dtype == np.float32:
+        return _cpp_util.col2im_nchw_float(*args)
+    elif args[0].dtype == np.float64:
+        return _cpp_util.col2im_nchw_double(*args)
+    else:
+        raise TypeError('Unsupported type: {}'.format(args[0].dtype))
+
+
+###############################################################################
+# int8 matrix product
+################################################################################
+_cpp_util.int8_gemm.restype = None
+_cpp_util.int8_gemm.argtypes = [np.ctypeslib.ndpointer(dtype=np.int8, flags='C'),
+                                np.ctypeslib.ndpointer(dtype=np.int8, flags='C'),
+                                ct.c_int,
+                                ct.c_int,
+                                ct.c_int,
+                                np.ctypeslib.ndpointer(dtype=np.int32, flags='C')]
+
+
+def int8_gemm(a, b, out):
+    """Computes out = a . b for two int8 matrices, with int32 accumulation into the int32 matrix out."""
+    if a.shape[1] != b.shape[0] or out.shape != (a.shape[0], b.shape[1]):
+        raise ValueError('Matrices are not aligned')
+    return _cpp_util.int8_gemm(a, b, a.shape[0], a.shape[1], b.shape[1], out)
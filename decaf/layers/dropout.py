@@ -2,7 +2,7 @@
 import numpy as np
 import typing
 
-from decaf.base import Layer, Blob
+from decaf.base import Layer, Blob, PHASE_TEST
 from decaf.layers import fillers
 
 
@@ -15,12 +15,34 @@ class DropoutLayer(Layer):
 
         kwargs:
             name: the layer name.
-            ratio: the ratio to carry out dropout.
+            ratio: the ratio of the values that are kept.
+
+        In the train phase, the kept values are scaled by 1 / ratio (inverted dropout), so that the expected output
+        equals the input. In the test phase, the layer simply mirrors its input. The mask is kept bit-packed, i.e. one
+        bit per element.
         """
         Layer.__init__(self, **kwargs)
         self._ratio = self.spec['ratio']
-        filler = fillers.DropoutFiller(ratio=self._ratio)
-        self._mask = Blob(filler=filler)
+        self._mask: typing.Optional[np.ndarray] = None
+        # whether the test phase mirrored the input into the top data, and the top diff into the bottom diff.
+        self._mirrored_data: bool = False
+        self._mirrored_diff: bool = False
+
+    def _unpacked_mask(self,
+                       shape: tuple):
+        return np.unpackbits(self._mask, count=int(np.prod(shape))).reshape(shape)
+
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        return [input_shapes[0]]
+
+    def scratch_bytes(self,
+                      input_shapes: typing.List[tuple],
+                      itemsize: int):
+        """The bit-packed mask, which is only drawn in the train phase."""
+        if self._phase == PHASE_TEST:
+            return 0
+        return (int(np.prod(input_shapes[0])) + 7) // 8
 
     def forward(self,
                 bottom: typing.List[Blob],
@@ -28,10 +50,19 @@ class DropoutLayer(Layer):
         """Computes the forward pass."""
         # Get features and ouput
         features = bottom[0].data()
+        if self._phase == PHASE_TEST:
+            top[0].mirror(features)
+            self._mirrored_data = True
+            return
+        if self._mirrored_data:
+            # the top still views the input, which init_data() would clear.
+            top[0].detach_data()
+            top[0].detach_diff()
+            self._mirrored_data = False
         output = top[0].init_data(features.shape, features.dtype)
-        self._mask.init_data(features.shape, np.bool)
-        output[:] = features
-        output *= self._mask.data()
+        self._mask = fillers.random_bits(self._ratio, features.size)
+        np.multiply(features, self._unpacked_mask(features.shape), out=output)
+        output *= 1. / self._ratio
 
     def backward(self,
                  bottom: typing.List[Blob],
@@ -40,10 +71,17 @@ class DropoutLayer(Layer):
         """Computes the backward pass."""
         if not propagate_down:
             return 0.
+        if self._phase == PHASE_TEST:
+            bottom[0].mirror_diff(top[0].diff())
+            self._mirrored_diff = True
+            return 0.
+        if self._mirrored_diff:
+            bottom[0].detach_diff()
+            self._mirrored_diff = False
         top_diff = top[0].diff()
         bottom_diff = bottom[0].init_diff()
-        bottom_diff[:] = top_diff
-        bottom_diff *= self._mask.data()
+        np.multiply(top_diff, self._unpacked_mask(bottom_diff.shape), out=bottom_diff)
+        bottom_diff *= 1. / self._ratio
         return 0.
 
     def update(self):
@@ -53,6 +53,22 @@ class GaussianRandFiller(Filler):
         mat += mean
 
 
+def random_bits(ratio: float,
+                count: int):
+    """
+    Generates count random binaries that are 1 with probability ratio, packed 8 per byte as by np.packbits.
+
+    The binaries are generated from raw random bytes instead of float samples: with ratio 0.5 the random bytes are the
+    packed binaries already, and otherwise each binary compares a random 16-bit integer against ratio * 2^16, so the
+    ratio is honored up to a resolution of 2^-16.
+    """
+    num_bytes = (count + 7) // 8
+    if ratio == 0.5:
+        return np.frombuffer(np.random.bytes(num_bytes), dtype=np.uint8)
+    threshold = int(round(ratio * 65536))
+    return np.packbits(np.frombuffer(np.random.bytes(count * 2), dtype=np.uint16) < threshold)
+
+
 class DropoutFiller(Filler):
     """
     Fill the values with boolean.
@@ -63,5 +79,4 @@ class DropoutFiller(Filler):
 
     def fill(self,
              mat: np.ndarray):
-        ratio = self.spec['ratio']
-        mat[:] = np.random.random_sample(mat.shape) < ratio
+        mat[:] = np.unpackbits(random_bits(self.spec['ratio'], mat.size), count=mat.size).reshape(mat.shape)
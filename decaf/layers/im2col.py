@@ -1,7 +1,7 @@
 """Implements the im2col layer."""
 import typing
 
-from decaf.base import Layer, Blob
+from decaf.base import Layer, Blob, LAYOUT_NHWC, LAYOUT_NCHW
 from decaf.layers.cpp import wrapper
 
 import numpy as np
@@ -18,40 +18,62 @@ class Im2colLayer(Layer):
             name: the name of the layer.
             psize: the patch size (patch will be a square).
             stride: the patch stride.
+            layout: the layout of the images, LAYOUT_NHWC or LAYOUT_NCHW. Default LAYOUT_NHWC.
 
         If the input image has shape [height, width, nchannels], the output will have shape [(height-psize)/stride+1,
-        (width-psize)/stride+1, nchannels*psize*psize].
+        (width-psize)/stride+1, nchannels*psize*psize]. In the LAYOUT_NCHW layout, an input image of shape [nchannels,
+        height, width] gives an output of shape [nchannels*psize*psize, (height-psize)/stride+1,
+        (width-psize)/stride+1], whose rows are ordered by channel, then patch row, then patch column.
         """
         Layer.__init__(self, **kwargs)
         self._psize: int = self.spec['psize']
         self._stride: int = self.spec['stride']
-        if self._psize <= 1:
-            raise ValueError('Padding should be larger than 1.')
+        self._layout: str = self.spec.get('layout', LAYOUT_NHWC)
+        if self._layout not in (LAYOUT_NHWC, LAYOUT_NCHW):
+            raise ValueError('Unknown layout: {}'.format(self._layout))
+        if self._psize < 1:
+            raise ValueError('Patch size should be larger than 0.')
         if self._stride < 1:
             raise ValueError('Stride should be larger than 0.')
 
     def _analyze_shape(self,
-                       features: np.ndarray):
-        num, height, width = features.shape[:3]
+                       shape: tuple):
+        if self._layout == LAYOUT_NCHW:
+            if len(shape) == 3:
+                num, height, width = shape
+                channels = 1
+            else:
+                num, channels, height, width = shape
+            new_shape = (num,
+                         channels * self._psize * self._psize,
+                         (height - self._psize) // self._stride + 1,
+                         (width - self._psize) // self._stride + 1)
+            return num, height, width, channels, new_shape
+        num, height, width = shape[:3]
         channels = 1
-        if features.ndim == 4:
-            channels = features.shape[3]
+        if len(shape) == 4:
+            channels = shape[3]
         new_shape = (num,
-                     (height - self._psize) / self._stride + 1,
-                     (width - self._psize) / self._stride + 1,
+                     (height - self._psize) // self._stride + 1,
+                     (width - self._psize) // self._stride + 1,
                      channels * self._psize * self._psize)
         return num, height, width, channels, new_shape
 
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        return [self._analyze_shape(input_shapes[0])[-1]]
+
     def forward(self,
                 bottom: typing.List[Blob],
                 top: typing.List[Blob]):
         """Computes the forward pass"""
         # Get features and output
         features = bottom[0].data()
-        num, height, width, channels, new_shape = self._analyze_shape(features)
+        num, height, width, channels, new_shape = self._analyze_shape(features.shape)
         output = top[0].init_data(new_shape, features.dtype)
+        im2col = wrapper.im2col_nchw if self._layout == LAYOUT_NCHW else wrapper.im2col
         for i in range(num):
-            wrapper.im2col(features[i], height, width, channels, self._psize, self._stride, output[i])
+            im2col(features[i], height, width, channels, self._psize, self._stride, output[i])
 
     def backward(self,
                  bottom: typing.List[Blob],
@@ -62,10 +84,11 @@ class Im2colLayer(Layer):
             return 0.
         top_diff = top[0].diff()
         features = bottom[0].data()
-        num, height, width, channels, new_shape = self._analyze_shape(features)
+        num, height, width, channels, new_shape = self._analyze_shape(features.shape)
         bottom_diff = bottom[0].init_diff()
+        col2im = wrapper.col2im_nchw if self._layout == LAYOUT_NCHW else wrapper.col2im
         for i in range(num):
-            wrapper.col2im(bottom_diff[i], height, width, channels, self._psize, self._stride, top_diff[i])
+            col2im(bottom_diff[i], height, width, channels, self._psize, self._stride, top_diff[i])
         return 0.
 
     def update(self):
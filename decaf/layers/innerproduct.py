@@ -1,5 +1,6 @@
 import typing
 
+from decaf import net
 from decaf.base import Layer, Blob
 from decaf.base import InvalidLayerError
 from decaf.util import blasdot
@@ -11,19 +12,76 @@ class InnerProductLayer(Layer):
         """
         Initializes an inner product layer. You need to specify the kwarg 'num_output' as the number of output nodes.
         Optionally, pass in a regularizer with keyword 'reg' will add regularization terms to the weight (but not bias).
+
+        The input may be a scipy.sparse CSR matrix (any input that is not an ndarray is treated as one), in which case
+        the products with the input cost time proportional to its number of nonzeros. The gradient w.r.t. a sparse
+        input is not computed.
+
+        For inference with sparse weights (e.g. after L1 regularization), call compact() to store a sparse copy of the
+        weight that the forward pass then uses.
+
+        The layer implements the R operator, see decaf.base.Layer.forward_r().
         """
         Layer.__init__(self, **kwargs)
         self._num_output = self.spec.get('num_output', 0)
         if self._num_output <= 0:
             raise InvalidLayerError('Incorrect ou unspecified num_output for {}'.format(self.name))
         self._weight = Blob()
+        self._weight_r = Blob()
         self._reg = self.spec.get('reg', None)
         self._has_bias = self.spec.get('bias', True)
         if self._has_bias:
             self._bias = Blob()
+            self._bias_r = Blob()
             self._param = [self._weight, self._bias]
+            self._r_param = [self._weight_r, self._bias_r]
         else:
             self._param = [self._weight]
+            self._r_param = [self._weight_r]
+        # the compressed sparse column copy of the weight, and the version of the weight blob it was built from, see
+        # compact().
+        self._sparse_weight = None
+        self._sparse_version: int = -1
+
+    def compact(self,
+                threshold: float = 0.,
+                max_density: float = 0.3,
+                inference_only: bool = False):
+        """
+        Sets the weights whose magnitude is not larger than threshold to zero, and if the fraction of nonzero weights
+        is then below max_density, keeps a scipy.sparse CSC copy of the weight for the forward pass, which then costs
+        time proportional to the number of nonzero weights.
+
+        The copy is used as long as the weight blob reports no change (see decaf.base.Blob.version()): it is dropped
+        when the layer is updated, when parameters are loaded, or when a solver sets the parameters, and the forward
+        pass then uses the dense weight again. Code that writes the weight in place should call mark_changed() on its
+        blob.
+
+        If inference_only is True and the sparse copy is kept, the dense weight is freed. The layer can then only run
+        forward, until new weights are loaded into it.
+
+        Output:
+            density: the fraction of nonzero weights.
+        """
+        from scipy import sparse
+        weight = self._dense_weight()
+        weight[np.abs(weight) <= threshold] = 0.
+        self._weight.mark_changed()
+        density = np.count_nonzero(weight) / float(weight.size)
+        if density < max_density:
+            self._sparse_weight = sparse.csc_matrix(weight)
+            if inference_only:
+                self._weight.release_data()
+            self._sparse_version = self._weight.version()
+        else:
+            self._sparse_weight = None
+        return density
+
+    def _dense_weight(self):
+        """Returns the dense weight, or raises an error if compact() freed it."""
+        if not self._weight.has_data():
+            raise InvalidLayerError('{} only keeps a sparse weight for inference.'.format(self.name))
+        return self._weight.data()
 
     def forward(self,
                 bottom: typing.List[Blob],
@@ -31,17 +89,28 @@ class InnerProductLayer(Layer):
         """Computes the forward pass"""
         features = bottom[0].data()
         if features.ndim > 2:
-            features.shape = (features.shape[0], np.prod(features.shape[1:]))
-            
+            features = features.reshape(features.shape[0], -1)
+
         output = top[0].init_data((features.shape[0], self._num_output), features.dtype)
+        if self._sparse_weight is not None and self._weight.version() != self._sparse_version:
+            # the weight changed since compact().
+            self._sparse_weight = None
         # initialize weights and bias
-        if not self._weight.has_data():
+        if not self._weight.has_data() and self._sparse_weight is None:
             self._weight.init_data((features.shape[1], self._num_output), features.dtype)
         if self._has_bias and not self._bias.has_data():
             self._bias.init_data(self._num_output, features.dtype)
         # computation
-        weight = self._weight.data()
-        blasdot.dot(features, weight, out=output)
+        if self._sparse_weight is not None:
+            if isinstance(features, np.ndarray):
+                # the transpose of the CSC weight is a CSR matrix, which multiplies dense matrices efficiently.
+                output[:] = self._sparse_weight.T.dot(features.T).T
+            else:
+                output[:] = features.dot(self._sparse_weight).toarray()
+        elif not isinstance(features, np.ndarray):
+            output[:] = features.dot(self._weight.data())
+        else:
+            blasdot.dot(features, self._weight.data(), out=output)
         if self._has_bias:
             output += self._bias.data()
         return 0.
@@ -51,30 +120,126 @@ class InnerProductLayer(Layer):
                  top: typing.List[Blob],
                  propagate_down: bool):
         """Computes the backward pass."""
+        weight = self._dense_weight()
         top_diff = top[0].diff()
         features = bottom[0].data()
         if features.ndim > 2:
-            features.shape = (features.shape[0], np.prod(features.shape[1:]))
+            features = features.reshape(features.shape[0], -1)
 
         # compute the gradient
         weight_diff = self._weight.init_diff()
-        blasdot.dot(features.T, top_diff, out=weight_diff)
+        if not isinstance(features, np.ndarray):
+            weight_diff[:] = features.T.dot(top_diff)
+        else:
+            blasdot.dot(features.T, top_diff, out=weight_diff)
         if self._has_bias:
             bias_diff = self._bias.init_diff()
             bias_diff[:] = top_diff.sum(0)
         # if necessary, compute the bottom Blob gradient
         if propagate_down:
+            if not isinstance(features, np.ndarray):
+                raise InvalidLayerError('{} can not propagate the gradient to a sparse input.'.format(self.name))
             bottom_diff = bottom[0].init_diff()
             if bottom_diff.ndim > 2:
-                bottom_diff.shape = (bottom_diff.shape[0], np.prod(bottom_diff.shape[1:]))
-            blasdot.dot(top_diff, self._weight.data().T, out=bottom_diff)
+                bottom_diff = bottom_diff.reshape(bottom_diff.shape[0], -1)
+            blasdot.dot(top_diff, weight.T, out=bottom_diff)
         if self._reg is not None:
             return self._reg.reg(self._weight, features.shape[0])
         else:
             return 0.
 
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        return [(input_shapes[0][0], self._num_output)]
+
+    def param_shapes(self,
+                     input_shapes: typing.List[tuple]):
+        weight_shape = (int(np.prod(input_shapes[0][1:])), self._num_output)
+        if self._has_bias:
+            return [weight_shape, (self._num_output,)]
+        return [weight_shape]
+
+    def forward_r(self,
+                  bottom: typing.List[Blob],
+                  top: typing.List[Blob],
+                  bottom_r: typing.List[Blob],
+                  top_r: typing.List[Blob]):
+        """
+        Computes the R operator of the forward pass: R{output} = R{features} . weight + features . R{weight} + R{bias}.
+        """
+        features = bottom[0].data()
+        if features.ndim > 2:
+            features = features.reshape(features.shape[0], -1)
+        weight = self._dense_weight()
+        for param, r_param in zip(self._param, self._r_param):
+            if not r_param.has_data():
+                r_param.init_data(param.data().shape, param.data().dtype)
+        output_r = top_r[0].init_data((features.shape[0], self._num_output), weight.dtype)
+        if not isinstance(features, np.ndarray):
+            output_r[:] = features.dot(self._weight_r.data())
+        else:
+            blasdot.dot(features, self._weight_r.data(), out=output_r)
+        if bottom_r[0].has_data():
+            features_r = bottom_r[0].data()
+            output_r += blasdot.dot(features_r.reshape(features_r.shape[0], -1), weight)
+        if self._has_bias:
+            output_r += self._bias_r.data()
+
+    def backward_r(self,
+                   bottom: typing.List[Blob],
+                   top: typing.List[Blob],
+                   bottom_r: typing.List[Blob],
+                   top_r: typing.List[Blob],
+                   propagate_down: bool,
+                   gauss_newton: bool):
+        """Computes the R operator of the backward pass."""
+        weight = self._dense_weight()
+        top_diff_r = top_r[0].diff()
+        features = bottom[0].data()
+        if features.ndim > 2:
+            features = features.reshape(features.shape[0], -1)
+        features_r = None
+        if bottom_r[0].has_data():
+            features_r = bottom_r[0].data()
+            features_r = features_r.reshape(features_r.shape[0], -1)
+        weight_diff_r = self._weight_r.init_diff()
+        if not isinstance(features, np.ndarray):
+            weight_diff_r[:] = features.T.dot(top_diff_r)
+        else:
+            blasdot.dot(features.T, top_diff_r, out=weight_diff_r)
+        if not gauss_newton and features_r is not None:
+            weight_diff_r += blasdot.dot(features_r.T, top[0].diff())
+        if self._has_bias:
+            bias_diff_r = self._bias_r.init_diff()
+            bias_diff_r[:] = top_diff_r.sum(0)
+        if propagate_down:
+            bottom_diff_r = bottom_r[0].init_diff()
+            if bottom_diff_r.ndim > 2:
+                bottom_diff_r = bottom_diff_r.reshape(bottom_diff_r.shape[0], -1)
+            blasdot.dot(top_diff_r, weight.T, out=bottom_diff_r)
+            if not gauss_newton:
+                bottom_diff_r += blasdot.dot(top[0].diff(), self._weight_r.data().T)
+        if self._reg is not None:
+            self._reg.reg_r(self._weight, self._weight_r, features.shape[0])
+
     def update(self):
         """Updates the parameters"""
+        self._dense_weight()
+        self._sparse_weight = None
         self._weight.update()
         if self._has_bias:
             self._bias.update()
+
+
+def compact_net(decaf_net: net.Net,
+                threshold: float = 0.,
+                max_density: float = 0.3,
+                inference_only: bool = False):
+    """
+    Calls compact() on every InnerProductLayer of the net. See InnerProductLayer.compact().
+
+    Output:
+        densities: a dictionary mapping the names of the inner product layers to the fraction of nonzero weights.
+    """
+    return {name: layer.compact(threshold, max_density, inference_only) for name, layer in decaf_net.layers().items()
+            if isinstance(layer, InnerProductLayer)}
@@ -1,7 +1,6 @@
 import typing
 
 from decaf.base import LossLayer, Blob
-from decaf.util import logexp
 import numpy as np
 
 
@@ -17,8 +16,67 @@ class SquaredLossLayer(LossLayer):
         diff = bottom[0].init_diff()
         diff[:] = bottom[0].data()
         diff -= bottom[1].data()
-        diff *= 2
         self._loss = np.dot(diff.flat, diff.flat)
+        diff *= 2
+
+    def forward_r(self,
+                  bottom: typing.List[Blob],
+                  top: typing.List[Blob],
+                  bottom_r: typing.List[Blob],
+                  top_r: typing.List[Blob]):
+        """
+        Computes the R operator of the gradient, which is twice the direction of the prediction.
+        """
+        diff_r = bottom_r[0].init_diff()
+        diff_r[:] = bottom_r[0].data()
+        diff_r *= 2
+
+
+def softmax_loss(pred: np.ndarray,
+                 label: np.ndarray,
+                 diff: np.ndarray,
+                 memory: float = 1e6):
+    """
+    Computes the multinomial logistic loss of the scores and writes its gradient w.r.t. the scores into diff.
+
+    The rows are processed in chunks of about `memory` bytes. For each chunk, diff serves as the workspace for the
+    softmax and the log-sum-exp is kept per row, so apart from diff itself only per-row temporaries are allocated and
+    the log of the probabilities is never formed.
+
+    Input:
+        pred: the (num, dim) scores before softmax normalization.
+        label: the labels, either as a length num vector of class indices, or as a (num, dim) matrix.
+        diff: the (num, dim) output gradient. It can not be the same array as pred.
+        memory: (optional) the approximate size in bytes of a chunk. Default 1e6.
+    Output:
+        loss: the loss value summed over the rows.
+    """
+    num, dim = pred.shape
+    chunk = max(1, int(memory // (dim * pred.itemsize)))
+    loss = 0.
+    for start in range(0, num, chunk):
+        stop = min(start + chunk, num)
+        pred_chunk = pred[start:stop]
+        diff_chunk = diff[start:stop]
+        label_chunk = label[start:stop]
+        row_max = pred_chunk.max(axis=1)[:, np.newaxis]
+        np.subtract(pred_chunk, row_max, out=diff_chunk)
+        np.exp(diff_chunk, out=diff_chunk)
+        row_sum = diff_chunk.sum(axis=1)[:, np.newaxis]
+        diff_chunk /= row_sum
+        # log_norm is the log-sum-exp of each row, so that log(prob) = pred - log_norm.
+        log_norm = np.log(row_sum[:, 0])
+        log_norm += row_max[:, 0]
+        if label.ndim == 1:
+            # The labels are given as a sparse vector.
+            rows = np.arange(stop - start)
+            loss += log_norm.sum() - pred_chunk[rows, label_chunk].sum()
+            diff_chunk[rows, label_chunk] -= 1.
+        else:
+            # The labels are given as a dense matrix.
+            loss += np.dot(log_norm, label_chunk.sum(axis=1)) - np.einsum('ij,ij->', pred_chunk, label_chunk)
+            diff_chunk -= label_chunk
+    return loss
 
 
 class MultinomialLogisticLossLayer(LossLayer):
@@ -31,29 +89,41 @@ class MultinomialLogisticLossLayer(LossLayer):
     """
 
     def __init__(self, **kwargs):
+        """
+        Initializes the loss layer.
+
+        kwargs:
+            name: the name of the layer.
+            memory: (optional) the approximate size in bytes of the row chunks the scores are processed in. See
+                softmax_loss(). Default 1e6.
+        """
         LossLayer.__init__(self, **kwargs)
-        self._prob: Blob = Blob()
+        self._memory: float = self.spec.get('memory', 1e6)
 
     def forward(self,
                 bottom: typing.List[Blob],
                 top: typing.List[Blob]):
-        pred = bottom[0].data()
-        prob = self._prob.init_data(pred.shape, pred.dtype)
-        prob[:] = pred
-        prob -= prob.max(axis=1)[:, np.newaxis]
-        logexp.exp(prob, out=prob)
-        prob /= prob.sum(axis=1)[:, np.newaxis]
-
         diff = bottom[0].init_diff()
-        diff[:] = prob
-        logexp.log(prob, out=prob)
+        self._loss = softmax_loss(bottom[0].data(), bottom[1].data(), diff, self._memory)
 
+    def forward_r(self,
+                  bottom: typing.List[Blob],
+                  top: typing.List[Blob],
+                  bottom_r: typing.List[Blob],
+                  top_r: typing.List[Blob]):
+        """
+        Computes the R operator of the gradient: for every row with softmax probabilities p and direction v, it is
+        p * v - p * (p . v), scaled by the sum of the row's labels when they are given as a matrix.
+        """
+        pred = bottom[0].data()
+        diff_r = bottom_r[0].init_diff()
+        # the softmax probabilities, computed in the diff of bottom_r.
+        np.subtract(pred, pred.max(axis=1)[:, np.newaxis], out=diff_r)
+        np.exp(diff_r, out=diff_r)
+        diff_r /= diff_r.sum(axis=1)[:, np.newaxis]
+        pred_r = bottom_r[0].data()
+        projection = np.einsum('ij,ij->i', diff_r, pred_r)[:, np.newaxis]
+        diff_r *= pred_r - projection
         label = bottom[1].data()
-        if label.ndim == 1:
-            # The labels are given as a sparse vector.
-            diff[np.arange(diff.shape[0]), label] -= 1.
-            self._loss = -prob[np.arange(diff.shape[0]), label].sum()
-        else:
-            # The labels are given as a dense matrix.
-            diff -= label
-            self._loss = -np.dot(prob.flat, label.flat)
+        if label.ndim == 2:
+            diff_r *= label.sum(axis=1)[:, np.newaxis]
@@ -14,10 +14,13 @@ class NdArrayDataLayer(DataLayer):
         Initialize the data layer. The input matrices will be provided by keyword 'sources' as a list of NdArrays, like
             sources = [array_1, array_2]
 
-        The number of arrays should be identical to the number of output blobs.
+        The number of arrays should be identical to the number of output blobs. The arrays may also be scipy.sparse
+        matrices, which are emitted in CSR format.
         """
         DataLayer.__init__(self, **kwargs)
-        self._sources: typing.List[np.ndarray] = self.spec['sources']
+        self._sources: typing.List[np.ndarray] = []
+        self._range: typing.Optional[slice] = None
+        self.set_sources(self.spec['sources'])
 
     def forward(self,
                 bottom: typing.List[Blob],
@@ -28,4 +31,46 @@ class NdArrayDataLayer(DataLayer):
         if len(top) != len(self._sources):
             raise ValueError('The number of sources and output blobs should be the same')
         for top_blob, sources in zip(top, self._sources):
-            top_blob.mirror(sources)
+            top_blob.mirror(sources if self._range is None else sources[self._range])
+
+    def set_sources(self,
+                    sources: typing.List[np.ndarray]):
+        """
+        Replaces the arrays that the layer emits, e.g. to feed a new batch of data to an already constructed net.
+        """
+        # scipy.sparse matrices are recognized by their tocsr() method, so that scipy is not imported for dense data.
+        self._sources = [source if isinstance(source, np.ndarray) or not hasattr(source, 'tocsr') else source.tocsr()
+                         for source in sources]
+
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        """
+        Returns the shapes of the sources, restricted to the current range.
+        """
+        if self._range is None:
+            return [source.shape for source in self._sources]
+        num = len(range(*self._range.indices(self.num_data())))
+        return [(num,) + source.shape[1:] for source in self._sources]
+
+    def output_dtypes(self):
+        """
+        Returns the dtypes of the sources.
+        """
+        return [source.dtype for source in self._sources]
+
+    def num_data(self):
+        """
+        Returns the number of data points, i.e. the length of the first dimension of the sources.
+        """
+        return self._sources[0].shape[0]
+
+    def set_range(self,
+                  start: typing.Optional[int] = None,
+                  stop: typing.Optional[int] = None):
+        """
+        Emits only the data points in [start, stop) from now on. See decaf.base.DataLayer.set_range().
+        """
+        if start is None and stop is None:
+            self._range = None
+        else:
+            self._range = slice(start, stop)
@@ -1,7 +1,7 @@
 """Implements the padding layer."""
 import typing
 
-from decaf.base import Layer, Blob
+from decaf.base import Layer, Blob, LAYOUT_NHWC, LAYOUT_NCHW
 
 
 class PaddingLayer(Layer):
@@ -14,12 +14,24 @@ class PaddingLayer(Layer):
             'pad': the number of pixels to pad, Should be non-negative. If pad is 0, the layer will simply mirror the
             input.
             'value': the value inserted to the padded area. Default 0.
+            'layout': the layout of the images, LAYOUT_NHWC (num, height, width[, channels]) or LAYOUT_NCHW (num,
+            channels, height, width). Default LAYOUT_NHWC.
         """
         Layer.__init__(self, **kwargs)
         self._pad: int = self.spec['pad']
         self._value: float = self.spec.get('value', 0)
+        self._layout: str = self.spec.get('layout', LAYOUT_NHWC)
         if self._pad < 0:
             raise ValueError('Padding should be non-negative.')
+        if self._layout not in (LAYOUT_NHWC, LAYOUT_NCHW):
+            raise ValueError('Unknown layout: {}'.format(self._layout))
+
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        shape = input_shapes[0]
+        if self._layout == LAYOUT_NCHW:
+            return [tuple(shape[:2]) + (shape[2] + self._pad * 2, shape[3] + self._pad * 2)]
+        return [(shape[0], shape[1] + self._pad * 2, shape[2] + self._pad * 2) + tuple(shape[3:])]
 
     def forward(self,
                 bottom: typing.List[Blob],
@@ -30,12 +42,12 @@ class PaddingLayer(Layer):
             return
         features = bottom[0].data()
         pad = self._pad
-        new_shape = (features.shape[0],
-                     features.shape[1] + pad * 2,
-                     features.shape[2] + pad * 2) + features.shape[3:]
-        output = top[0].init_data(new_shape, features.dtype)
+        output = top[0].init_data(self.output_shapes([features.shape])[0], features.dtype)
         output[:] = self._value
-        output[:, pad:-pad, pad:-pad] = features
+        if self._layout == LAYOUT_NCHW:
+            output[:, :, pad:-pad, pad:-pad] = features
+        else:
+            output[:, pad:-pad, pad:-pad] = features
 
     def backward(self,
                  bottom: typing.List[Blob],
@@ -50,7 +62,10 @@ class PaddingLayer(Layer):
             pad = self._pad
             top_diff = top[0].diff()
             bottom_diff = bottom[0].init_diff()
-            bottom_diff[:] = top_diff[:, pad:-pad, pad:-pad]
+            if self._layout == LAYOUT_NCHW:
+                bottom_diff[:] = top_diff[:, :, pad:-pad, pad:-pad]
+            else:
+                bottom_diff[:] = top_diff[:, pad:-pad, pad:-pad]
         return 0.
 
     def update(self):
@@ -0,0 +1,365 @@
+"""
+Implements post-training int8 quantization of the inner product and convolution layers for inference.
+
+The weights are quantized symmetrically with one scale per output channel, and the layer input with a single scale
+calibrated on sample data. The quantized layers keep only the int8 weights, which are 8 times smaller than float64
+weights (4 times smaller than float32).
+"""
+import typing
+
+import numpy as np
+
+from decaf import net
+from decaf.base import Layer, Blob, DecafError, InvalidLayerError, LAYOUT_NHWC, PHASE_TEST
+from decaf.layers import convolution, im2col, innerproduct, padding
+from decaf.layers.cpp import wrapper
+
+# The largest magnitude of a quantized value. We use the symmetric range [-127, 127].
+_QMAX = 127
+# Products with up to this many rows, like single inference requests, are bound by reading the weight, and run on the
+# int8 kernel, which reads every int8 weight once per block of 4 rows.
+_INT8_KERNEL_ROWS = 4
+# The products of two int8 values are summed exactly in float32 as long as the partial sums stay below 2 ** 24, so
+# larger products run on float32 BLAS over blocks of at most this many rows of the weight.
+_EXACT_CHUNK = 2 ** 24 // (_QMAX * _QMAX)
+# The approximate size in bytes of the float32 copy of a block of the weight, small enough to stay in the cache.
+_BLOCK_BYTES = 2 ** 22
+
+
+def quantize_weight(weight: np.ndarray):
+    """
+    Quantizes a (num_input, num_output) weight matrix with one scale per output channel (column).
+
+    Output:
+        qweight: the int8 weight matrix.
+        scale: the float64 scales of the columns, such that weight ~= qweight * scale.
+    """
+    scale = np.abs(weight).max(axis=0) / _QMAX
+    # an all-zero column quantizes to zeros with any scale.
+    scale[scale == 0] = 1.
+    qweight = np.clip(np.rint(weight / scale), -_QMAX, _QMAX).astype(np.int8)
+    return qweight, scale
+
+
+def _block_size(num_output: int):
+    """Returns the number of rows of the weight converted to float32 at a time by int8_dot()."""
+    return max(1, min(_EXACT_CHUNK, _BLOCK_BYTES // (4 * num_output)))
+
+
+def int8_dot(features: np.ndarray,
+             weight: np.ndarray,
+             out: typing.Optional[np.ndarray] = None):
+    """
+    Computes the exact integer matrix product of two int8 matrices with int32 accumulation.
+
+    Products with few rows run on the int8 kernel. Larger ones convert the weight to float32 one block of rows at a
+    time, so that the weight is never copied as a whole.
+
+    Input:
+        features: a (num, k) int8 matrix.
+        weight: a (k, num_output) int8 matrix.
+        out: (optional) the (num, num_output) int32 output matrix.
+    Output:
+        the (num, num_output) int32 product.
+    """
+    num, k = features.shape
+    num_output = weight.shape[1]
+    if out is None:
+        out = np.empty((num, num_output), np.int32)
+    if num <= _INT8_KERNEL_ROWS:
+        wrapper.int8_gemm(features, weight, out)
+        return out
+    block = _block_size(num_output)
+    float_features = features.astype(np.float32)
+    float_weight = np.empty((min(block, k), num_output), np.float32)
+    partial = np.empty((num, num_output), np.float32)
+    out[:] = 0
+    for start in range(0, k, block):
+        stop = min(start + block, k)
+        float_block = float_weight[:stop - start]
+        float_block[...] = weight[start:stop]
+        np.dot(float_features[:, start:stop], float_block, out=partial)
+        # the partial sums hold exact integers.
+        np.add(out, partial, out=out, casting='unsafe')
+    return out
+
+
+class QuantizedInnerProductLayer(Layer):
+    """An int8 inner product layer for inference. It has no parameters to train, and does not run backward."""
+
+    def __init__(self, **kwargs):
+        """
+        Initializes a quantized inner product layer.
+
+        kwargs:
+            name: the name of the layer.
+            weight: the float (num_input, num_output) weight matrix to be quantized.
+            bias: (optional) the float bias vector of length num_output. Default None.
+            input_scale: the scale of the input, usually calibrated as max(abs(input)) / 127. Input values beyond
+                127 * input_scale are clipped.
+        """
+        Layer.__init__(self, **kwargs)
+        # the float weight is not kept in the spec, so that only the quantized copy stays in memory.
+        self._weight, self._weight_scale = quantize_weight(self.spec.pop('weight'))
+        self._bias: typing.Optional[np.ndarray] = self.spec.get('bias', None)
+        self._input_scale: float = self.spec['input_scale']
+        if self._input_scale <= 0:
+            raise InvalidLayerError('The input scale of {} should be positive.'.format(self.name))
+        # the dequantization scale of each output channel.
+        self._output_scale: np.ndarray = self._weight_scale * self._input_scale
+
+    def quantized_bytes(self):
+        """Returns the number of bytes of the quantized weight, the scales and the bias."""
+        return self._weight.nbytes + self._output_scale.nbytes + (0 if self._bias is None else self._bias.nbytes)
+
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        return [(input_shapes[0][0], self._weight.shape[1])]
+
+    def scratch_bytes(self,
+                      input_shapes: typing.List[tuple],
+                      itemsize: int):
+        """
+        The quantized input and the int32 accumulator, and for more rows than the int8 kernel handles, the float32
+        copies of the input and of a block of the weight, and the float32 partial product.
+        """
+        num, k = input_shapes[0][0], int(np.prod(input_shapes[0][1:]))
+        num_output = self._weight.shape[1]
+        # the quantized input goes through a float32 array before it is stored as int8.
+        scratch = num * k * 5 + num * num_output * 4
+        if num > _INT8_KERNEL_ROWS:
+            scratch += (num * k + min(_block_size(num_output), k) * num_output + num * num_output) * 4
+        return scratch
+
+    def quantize_input(self,
+                       features: np.ndarray):
+        """Quantizes the input to int8 values in [-127, 127]."""
+        qfeatures = np.multiply(features, 1. / self._input_scale, dtype=np.float32)
+        np.rint(qfeatures, out=qfeatures)
+        np.clip(qfeatures, -_QMAX, _QMAX, out=qfeatures)
+        return qfeatures.astype(np.int8)
+
+    def compute(self,
+                features: np.ndarray,
+                output: np.ndarray):
+        """Computes output = features . weight + bias on a 2-dimensional input with the quantized weight."""
+        accumulated = int8_dot(self.quantize_input(features), self._weight)
+        # dequantize and add the bias on the output buffer in place.
+        np.multiply(accumulated, self._output_scale, out=output)
+        if self._bias is not None:
+            output += self._bias
+
+    def forward(self,
+                bottom: typing.List[Blob],
+                top: typing.List[Blob]):
+        """Computes the forward pass."""
+        features = bottom[0].data()
+        if features.ndim > 2:
+            features = features.reshape(features.shape[0], -1)
+        output = top[0].init_data((features.shape[0], self._weight.shape[1]), features.dtype)
+        self.compute(features, output)
+
+    def backward(self,
+                 bottom: typing.List[Blob],
+                 top: typing.List[Blob],
+                 propagate_down: bool):
+        raise DecafError('{} is quantized for inference and has no backward pass.'.format(self.name))
+
+    def update(self):
+        """The quantized layer has nothing to update."""
+        pass
+
+
+class QuantizedConvolutionLayer(Layer):
+    """An int8 convolution layer for inference. See decaf.layers.convolution.ConvolutionLayer for the semantics."""
+
+    def __init__(self, **kwargs):
+        """
+        Initializes a quantized convolution layer.
+
+        kwargs:
+            name: the name of the layer.
+            kernels: the float (num_kernels, ksize, ksize, channels) kernels to be quantized.
+            stride: the kernel stride.
+            mode: 'valid', 'same', or 'full'
+            input_scale: the scale of the input, see QuantizedInnerProductLayer.
+        """
+        Layer.__init__(self, **kwargs)
+        kernels = self.spec.pop('kernels')
+        self._num_kernels: int = kernels.shape[0]
+        self._ksize: int = kernels.shape[1]
+        mode = self.spec['mode']
+        if mode == 'valid':
+            pad = 0
+        elif mode == 'full':
+            pad = self._ksize - 1
+        elif mode == 'same':
+            pad = self._ksize // 2
+        else:
+            raise ValueError('Unknown mode: {}'.format(mode))
+        self._pad_layer: padding.PaddingLayer = padding.PaddingLayer(name=self.name + '_pad', pad=pad)
+        self._im2col_layer: im2col.Im2colLayer = im2col.Im2colLayer(name=self.name + '_im2col', psize=self._ksize,
+                                                                    stride=self.spec['stride'])
+        # ConvolutionLayer feeds its kernels to the inner product in their flat order.
+        self._ip_layer: QuantizedInnerProductLayer = QuantizedInnerProductLayer(
+            name=self.name + '_ip', weight=kernels.reshape(-1, self._num_kernels),
+            input_scale=self.spec['input_scale'])
+        self._padded: typing.List[Blob] = [Blob()]
+        self._col: typing.List[Blob] = [Blob()]
+
+    def __getstate__(self):
+        """When pickling, we will remove the intermediate data."""
+        self._padded = [Blob()]
+        self._col = [Blob()]
+        return self.__dict__
+
+    def quantized_bytes(self):
+        """Returns the number of bytes of the quantized kernels and the scales."""
+        return self._ip_layer.quantized_bytes()
+
+    def _col_shape(self,
+                   input_shape: tuple):
+        if len(input_shape) == 3:
+            # only one channel
+            input_shape = tuple(input_shape) + (1,)
+        padded_shape = self._pad_layer.output_shapes([input_shape])[0]
+        return padded_shape, self._im2col_layer.output_shapes([padded_shape])[0]
+
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        return [self._col_shape(input_shapes[0])[1][:3] + (self._num_kernels,)]
+
+    def scratch_bytes(self,
+                      input_shapes: typing.List[tuple],
+                      itemsize: int):
+        """The padded input and the patches of all the images, and the buffers of the quantized product."""
+        padded_shape, col_shape = self._col_shape(input_shapes[0])
+        padded_bytes = int(np.prod(padded_shape)) * itemsize if self._pad_layer.spec['pad'] else 0
+        col_bytes = int(np.prod(col_shape)) * itemsize
+        return padded_bytes + col_bytes + self._ip_layer.scratch_bytes([(int(np.prod(col_shape[:3])), col_shape[3])],
+                                                                        itemsize)
+
+    def forward(self,
+                bottom: typing.List[Blob],
+                top: typing.List[Blob]):
+        """Computes the forward pass. All the images go through a single quantized matrix product."""
+        bottom_data = bottom[0].data()
+        if bottom_data.ndim == 3:
+            # only one channel
+            bottom_data = bottom_data.reshape(bottom_data.shape + (1,))
+        single = Blob()
+        single.mirror(bottom_data)
+        self._pad_layer.forward([single], self._padded)
+        self._im2col_layer.forward(self._padded, self._col)
+        col = self._col[0].data()
+        output = top[0].init_data(col.shape[:3] + (self._num_kernels,), bottom_data.dtype)
+        self._ip_layer.compute(col.reshape(-1, col.shape[3]), output.reshape(-1, self._num_kernels))
+
+    def backward(self,
+                 bottom: typing.List[Blob],
+                 top: typing.List[Blob],
+                 propagate_down: bool):
+        raise DecafError('{} is quantized for inference and has no backward pass.'.format(self.name))
+
+    def update(self):
+        """The quantized layer has nothing to update."""
+        pass
+
+
+def quantize_layer(layer: Layer,
+                   input_scale: float):
+    """
+    Returns the quantized counterpart of an InnerProductLayer or a ConvolutionLayer with the same name. The layer
+    should have been run at least once so that its parameters are initialized.
+    """
+    if isinstance(layer, innerproduct.InnerProductLayer):
+        params = layer.param()
+        return QuantizedInnerProductLayer(name=layer.name, weight=params[0].data(),
+                                          bias=params[1].data().copy() if len(params) > 1 else None,
+                                          input_scale=input_scale)
+    elif isinstance(layer, convolution.ConvolutionLayer):
+        if layer.spec.get('layout', LAYOUT_NHWC) != LAYOUT_NHWC:
+            raise InvalidLayerError('Layer {} can only be quantized in the LAYOUT_NHWC layout.'.format(layer.name))
+        return QuantizedConvolutionLayer(name=layer.name, kernels=layer.param()[0].data(),
+                                         stride=layer.spec['stride'], mode=layer.spec['mode'],
+                                         input_scale=input_scale)
+    raise InvalidLayerError('Layer {} can not be quantized.'.format(layer.name))
+
+
+def _run(decaf_net: net.Net,
+         input_layer: Layer,
+         output_blob: Blob,
+         batches: typing.List[np.ndarray],
+         callback: typing.Optional[typing.Callable] = None):
+    """Runs the forward pass on every batch, calling callback() after each, and returns the stacked outputs."""
+    outputs = []
+    for batch in batches:
+        input_layer.set_sources([batch])
+        decaf_net.forward()
+        if callback is not None:
+            callback()
+        outputs.append(output_blob.data().reshape(batch.shape[0], -1).copy())
+    return np.vstack(outputs)
+
+
+def quantize_net(decaf_net: net.Net,
+                 input_layer: str,
+                 output_blob: str,
+                 batches: typing.List[np.ndarray],
+                 eval_batches: typing.Optional[typing.List[np.ndarray]] = None,
+                 layer_names: typing.Optional[typing.List[str]] = None):
+    """
+    Replaces the inner product and convolution layers of a trained net with their int8 counterparts, and reports how
+    far the quantized net is from the float one. The net is switched to the test phase.
+
+    Input:
+        decaf_net: a finished decaf.net.Net.
+        input_layer: the name of the NdArrayDataLayer in the net that emits the input.
+        output_blob: the name of the blob to compare, e.g. the scores before the loss.
+        batches: a list of input arrays used to calibrate the input scales of the quantized layers.
+        eval_batches: (optional) a list of input arrays to compare the float and quantized outputs on. Default the
+            calibration batches.
+        layer_names: (optional) the names of the layers to quantize. Default all the inner product and convolution
+            layers.
+    Output:
+        report: a dictionary with the quantized layer names ('layers'), the maximum and mean absolute difference of
+            the outputs ('max_abs_error', 'mean_abs_error'), the fraction of inputs whose top-1 output agrees
+            ('top1_agreement'), and the size of the float and quantized parameters in bytes ('float_bytes',
+            'quantized_bytes').
+    """
+    layers = decaf_net.layers()
+    if layer_names is None:
+        layer_names = [name for name, layer in layers.items()
+                       if isinstance(layer, (innerproduct.InnerProductLayer, convolution.ConvolutionLayer))]
+    data_layer = layers[input_layer]
+    output = decaf_net.blob(output_blob)
+    decaf_net.set_phase(PHASE_TEST)
+    # calibrate: record the largest input magnitude of every layer to be quantized.
+    bottoms = {name: decaf_net.needs(name)[0] for name in layer_names}
+    ranges = dict.fromkeys(layer_names, 0.)
+
+    def record():
+        for name, blob in bottoms.items():
+            ranges[name] = max(ranges[name], float(np.abs(blob.data()).max()))
+
+    calibration_output = _run(decaf_net, data_layer, output, batches, record)
+    if eval_batches is None:
+        float_output = calibration_output
+        eval_batches = batches
+    else:
+        float_output = _run(decaf_net, data_layer, output, eval_batches)
+    float_bytes = 0
+    quantized_bytes = 0
+    for name in layer_names:
+        float_bytes += sum(param.data().nbytes for param in layers[name].param())
+        quantized = quantize_layer(layers[name], (ranges[name] or 1.) / _QMAX)
+        quantized_bytes += quantized.quantized_bytes()
+        decaf_net.replace_layer(quantized)
+    quantized_output = _run(decaf_net, data_layer, output, eval_batches)
+    error = np.abs(quantized_output - float_output)
+    return {'layers': list(layer_names),
+            'max_abs_error': float(error.max()),
+            'mean_abs_error': float(error.mean()),
+            'top1_agreement': float((quantized_output.argmax(axis=1) == float_output.argmax(axis=1)).mean()),
+            'float_bytes': float_bytes,
+            'quantized_bytes': quantized_bytes}
@@ -8,7 +8,11 @@ class L1Regularizer(Regularizer):
         data = blob.data()
         diff = blob.diff()
         diff += self._weight * num_data * np.sign(data)
-        return np.abs(data).sum()
+        return np.abs(data).sum() * self._weight * num_data
+
+    def reg_r(self, blob: Blob, r_blob: Blob, num_data):
+        # the L1 term is piecewise linear, so its Hessian is zero wherever it exists.
+        pass
 
 
 class L2Regularizer(Regularizer):
@@ -16,4 +20,8 @@ class L2Regularizer(Regularizer):
         data = blob.data()
         diff = blob.diff()
         diff += self._weight * num_data * 2. * data
-        return np.dot(data.flat, data.flat) * self._weight
+        return np.dot(data.flat, data.flat) * self._weight * num_data
+
+    def reg_r(self, blob: Blob, r_blob: Blob, num_data):
+        r_diff = r_blob.diff()
+        r_diff += self._weight * num_data * 2. * r_blob.data()
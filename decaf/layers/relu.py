@@ -13,8 +13,11 @@ class ReLULayer(base.Layer):
     def __init__(self, **kwargs):
         """
         Initializes a ReLU layer.
+
+        The forward pass keeps a bit-packed mask of the positive inputs, so the backward pass does not need the input.
         """
         base.Layer.__init__(self, **kwargs)
+        self._mask: typing.Optional[np.ndarray] = None
 
     def forward(self,
                 bottom: typing.List[Blob],
@@ -24,8 +27,10 @@ class ReLULayer(base.Layer):
         """
         features = bottom[0].data()
         output = top[0].init_data(features.shape, features.dtype)
+        positive = features > 0
         output[:] = features
-        output *= (features > 0)
+        output *= positive
+        self._mask = np.packbits(positive)
 
     def backward(self,
                  bottom: typing.List[Blob],
@@ -37,12 +42,56 @@ class ReLULayer(base.Layer):
         if not propagate_down:
             return 0.
         top_diff = top[0].diff()
-        features = bottom[0].data()
         bottom_diff = bottom[0].init_diff()
         bottom_diff[:] = top_diff
-        bottom_diff *= (features > 0)
+        bottom_diff *= self._unpacked_mask(bottom_diff.shape)
         return 0.
 
+    def output_shapes(self,
+                      input_shapes: typing.List[tuple]):
+        return [input_shapes[0]]
+
+    def scratch_bytes(self,
+                      input_shapes: typing.List[tuple],
+                      itemsize: int):
+        """The boolean mask of the forward pass, and its bit-packed copy."""
+        size = int(np.prod(input_shapes[0]))
+        return size + (size + 7) // 8
+
+    def _unpacked_mask(self,
+                       shape: tuple):
+        return np.unpackbits(self._mask, count=int(np.prod(shape))).reshape(shape)
+
+    def forward_r(self,
+                  bottom: typing.List[Blob],
+                  top: typing.List[Blob],
+                  bottom_r: typing.List[Blob],
+                  top_r: typing.List[Blob]):
+        """
+        Computes the R operator of the forward pass.
+        """
+        features = bottom[0].data()
+        output_r = top_r[0].init_data(features.shape, features.dtype)
+        if bottom_r[0].has_data():
+            output_r[:] = bottom_r[0].data()
+            output_r *= self._unpacked_mask(features.shape)
+
+    def backward_r(self,
+                   bottom: typing.List[Blob],
+                   top: typing.List[Blob],
+                   bottom_r: typing.List[Blob],
+                   top_r: typing.List[Blob],
+                   propagate_down: bool,
+                   gauss_newton: bool):
+        """
+        Computes the R operator of the backward pass. ReLU is piecewise linear, so it has no curvature term.
+        """
+        if not propagate_down:
+            return
+        bottom_diff_r = bottom_r[0].init_diff()
+        bottom_diff_r[:] = top_r[0].diff()
+        bottom_diff_r *= self._unpacked_mask(bottom_diff_r.shape)
+
     def update(self):
         """
         ReLU has nothing to update
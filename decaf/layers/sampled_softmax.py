@@ -0,0 +1,233 @@
+"""Implements the sampled softmax loss layer."""
+import typing
+
+import numpy as np
+
+from decaf.base import LossLayer, Blob, InvalidLayerError, PHASE_TEST
+from decaf.layers.loss import softmax_loss
+from decaf.util import blasdot
+
+
+class SampledSoftmaxLossLayer(LossLayer):
+    """
+    The output inner product and the multinomial logistic loss over a large number of classes, trained with a sampled
+    softmax (Jean et al., On using very large target vocabulary for neural machine translation, 2015).
+
+    The input should be two blobs: the features, and the labels as a vector of class indices. The layer holds the
+    (dim, num_output) weight and the bias of the output inner product, laid out like those of InnerProductLayer.
+
+    In the train phase, a set of negative classes is drawn for every forward pass and shared by the whole mini-batch.
+    Only the columns of the weight of the true labels and of the negatives are gathered, and the softmax of every row
+    runs over its true label and the negatives, with the log of the expected number of draws of each class (log Q)
+    subtracted from its score, so that the gradient approximates that of the full softmax. The gradients are scattered
+    into just those columns, and update() only changes them. Solvers may scale the diff of the parameters, but should
+    not write other values into it, since the layer only clears the columns it wrote the last time.
+
+    In the test phase, the layer computes the full softmax over all the classes, with its exact gradient.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Initializes the sampled softmax loss layer.
+
+        kwargs:
+            name: the name of the layer.
+            num_output: the number of classes.
+            num_sampled: the number of negative classes drawn (with replacement) for every forward pass.
+            sampler: (optional) the distribution the negatives are drawn from: 'uniform', 'log_uniform' (Zipfian, for
+                classes sorted by decreasing frequency), or a vector of the num_output positive probabilities of the
+                classes, e.g. their frequencies. Default 'uniform'.
+            remove_accidental_hits: (optional) if True, a negative that is the true label of a row is left out of the
+                softmax of that row. Default True.
+            bias: (optional) if False, the layer has no bias. Default True.
+            memory: (optional) the approximate size in bytes of the row chunks of the softmax. See
+                decaf.layers.loss.softmax_loss(). Default 1e6.
+        """
+        LossLayer.__init__(self, **kwargs)
+        self._num_output: int = self.spec.get('num_output', 0)
+        if self._num_output <= 0:
+            raise InvalidLayerError('Incorrect or unspecified num_output for {}'.format(self.name))
+        self._num_sampled: int = self.spec.get('num_sampled', 0)
+        if self._num_sampled <= 0:
+            raise InvalidLayerError('Incorrect or unspecified num_sampled for {}'.format(self.name))
+        self._remove_accidental_hits: bool = self.spec.get('remove_accidental_hits', True)
+        self._memory: float = self.spec.get('memory', 1e6)
+        sampler = self.spec.get('sampler', 'uniform')
+        # the cumulative distribution and the probabilities of a custom sampler.
+        self._cdf: typing.Optional[np.ndarray] = None
+        self._probabilities: typing.Optional[np.ndarray] = None
+        if isinstance(sampler, str):
+            if sampler not in ('uniform', 'log_uniform'):
+                raise InvalidLayerError('Unknown sampler: {}'.format(sampler))
+        else:
+            probabilities = np.asarray(sampler, dtype=np.float64)
+            if probabilities.shape != (self._num_output,) or not np.all(probabilities > 0):
+                raise InvalidLayerError('The sampler should hold a positive probability for each of the {0} classes '
+                                        'of {1}.'.format(self._num_output, self.name))
+            self._probabilities = probabilities / probabilities.sum()
+            self._cdf = np.cumsum(self._probabilities)
+            sampler = 'custom'
+        self._sampler: str = sampler
+        self._weight: Blob = Blob()
+        self._has_bias: bool = self.spec.get('bias', True)
+        if self._has_bias:
+            self._bias: Blob = Blob()
+            self._param = [self._weight, self._bias]
+        else:
+            self._param = [self._weight]
+        # the gathered columns of the weight, the scores of the candidate classes, and the corrected scores of the
+        # softmax, with their diffs.
+        self._gathered: Blob = Blob()
+        self._scores: Blob = Blob()
+        self._logits: Blob = Blob()
+        # the classes whose columns the last forward pass wrote into the diff (None for all of them), and that diff.
+        self._touched: typing.Optional[np.ndarray] = None
+        self._written_diff: typing.Optional[np.ndarray] = None
+
+    def __getstate__(self):
+        """When pickling, we will remove the intermediate data."""
+        self._gathered = Blob()
+        self._scores = Blob()
+        self._logits = Blob()
+        self._touched = None
+        self._written_diff = None
+        return self.__dict__
+
+    def param_shapes(self,
+                     input_shapes: typing.List[tuple]):
+        weight_shape = (int(np.prod(input_shapes[0][1:])), self._num_output)
+        if self._has_bias:
+            return [weight_shape, (self._num_output,)]
+        return [weight_shape]
+
+    def scratch_bytes(self,
+                      input_shapes: typing.List[tuple],
+                      itemsize: int):
+        """
+        The scores of all the classes and their diff in the test phase. In the train phase, the gathered columns, the
+        scores of the at most num + num_sampled candidate classes and the corrected scores, all with their diffs.
+        """
+        num, dim = input_shapes[0][0], int(np.prod(input_shapes[0][1:]))
+        if self._phase == PHASE_TEST:
+            return 2 * num * self._num_output * itemsize
+        num_candidates = min(num + self._num_sampled, self._num_output)
+        return 2 * (dim * num_candidates + num * num_candidates + num * (self._num_sampled + 1)) * itemsize
+
+    def _sample(self):
+        """Returns the distinct negative classes drawn, and the number of times each of them was drawn."""
+        if self._sampler == 'uniform':
+            draws = np.random.randint(self._num_output, size=self._num_sampled)
+        elif self._sampler == 'log_uniform':
+            # the inverse of the cumulative distribution log(k + 1) / log(num_output + 1).
+            draws = np.exp(np.random.rand(self._num_sampled) * np.log(self._num_output + 1.)).astype(np.int64) - 1
+            np.clip(draws, 0, self._num_output - 1, out=draws)
+        else:
+            draws = np.searchsorted(self._cdf, np.random.rand(self._num_sampled) * self._cdf[-1], side='right')
+            np.minimum(draws, self._num_output - 1, out=draws)
+        return np.unique(draws, return_counts=True)
+
+    def _log_expected_count(self,
+                            classes: np.ndarray):
+        """Returns the log of the expected number of times each of the classes is drawn, log(num_sampled * Q)."""
+        if self._sampler == 'uniform':
+            return np.full(classes.shape, np.log(self._num_sampled / float(self._num_output)))
+        if self._sampler == 'log_uniform':
+            probabilities = np.log((classes + 2.) / (classes + 1.)) / np.log(self._num_output + 1.)
+        else:
+            probabilities = self._probabilities[classes]
+        return np.log(self._num_sampled * probabilities)
+
+    def _clear_diff(self):
+        """Clears the columns of the diff of the parameters written by the last forward pass."""
+        weight_diff = self._weight.diff()
+        if self._touched is None or weight_diff is None or weight_diff is not self._written_diff:
+            # the diff is new, or was replaced e.g. by mirror_diff(), so it is cleared entirely.
+            for param in self._param:
+                param.init_diff()
+        else:
+            weight_diff[:, self._touched] = 0
+            if self._has_bias:
+                self._bias.diff()[self._touched] = 0
+        self._written_diff = self._weight.diff()
+
+    def forward(self,
+                bottom: typing.List[Blob],
+                top: typing.List[Blob]):
+        """
+        Computes the loss, and the gradients w.r.t. the features and the parameters.
+        """
+        features = bottom[0].data()
+        if features.ndim > 2:
+            features = features.reshape(features.shape[0], -1)
+        label = bottom[1].data()
+        if label.ndim != 1:
+            raise InvalidLayerError('{} needs the labels as a vector of class indices.'.format(self.name))
+        label = label.astype(np.int64, copy=False)
+        num, dim = features.shape
+        if not self._weight.has_data():
+            self._weight.init_data((dim, self._num_output), features.dtype)
+        if self._has_bias and not self._bias.has_data():
+            self._bias.init_data(self._num_output, features.dtype)
+        self._clear_diff()
+        weight = self._weight.data()
+        weight_diff = self._weight.diff()
+        bottom_diff = bottom[0].init_diff()
+        if bottom_diff.ndim > 2:
+            bottom_diff = bottom_diff.reshape(num, -1)
+        if self._phase == PHASE_TEST:
+            scores = self._scores.init_data((num, self._num_output), features.dtype)
+            blasdot.dot(features, weight, out=scores)
+            if self._has_bias:
+                scores += self._bias.data()
+            scores_diff = self._scores.init_diff()
+            self._loss = softmax_loss(scores, label, scores_diff, self._memory)
+            blasdot.dot(features.T, scores_diff, out=weight_diff)
+            if self._has_bias:
+                self._bias.diff()[:] = scores_diff.sum(0)
+            blasdot.dot(scores_diff, weight.T, out=bottom_diff)
+            self._touched = None
+            return
+        sampled, counts = self._sample()
+        # the candidate classes are the true labels and the negatives, and each of them is gathered once.
+        candidates, inverse = np.unique(np.concatenate([label, sampled]), return_inverse=True)
+        true_index, sampled_index = inverse[:num], inverse[num:]
+        gathered = self._gathered.init_data((dim, candidates.size), features.dtype)
+        np.take(weight, candidates, axis=1, out=gathered)
+        scores = self._scores.init_data((num, candidates.size), features.dtype)
+        blasdot.dot(features, gathered, out=scores)
+        if self._has_bias:
+            scores += self._bias.data()[candidates]
+        # the first column holds the true labels. A negative drawn k times stands for k terms of the softmax, which
+        # adds log(k) to its score.
+        rows = np.arange(num)
+        logits = self._logits.init_data((num, sampled.size + 1), features.dtype)
+        logits[:, 0] = scores[rows, true_index]
+        logits[:, 0] -= self._log_expected_count(label)
+        logits[:, 1:] = scores[:, sampled_index]
+        logits[:, 1:] -= self._log_expected_count(sampled) - np.log(counts)
+        if self._remove_accidental_hits:
+            logits[:, 1:][label[:, np.newaxis] == sampled] = -np.inf
+        logits_diff = self._logits.init_diff()
+        self._loss = softmax_loss(logits, np.zeros(num, np.int64), logits_diff, self._memory)
+        # scatter the gradient back to the scores of the candidates, then to their columns.
+        scores_diff = self._scores.init_diff()
+        scores_diff[:, sampled_index] = logits_diff[:, 1:]
+        scores_diff[rows, true_index] += logits_diff[:, 0]
+        gathered_diff = self._gathered.init_diff()
+        blasdot.dot(features.T, scores_diff, out=gathered_diff)
+        weight_diff[:, candidates] = gathered_diff
+        if self._has_bias:
+            self._bias.diff()[candidates] = scores_diff.sum(0)
+        blasdot.dot(scores_diff, gathered.T, out=bottom_diff)
+        self._touched = candidates
+
+    def update(self):
+        """Updates the columns of the parameters that the last forward pass computed the gradient of."""
+        if self._touched is None:
+            for param in self._param:
+                param.update()
+            return
+        touched = self._touched
+        self._weight.data()[:, touched] += self._weight.diff()[:, touched]
+        if self._has_bias:
+            self._bias.data()[touched] += self._bias.diff()[touched]
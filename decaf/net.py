@@ -1,8 +1,9 @@
 from collections import defaultdict
 import typing
-import networkx as nx
 
-from decaf.base import DecafError, Blob, Layer
+import numpy as np
+
+from decaf.base import DecafError, Blob, Layer, DataLayer, LossLayer, PHASE_TRAIN
 
 
 class InvalidNetworkError(DecafError):
@@ -15,19 +16,42 @@ class InvalidNetworkError(DecafError):
 class Net(object):
     """
     A Net is a directed graph with layer names and layer instances.
+
+    The graph is kept as plain dictionaries. When finished, the net compiles an execution plan: flat tuples of the bound
+    forward/backward methods of the layers together with their blobs, so that executing the net does no graph work.
     """
 
     def __init__(self):
-        self._graph: nx.DiGraph = nx.DiGraph()
         self._blobs: dict = defaultdict(Blob)
         self._layers: dict = {}
         self._needs: dict = {}
         self._provides: dict = {}
+        # The blobs holding the R operator values (see decaf.base.Layer.forward_r), one for each blob.
+        self._r_blobs: dict = defaultdict(Blob)
+        self._needs_r: dict = {}
+        self._provides_r: dict = {}
+        # The names of the blobs each layer needs and provides, and the names of the layers that produce and consume each blob.
+        self._need_names: dict = {}
+        self._provide_names: dict = {}
+        self._blob_sources: dict = defaultdict(list)
+        self._blob_sinks: dict = defaultdict(list)
         # The topological order to execute the layer.
         self._forward_order: typing.Optional[typing.List[Layer]] = None
         self._backward_order: typing.Optional[typing.List[Layer]] = None
+        # The compiled execution plan.
+        self._forward_plan: tuple = ()
+        self._backward_plan: tuple = ()
+        self._update_plan: tuple = ()
+        self._forward_r_plan: tuple = ()
+        self._backward_r_plan: tuple = ()
         self._params: typing.Optional[list] = None
+        self._r_params: typing.Optional[list] = None
+        # Whether each layer computes the gradient w.r.t. its bottom blobs.
+        self._propagate_down: dict = {}
+        # The arguments finish() was called with, so that replace_layer() can finish the net again.
+        self._finish_args: dict = {}
         self._finished: bool = False
+        self._phase: str = PHASE_TRAIN
 
     def add_layer(self,
                   layer: Layer,
@@ -54,6 +78,7 @@ class Net(object):
         if layer.name in self._blobs:
             raise InvalidNetworkError('Layer name found as a blob: {0}'.format(layer.name))
         self._layers[layer.name] = layer
+        layer.set_phase(self._phase)
         # Add the blobs
         for blob_name in needs:
             if blob_name in self._layers:
@@ -63,82 +88,298 @@ class Net(object):
                 raise InvalidNetworkError('Blob name found as a layer {0}'.format(blob_name))
         self._needs[layer.name] = [self._blobs[blob_name] for blob_name in needs]
         self._provides[layer.name] = [self._blobs[blob_name] for blob_name in provides]
+        self._needs_r[layer.name] = [self._r_blobs[blob_name] for blob_name in needs]
+        self._provides_r[layer.name] = [self._r_blobs[blob_name] for blob_name in provides]
         # create the graph structure
+        self._need_names[layer.name] = list(needs)
+        self._provide_names[layer.name] = list(provides)
         for blob_name in needs:
-            self._graph.add_edge(blob_name, layer.name)
+            self._blob_sinks[blob_name].append(layer.name)
         for blob_name in provides:
-            self._graph.add_edge(layer.name, blob_name)
+            self._blob_sources[blob_name].append(layer.name)
 
-    def finish(self):
+    def replace_layer(self,
+                      layer: Layer):
+        """
+        Replace the layer of the same name with the given layer, which takes over its blobs. This may be called on a
+        finished network, e.g. to swap in a layer converted for inference, in which case the network is finished again.
+        """
+        if layer.name not in self._layers:
+            raise InvalidNetworkError('Layer {} is not found in the net.'.format(layer.name))
+        layer.set_phase(self._phase)
+        self._layers[layer.name] = layer
+        if self._finished:
+            self.finish(**self._finish_args)
+
+    def finish(self,
+               input_shapes: typing.Optional[dict] = None,
+               memory_limit: typing.Optional[float] = None,
+               dtype: typing.Optional[np.dtype] = None):
         """
         Call this function when you finish the network construction.
+
+        Input:
+            input_shapes: (optional) a dictionary from the names of the blobs emitted by the data layers to their
+                shapes. If given, or if memory_limit is given, the shapes of all the blobs are inferred (see
+                memory_report()) and the parameters are allocated right away. The blobs of data layers that can tell
+                their shapes, like NdArrayDataLayer, may be left out.
+            memory_limit: (optional) the number of bytes the net may use. An InvalidNetworkError is raised if the
+                predicted peak is larger.
+            dtype: (optional) the dtype of the parameters, and of the blobs in the memory estimate. By default, the
+                floating point dtype of the data layers that can tell the dtypes of their data (see
+                DataLayer.output_dtypes()). If there is none, the memory is estimated for np.float64, and the
+                parameters are left for the layers to allocate in the dtype of their input.
         """
         # validate.
         self._validate()
-        topological_order = nx.topological_sort(self._graph)
+        layer_order = self._topological_order()
         # For efficiency reasons, we will see for each layer, whether the backward operation needs to be carried out.
-        # This is stored in two parameters:
+        # This is stored in two dictionaries:
         #   need_backward: whether the backward pass needs to be carried out
         #   propagate_down: whether the gradient w.r.t. to be bottom layer needs to be carried out.
-        for name in topological_order:
-            pred_need_backward = any(self._graph.nodes[p]['need_backward'] for p in self._graph.predecessors(name))
-
-            if name in self._layers:
-                # see if a layer needs backward operation. A layer needs backward operation if
-                # (1) it has parameters, or
-                # (2) any of its predecessors needs backward operation.
-                if self._layers[name].param() or pred_need_backward:
-                    self._graph.nodes[name]['need_backward'] = True
-                else:
-                    self._graph.nodes[name]['need_backward'] = False
-                # See if a layer needs to compute its bottom diff. A layer need to compute its bottom diff if any of its
-                # predecessors needs backward operation.
-                if pred_need_backward:
-                    self._graph.nodes[name]['propagate_down'] = True
-                else:
-                    self._graph.nodes[name]['propagate_down'] = False
-            else:
-                # see if a blob needs backward operation. This is only used so we can verify further layer.
-                self._graph.nodes[name]['need_backward'] = pred_need_backward
+        need_backward = {}
+        propagate_down = {}
+        for name in layer_order:
+            # A blob needs backward operation if its source layer does. A layer needs to compute its bottom diff if any
+            # of its bottom blobs needs backward operation.
+            propagate_down[name] = any(need_backward[self._blob_sources[blob_name][0]]
+                                       for blob_name in self._need_names[name])
+            # A layer needs backward operation if (1) it has parameters, or (2) any of its predecessors needs backward
+            # operation.
+            need_backward[name] = bool(self._layers[name].param()) or propagate_down[name]
         # create the order to run forward and backward passes
-        # topological_order is a iterator, after the above loop, it should be reinitialize
-        topological_order = nx.topological_sort(self._graph)
-        layer_order = [layer_name for layer_name in topological_order if layer_name in self._layers]
         self._forward_order = [(n, self._layers[n], self._needs[n], self._provides[n]) for n in layer_order]
-        self._backward_order = [(n, self._layers[n], self._needs[n], self._provides[n],
-                                 self._graph.nodes[n]['propagate_down'])
-                                for n in layer_order[::-1] if self._graph.nodes[n]['need_backward']]
+        self._backward_order = [(n, self._layers[n], self._needs[n], self._provides[n], propagate_down[n])
+                                for n in layer_order[::-1] if need_backward[n]]
+        self._propagate_down = {n: need_backward[n] and propagate_down[n] for n in layer_order}
         # store all the parameters
         self._params = []
+        self._r_params = []
         for name in layer_order:
             self._params.extend(self._layers[name].param())
+            self._r_params.extend(self._layers[name].r_param())
         # Note: Any further finishing code should be inserted here.
+        self._compile()
+        if input_shapes is not None or memory_limit is not None:
+            param_dtype = dtype if dtype is not None else self._data_dtype()
+            report = self.memory_report(input_shapes, param_dtype if param_dtype is not None else np.float64)
+            if memory_limit is not None and report['peak_bytes'] > memory_limit:
+                raise InvalidNetworkError('The net needs about {0} bytes, more than the limit of {1} bytes.'.format(
+                    report['peak_bytes'], int(memory_limit)))
+            if param_dtype is not None:
+                for name in layer_order:
+                    for param, shape in zip(self._layers[name].param(), report['layers'][name]['param_shapes']):
+                        if not param.has_data():
+                            param.init_data(shape, param_dtype)
+        self._finish_args = {'input_shapes': input_shapes, 'memory_limit': memory_limit, 'dtype': dtype}
         self._finished = True
 
+    def _data_dtype(self):
+        """
+        Returns the common floating point dtype of the data that the data layers can tell the dtypes of, or None.
+        """
+        dtypes = []
+        for layer in self.data_layers():
+            dtypes.extend(dtype for dtype in layer.output_dtypes() or [] if np.issubdtype(dtype, np.floating))
+        return np.result_type(*dtypes) if dtypes else None
+
+    def infer_shapes(self,
+                     input_shapes: typing.Optional[dict] = None):
+        """
+        Return a dictionary from the blob names to their shapes, propagated through the net from the shapes of the
+        data, without executing the net. See finish() for input_shapes.
+        """
+        if self._forward_order is None:
+            raise DecafError('Call finish() before you infer the shapes.')
+        input_shapes = dict(input_shapes or {})
+        for blob_name in input_shapes:
+            sources = self._blob_sources.get(blob_name)
+            if not sources or not isinstance(self._layers[sources[0]], DataLayer):
+                raise InvalidNetworkError('Blob {} is not emitted by a data layer.'.format(blob_name))
+        shapes = {}
+        for name, layer, _, _ in self._forward_order:
+            provide_names = self._provide_names[name]
+            if isinstance(layer, DataLayer) and all(blob_name in input_shapes for blob_name in provide_names):
+                output_shapes = [input_shapes[blob_name] for blob_name in provide_names]
+            else:
+                try:
+                    output_shapes = layer.output_shapes([shapes[blob_name] for blob_name in self._need_names[name]])
+                except NotImplementedError as error:
+                    raise InvalidNetworkError('Can not infer the shapes of layer {0}: {1}'.format(name, error))
+            if len(output_shapes) != len(provide_names):
+                raise InvalidNetworkError('Layer {0} provides {1} blobs, but emits {2} shapes.'.format(
+                    name, len(provide_names), len(output_shapes)))
+            for blob_name, shape in zip(provide_names, output_shapes):
+                shapes[blob_name] = tuple(int(dim) for dim in shape)
+        return shapes
+
+    def memory_report(self,
+                      input_shapes: typing.Optional[dict] = None,
+                      dtype: np.dtype = np.float64):
+        """
+        Estimate the memory of one execute() pass from the inferred shapes (see infer_shapes()), with all the blobs
+        in the given dtype.
+
+        Output:
+            report: a dictionary with the keys
+                'blobs': a dictionary from the blob names to dictionaries with their 'shape', 'data_bytes' and
+                    'diff_bytes'. A blob only has a diff if the layer that consumes it computes the gradient w.r.t. it.
+                'layers': a dictionary from the layer names to dictionaries with their 'param_shapes', the bytes of
+                    the data and the diff of the parameters 'data_bytes' and 'diff_bytes', and 'scratch_bytes' (see
+                    decaf.base.Layer.scratch_bytes()).
+                'peak_bytes': the predicted peak. Blobs keep their buffers once allocated, so this is the sum of all
+                    the above.
+        """
+        itemsize = np.dtype(dtype).itemsize
+        shapes = self.infer_shapes(input_shapes)
+        blobs = {}
+        for blob_name, shape in shapes.items():
+            size = int(np.prod(shape)) * itemsize
+            # the blob has a diff if any of its sinks computes the gradient w.r.t. it. Loss layers always compute the
+            # gradient w.r.t. their first bottom blob, and only that one.
+            has_diff = any(self._need_names[sink_name][0] == blob_name
+                           if isinstance(self._layers[sink_name], LossLayer) else self._propagate_down[sink_name]
+                           for sink_name in self._blob_sinks.get(blob_name, []))
+            blobs[blob_name] = {'shape': shape, 'data_bytes': size, 'diff_bytes': size if has_diff else 0}
+        layers = {}
+        for name, layer, _, _ in self._forward_order:
+            bottom_shapes = [shapes[blob_name] for blob_name in self._need_names[name]]
+            try:
+                param_shapes = [tuple(int(dim) for dim in shape) for shape in layer.param_shapes(bottom_shapes)]
+            except NotImplementedError as error:
+                raise InvalidNetworkError('Can not infer the parameter shapes of layer {0}: {1}'.format(name, error))
+            param_bytes = sum(int(np.prod(shape)) for shape in param_shapes) * itemsize
+            layers[name] = {'param_shapes': param_shapes,
+                            'data_bytes': param_bytes,
+                            'diff_bytes': param_bytes,
+                            'scratch_bytes': int(layer.scratch_bytes(bottom_shapes, itemsize))}
+        peak_bytes = sum(blob['data_bytes'] + blob['diff_bytes'] for blob in blobs.values())
+        peak_bytes += sum(layer['data_bytes'] + layer['diff_bytes'] + layer['scratch_bytes']
+                          for layer in layers.values())
+        return {'blobs': blobs, 'layers': layers, 'peak_bytes': peak_bytes}
+
+    def _compile(self):
+        """
+        Compile the execution plan from the forward and backward orders.
+        """
+        self._forward_plan = tuple((layer.forward, bottom, top) for _, layer, bottom, top in self._forward_order)
+        self._backward_plan = tuple((layer.backward, bottom, top, propagate_down)
+                                    for _, layer, bottom, top, propagate_down in self._backward_order)
+        self._update_plan = tuple(layer.update for _, layer, _, _ in self._forward_order)
+        self._forward_r_plan = tuple((layer.forward_r, bottom, top, self._needs_r[name], self._provides_r[name])
+                                     for name, layer, bottom, top in self._forward_order)
+        self._backward_r_plan = tuple((layer.backward_r, bottom, top, self._needs_r[name], self._provides_r[name],
+                                       propagate_down)
+                                      for name, layer, bottom, top, propagate_down in self._backward_order)
+
+    def _topological_order(self):
+        """
+        Return the layer names in a topological order, breaking ties by the order the layers were added.
+        """
+        num_pending = {name: 0 for name in self._layers}
+        successors = defaultdict(list)
+        for blob_name, sources in self._blob_sources.items():
+            for sink in self._blob_sinks.get(blob_name, []):
+                for source in sources:
+                    successors[source].append(sink)
+                    num_pending[sink] += 1
+        ready = [name for name in self._layers if num_pending[name] == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for successor in successors[name]:
+                num_pending[successor] -= 1
+                if num_pending[successor] == 0:
+                    ready.append(successor)
+        if len(order) != len(self._layers):
+            raise InvalidNetworkError('The network is not a DAG')
+        return order
+
+    def graph(self):
+        """
+        Return the network as a networkx.DiGraph whose nodes are the layer and blob names, e.g. for visualization.
+        networkx is only imported when this function is called.
+        """
+        import networkx as nx
+        graph = nx.DiGraph()
+        for blob_name, sources in self._blob_sources.items():
+            for source in sources:
+                graph.add_edge(source, blob_name)
+        for blob_name, sinks in self._blob_sinks.items():
+            for sink in sinks:
+                graph.add_edge(blob_name, sink)
+        return graph
+
     def params(self):
         """
         Return a list of parameters used in the network.
         """
         return self._params
 
+    def r_params(self):
+        """
+        Return the list of blobs holding the direction of the parameters and the Hessian-vector products, in the same
+        order as params(). See decaf.base.Layer.r_param().
+        """
+        return self._r_params
+
+    def set_phase(self,
+                  phase: str):
+        """
+        Sets the phase of all the layers in the network, either decaf.base.PHASE_TRAIN or decaf.base.PHASE_TEST.
+        """
+        for layer in self._layers.values():
+            layer.set_phase(phase)
+        self._phase = phase
+
+    def phase(self):
+        """
+        Return the phase of the network.
+        """
+        return self._phase
+
+    def blob(self,
+             name: str):
+        """
+        Return the blob with the given name.
+        """
+        if name not in self._blobs:
+            raise DecafError('Blob {} is not found in the net.'.format(name))
+        return self._blobs[name]
+
+    def layers(self):
+        """
+        Return a dictionary mapping the layer names to the layer instances.
+        """
+        return self._layers
+
+    def needs(self,
+              name: str):
+        """
+        Return the list of blobs the given layer needs as its input.
+        """
+        return self._needs[name]
+
+    def data_layers(self):
+        """
+        Return the list of data layers in the network, in their execution order.
+        """
+        return [layer for _, layer, _, _ in self._forward_order if isinstance(layer, DataLayer)]
+
     def _validate(self):
         """
         Validated if a network is executable. A net word being executable means that every blob node has a layer as its
         predecessor, and no loop exists in the network.
         """
-        if not nx.is_directed_acyclic_graph(self._graph):
-            raise InvalidNetworkError('The network is not a DAG')
         for blob_name in self._blobs:
-            # check if every blob has predecessors, and each predecessor is a valid layer.
-            predecessors = list(self._graph.predecessors(blob_name))
-            if len(predecessors) != 1:
+            # check if every blob has exactly one source layer.
+            if len(self._blob_sources[blob_name]) != 1:
                 raise InvalidNetworkError('Blob {} has no source layer or multiple source layers.'.format(blob_name))
-            if predecessors[0] not in self._layers:
-                raise InvalidNetworkError('Blob {} has a source that is not a layer.'.format(blob_name))
-            successors = list(self._graph.successors(blob_name))
-            if len(successors) > 1:
+            if len(self._blob_sinks[blob_name]) > 1:
                 raise InvalidNetworkError('Blob {} has multiple successors.'.format(blob_name))
-
+        # check that no loop exists.
+        self._topological_order()
         return True
 
     def execute(self):
@@ -147,16 +388,40 @@ class Net(object):
         if not self._finished:
             raise DecafError('Call finish() before you use the network.')
         loss = 0.
-        for _, layer, bottom, top in self._forward_order:
-            layer.forward(bottom, top)
+        for forward, bottom, top in self._forward_plan:
+            forward(bottom, top)
         # the backward pass
-        for _, layer, bottom, top, propagate_down in self._backward_order:
-            loss += layer.backward(bottom, top, propagate_down)
+        for backward, bottom, top, propagate_down in self._backward_plan:
+            loss += backward(bottom, top, propagate_down)
         return loss
 
+    def forward(self):
+        """
+        Execute only the forward pass of the network, e.g. for prediction. Unlike execute(), no gradient is computed
+        and no loss is returned.
+        """
+        if not self._finished:
+            raise DecafError('Call finish() before you use the network.')
+        for forward, bottom, top in self._forward_plan:
+            forward(bottom, top)
+
+    def execute_r(self,
+                  gauss_newton: bool = False):
+        """
+        Compute the product of the Hessian of the loss with the direction held in the data of r_params(), and store it
+        in their diff. execute() should have been called at the current parameters first. If gauss_newton is True,
+        the Gauss-Newton matrix is used instead of the Hessian. See decaf.base.Layer.forward_r().
+        """
+        if not self._finished:
+            raise DecafError('Call finish() before you use the network.')
+        for forward_r, bottom, top, bottom_r, top_r in self._forward_r_plan:
+            forward_r(bottom, top, bottom_r, top_r)
+        for backward_r, bottom, top, bottom_r, top_r, propagate_down in self._backward_r_plan:
+            backward_r(bottom, top, bottom_r, top_r, propagate_down, gauss_newton)
+
     def update(self):
         """
         Update the parameters using the diff values provided in the parameters blob.
         """
-        for _, layer, _, _ in self._forward_order:
-            layer.update()
+        for update in self._update_plan:
+            update()
@@ -0,0 +1,264 @@
+"""Implements an L-BFGS solver that works in place on a flat arena of the net parameters, in the dtype of the net."""
+import logging
+import typing
+
+import numpy as np
+
+from decaf import net
+from decaf.base import DecafError, Solver
+from decaf.optimization.monitor import SolverMonitor, StopSolving
+
+
+class ArenaLBFGSSolver(Solver):
+    """
+    An L-BFGS solver with a strong Wolfe line search that, unlike LBFGSSolver, does not go through scipy.
+
+    When solving starts, the parameters of the net are moved into one flat data array and one flat diff array (the
+    arena), and the parameter blobs become views of it. The objective is then evaluated by writing the trial point
+    into the arena and executing the net, which leaves the gradient in the diff arena: no gather or scatter of the
+    parameters takes place. The history of the last m steps and gradient changes is kept in preallocated (m, n) arrays
+    of the dtype of the net, so a float32 net is optimized in float32 throughout. The parameter blobs stay views of the
+    arena after solving.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        The arena L-BFGS solver. Optional args are:
+            memory: the number of past updates used to approximate the Hessian. Default 10.
+            max_iter: the maximum number of iterations. Default 1000.
+            tol: the solver stops when the relative decrease of the loss falls below tol. It is raised to ten times the
+                machine precision of the dtype of the net if smaller. Default 1e-9.
+            gtol: the solver stops when the largest magnitude in the gradient falls below gtol. Default 1e-5.
+            c1, c2: the constants of the strong Wolfe conditions. Default 1e-4 and 0.9.
+            max_linesearch: the maximum number of evaluations in one line search. Default 20.
+            chunk_size: see LBFGSSolver.
+            monitor: see LBFGSSolver.
+        """
+        Solver.__init__(self, **kwargs)
+        self._memory: int = self.spec.get('memory', 10)
+        self._max_iter: int = self.spec.get('max_iter', 1000)
+        self._tol: float = self.spec.get('tol', 1e-9)
+        self._gtol: float = self.spec.get('gtol', 1e-5)
+        self._c1: float = self.spec.get('c1', 1e-4)
+        self._c2: float = self.spec.get('c2', 0.9)
+        self._max_linesearch: int = self.spec.get('max_linesearch', 20)
+        self._chunk_size: typing.Optional[int] = self.spec.get('chunk_size', None)
+        self._monitor: typing.Optional[SolverMonitor] = self.spec.get('monitor', None)
+        self._net: typing.Optional[net.Net] = None
+        # the arena, and the history of steps and gradient changes.
+        self._variable: typing.Optional[np.ndarray] = None
+        self._gradient: typing.Optional[np.ndarray] = None
+        self._steps: typing.Optional[np.ndarray] = None
+        self._changes: typing.Optional[np.ndarray] = None
+        self._rhos: typing.Optional[np.ndarray] = None
+        self._num_history: int = 0
+        self._newest: int = -1
+        self._num_evaluations: int = 0
+        self._info: dict = {}
+
+    def _build_arena(self):
+        """
+        Moves the parameters of the net into the arena, and allocates the history.
+        """
+        params = self._net.params()
+        dtype = np.result_type(*[param.data().dtype for param in params])
+        size = sum(param.data().size for param in params)
+        self._variable = np.empty(size, dtype)
+        self._gradient = np.zeros(size, dtype)
+        current = 0
+        for param in params:
+            shape = param.data().shape
+            data = self._variable[current:current + param.data().size]
+            data[:] = param.data().flat
+            param.mirror(data, shape)
+            # the layers clear the diff of their parameters in place, so the diff arena keeps receiving the gradient.
+            param.mirror_diff(self._gradient[current:current + param.data().size], shape)
+            current += param.data().size
+        self._steps = np.zeros((self._memory, size), dtype)
+        self._changes = np.zeros((self._memory, size), dtype)
+        self._rhos = np.zeros(self._memory)
+        self._num_history = 0
+        self._newest = -1
+
+    def _mark_params_changed(self):
+        """Tells the parameters that the arena was written in place."""
+        for param in self._net.params():
+            param.mark_changed()
+
+    def _evaluate(self):
+        """
+        Executes the net at the parameters in the arena, leaving the gradient in the diff arena, and returns the loss.
+        """
+        self._num_evaluations += 1
+        self._mark_params_changed()
+        if self._chunk_size is None:
+            loss = self._net.execute()
+        else:
+            data_layers = [layer for layer in self._net.data_layers() if layer.num_data() is not None]
+            if not data_layers:
+                raise DecafError('Chunked execution needs data layers that support set_range().')
+            num_data = data_layers[0].num_data()
+            loss = 0.
+            total = np.zeros_like(self._gradient)
+            try:
+                for start in range(0, num_data, self._chunk_size):
+                    for layer in data_layers:
+                        layer.set_range(start, start + self._chunk_size)
+                    loss += self._net.execute()
+                    total += self._gradient
+            finally:
+                for layer in data_layers:
+                    layer.set_range()
+            self._gradient[:] = total
+        if self._monitor is not None:
+            self._monitor.evaluation(loss, self._gradient)
+        return loss
+
+    def _direction(self,
+                   out: np.ndarray):
+        """
+        Computes the search direction -H * gradient into out with the two-loop recursion over the history.
+        """
+        out[:] = self._gradient
+        order = [(self._newest - i) % self._memory for i in range(self._num_history)]
+        alphas = np.zeros(self._memory)
+        for index in order:
+            alphas[index] = self._rhos[index] * np.dot(self._steps[index], out)
+            out -= alphas[index] * self._changes[index]
+        if self._num_history:
+            change = self._changes[self._newest]
+            out *= 1. / (self._rhos[self._newest] * np.dot(change, change))
+        for index in reversed(order):
+            beta = self._rhos[index] * np.dot(self._changes[index], out)
+            out += (alphas[index] - beta) * self._steps[index]
+        out *= -1
+
+    def _line_search(self,
+                     origin: np.ndarray,
+                     direction: np.ndarray,
+                     loss: float,
+                     slope: float,
+                     step_size: float):
+        """
+        Finds a step size satisfying the strong Wolfe conditions along direction (Nocedal and Wright, Algorithm 3.5
+        and 3.6). When it returns, the arena holds the accepted point and its gradient.
+
+        Output:
+            step_size: the accepted step size, or None if the line search failed.
+            loss: the loss at the accepted point.
+        """
+        c1, c2 = self._c1, self._c2
+
+        def phi(alpha):
+            np.multiply(direction, alpha, out=self._variable)
+            self._variable += origin
+            value = self._evaluate()
+            return value, float(np.dot(self._gradient, direction))
+
+        def zoom(low, high, low_loss, low_slope, high_loss, num_evaluations):
+            while num_evaluations < self._max_linesearch:
+                width = high - low
+                # quadratic interpolation from the low end, safeguarded towards the middle of the interval.
+                denominator = 2. * (high_loss - low_loss - low_slope * width)
+                alpha = low - low_slope * width * width / denominator if denominator > 0 else low + width / 2.
+                if not min(low, high) + 0.1 * abs(width) <= alpha <= max(low, high) - 0.1 * abs(width):
+                    alpha = low + width / 2.
+                value, derivative = phi(alpha)
+                num_evaluations += 1
+                if value > loss + c1 * alpha * slope or value >= low_loss:
+                    high, high_loss = alpha, value
+                else:
+                    if abs(derivative) <= -c2 * slope:
+                        return alpha, value
+                    if derivative * width >= 0:
+                        high, high_loss = low, low_loss
+                    low, low_loss, low_slope = alpha, value, derivative
+            return None, loss
+
+        previous, previous_loss, previous_slope = 0., loss, slope
+        alpha = step_size
+        for num_evaluations in range(1, self._max_linesearch + 1):
+            value, derivative = phi(alpha)
+            if value > loss + c1 * alpha * slope or (num_evaluations > 1 and value >= previous_loss):
+                return zoom(previous, alpha, previous_loss, previous_slope, value, num_evaluations)
+            if abs(derivative) <= -c2 * slope:
+                return alpha, value
+            if derivative >= 0:
+                return zoom(alpha, previous, value, derivative, previous_loss, num_evaluations)
+            previous, previous_loss, previous_slope = alpha, value, derivative
+            alpha *= 2.
+        return None, loss
+
+    def solve(self,
+              my_net: net.Net):
+        """
+        Solves the net.
+        """
+        self._net = my_net
+        # run an execute pass to initialize all the parameters
+        my_net.execute()
+        self._build_arena()
+        self._num_evaluations = 0
+        if self._monitor is not None:
+            self._monitor.start()
+        origin = self._variable.copy()
+        previous_gradient = np.empty_like(self._gradient)
+        direction = np.empty_like(self._gradient)
+        # the loss can not decrease by less than the precision of the dtype.
+        tol = max(self._tol, 10 * np.finfo(self._variable.dtype).eps)
+        loss = origin_loss = 0.
+        message = 'Maximum number of iterations reached.'
+        iteration = 0
+        try:
+            loss = origin_loss = self._evaluate()
+            logging.info('Initial loss: {}'.format(loss))
+            for iteration in range(1, self._max_iter + 1):
+                if np.abs(self._gradient).max() <= self._gtol:
+                    message = 'The gradient is below gtol.'
+                    break
+                self._direction(direction)
+                slope = float(np.dot(self._gradient, direction))
+                if slope >= 0:
+                    # not a descent direction: restart from the steepest descent.
+                    self._num_history = 0
+                    np.negative(self._gradient, out=direction)
+                    slope = float(np.dot(self._gradient, direction))
+                step_size = 1. if self._num_history else 1. / np.sqrt(-slope)
+                previous_gradient[:] = self._gradient
+                step_size, new_loss = self._line_search(origin, direction, loss, slope, step_size)
+                if step_size is None:
+                    message = 'The line search failed.'
+                    break
+                # store the step and the gradient change in the history.
+                index = (self._newest + 1) % self._memory
+                np.subtract(self._variable, origin, out=self._steps[index])
+                np.subtract(self._gradient, previous_gradient, out=self._changes[index])
+                curvature = float(np.dot(self._steps[index], self._changes[index]))
+                if curvature > 1e-10:
+                    self._rhos[index] = 1. / curvature
+                    self._newest = index
+                    self._num_history = min(self._num_history + 1, self._memory)
+                decrease = (loss - new_loss) / max(abs(loss), abs(new_loss), 1.)
+                loss = origin_loss = new_loss
+                origin[:] = self._variable
+                if self._monitor is not None:
+                    self._monitor.iteration(loss, float(np.sqrt(np.dot(self._gradient, self._gradient))),
+                                            step_size * float(np.sqrt(np.dot(direction, direction))))
+                if decrease <= tol:
+                    message = 'The relative decrease of the loss is below tol.'
+                    break
+        except StopSolving as stop:
+            message = 'STOPPED: {}'.format(stop)
+        # go back to the last accepted point, in case the solver stopped in the middle of a line search.
+        self._variable[:] = origin
+        self._mark_params_changed()
+        loss = origin_loss
+        self._info = {'nit': iteration, 'funcalls': self._num_evaluations, 'loss': loss, 'task': message}
+        logging.info('Final loss: {0} ({1})'.format(loss, message))
+
+    def info(self):
+        """
+        Returns the information dictionary of the last solve, with the number of iterations 'nit', the number of
+        function evaluations 'funcalls', the final 'loss', and the reason the solver stopped 'task'.
+        """
+        return self._info
@@ -1 +1,5 @@
 from decaf.optimization.lbfgs_solver import LBFGSSolver
+from decaf.optimization.hogwild_solver import HogwildSolver
+from decaf.optimization.owlqn_solver import OWLQNSolver
+from decaf.optimization.arena_lbfgs_solver import ArenaLBFGSSolver
+from decaf.optimization.newton_cg_solver import NewtonCGSolver
@@ -0,0 +1,211 @@
+"""Implements a lock-free, shared-memory parallel SGD solver (Hogwild)."""
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import os
+import queue as queue_module
+import traceback
+import typing
+
+from decaf import net
+from decaf.base import DecafError, Solver
+from decaf.optimization.monitor import SolverMonitor, StopSolving
+from decaf.util import util
+
+
+class HogwildSolver(Solver):
+    """
+    The Hogwild solver runs mini-batch SGD in several processes on a single machine, without MPI.
+
+    The parameters of the net are moved into shared memory. Worker processes are forked from the current process, so
+    each of them holds a replica of the net whose parameter blobs are views of that shared memory. Every worker runs the
+    net on its own shard of the mini-batches, and applies its updates to the shared parameters without any locking.
+    This works well for sparse and linear models, where concurrent updates rarely conflict.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        The Hogwild solver. Optional args are:
+            num_workers: the number of worker processes. Default os.cpu_count().
+            base_lr: the learning rate. The gradient is averaged over the mini-batch. Default 0.01.
+            batch_size: the mini-batch size. Default 100.
+            num_epochs: the number of passes every worker makes over its shard of the data. Default 1.
+            monitor: a decaf.optimization.monitor.SolverMonitor. Every epoch, once all the workers have finished it,
+                is reported as an iteration with the summed loss of the epoch and the samples/sec of all the workers.
+                The evaluation budget counts mini-batches, and is split evenly between the workers. Default None.
+        The data layers of the net should support DataLayer.set_range().
+        """
+        Solver.__init__(self, **kwargs)
+        self._num_workers: int = self.spec.get('num_workers', os.cpu_count())
+        self._base_lr: float = self.spec.get('base_lr', 0.01)
+        self._batch_size: int = self.spec.get('batch_size', 100)
+        self._num_epochs: int = self.spec.get('num_epochs', 1)
+        self._monitor: typing.Optional[SolverMonitor] = self.spec.get('monitor', None)
+        self._net: typing.Optional[net.Net] = None
+        self._data_layers: list = []
+        self._stats: typing.List[dict] = []
+
+    def _set_range(self,
+                   start: typing.Optional[int] = None,
+                   stop: typing.Optional[int] = None):
+        for layer in self._data_layers:
+            layer.set_range(start, stop)
+
+    def _worker(self,
+                rank: int,
+                num_data: int,
+                queue: multiprocessing.Queue,
+                stop_event: multiprocessing.Event,
+                max_batches: typing.Optional[int]):
+        """
+        The worker loop. It runs in a forked process, writes its progress to the queue after every epoch, and its
+        statistics when done. It stops early when stop_event is set or after max_batches mini-batches.
+        """
+        try:
+            np.random.seed((os.getpid() * 7919 + rank) % (2 ** 32))
+            starts = np.arange(0, num_data, self._batch_size)[rank::self._num_workers]
+            params = self._net.params()
+            timer = util.Timer()
+            num_samples = 0
+            num_batches = 0
+            loss = 0.
+            stopped = False
+            for epoch in range(self._num_epochs):
+                np.random.shuffle(starts)
+                loss = 0.
+                epoch_samples = 0
+                for start in starts:
+                    if stop_event.is_set() or num_batches == max_batches:
+                        stopped = True
+                        break
+                    stop = min(start + self._batch_size, num_data)
+                    self._set_range(start, stop)
+                    loss += self._net.execute()
+                    for param in params:
+                        param.diff()[...] *= -self._base_lr / (stop - start)
+                    self._net.update()
+                    num_samples += stop - start
+                    epoch_samples += stop - start
+                    num_batches += 1
+                if stopped:
+                    break
+                queue.put({'worker': rank, 'epoch': epoch, 'loss': loss, 'samples': epoch_samples})
+            elapsed = timer.total(False)
+            queue.put({'worker': rank,
+                       'samples': num_samples,
+                       'time': elapsed,
+                       'samples_per_sec': num_samples / max(elapsed, 1e-12),
+                       'last_epoch_loss': loss})
+        except Exception:
+            queue.put({'worker': rank, 'error': traceback.format_exc()})
+
+    def solve(self,
+              my_net: net.Net):
+        """
+        Solves the net.
+        """
+        self._net = my_net
+        self._data_layers = [layer for layer in my_net.data_layers() if layer.num_data() is not None]
+        if not self._data_layers:
+            raise DecafError('The Hogwild solver needs data layers that support set_range().')
+        num_data = self._data_layers[0].num_data()
+        # run one mini-batch to initialize all the parameters
+        self._set_range(0, self._batch_size)
+        my_net.execute()
+        params = my_net.params()
+        # move the parameters into shared memory.
+        offsets = []
+        total = 0
+        for param in params:
+            offsets.append(total)
+            total += (param.data().nbytes + 63) // 64 * 64
+        shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+        try:
+            for param, offset in zip(params, offsets):
+                data = param.data()
+                shared = np.ndarray(data.shape, data.dtype, buffer=shm.buf, offset=offset)
+                shared[...] = data
+                param.mirror(shared)
+            context = multiprocessing.get_context('fork')
+            queue = context.Queue()
+            stop_event = context.Event()
+            max_batches = None
+            if self._monitor is not None:
+                self._monitor.start()
+                if self._monitor.max_evaluations is not None:
+                    max_batches = -(-self._monitor.max_evaluations // self._num_workers)
+            workers = [context.Process(target=self._worker, args=(rank, num_data, queue, stop_event, max_batches))
+                       for rank in range(self._num_workers)]
+            for worker in workers:
+                worker.start()
+            try:
+                stats = self._collect(queue, stop_event, workers)
+            finally:
+                # if a worker died, the others are stopped before the shared memory goes away.
+                stop_event.set()
+                for worker in workers:
+                    worker.join()
+        finally:
+            # copy the parameters back to private memory before releasing the shared block.
+            for param in params:
+                param.mirror(param.data().copy())
+            self._set_range()
+            shm.close()
+            shm.unlink()
+        self._stats = sorted(stats, key=lambda record: record['worker'])
+        for record in self._stats:
+            if 'error' in record:
+                raise DecafError('Hogwild worker {0} failed:\n{1}'.format(record['worker'], record['error']))
+            logging.info('Worker {worker}: {samples} samples in {time:.2f}s, {samples_per_sec:.1f} samples/sec'
+                         .format(**record))
+        logging.info('Total throughput: {:.1f} samples/sec'.format(sum(r['samples_per_sec'] for r in self._stats)))
+
+    def _collect(self,
+                 queue: multiprocessing.Queue,
+                 stop_event: multiprocessing.Event,
+                 workers: typing.List[multiprocessing.Process]):
+        """
+        Receives the messages of the workers until all of them are done, reporting the finished epochs to the monitor
+        and setting stop_event when it stops. Returns the final statistics of the workers. Raises a DecafError if a
+        worker process exits without sending its statistics, e.g. when it is killed.
+        """
+        stats = []
+        epochs = {}
+        while len(stats) < self._num_workers:
+            # a worker flushes its messages before it exits, so if it was dead before an empty poll, it will never
+            # send its statistics.
+            done = set(record['worker'] for record in stats)
+            dead = [rank for rank, worker in enumerate(workers) if rank not in done and not worker.is_alive()]
+            try:
+                message = queue.get(timeout=0.05)
+            except queue_module.Empty:
+                message = None
+                if dead:
+                    raise DecafError('Hogwild workers died without finishing: {}'.format(', '.join(
+                        'worker {0} (exit code {1})'.format(rank, workers[rank].exitcode) for rank in dead)))
+            if message is not None and 'epoch' not in message:
+                stats.append(message)
+                continue
+            if self._monitor is None or stop_event.is_set():
+                continue
+            try:
+                if message is None:
+                    self._monitor.check()
+                    continue
+                epoch = epochs.setdefault(message['epoch'], [])
+                epoch.append(message)
+                if len(epoch) == self._num_workers:
+                    self._monitor.iteration(sum(record['loss'] for record in epoch),
+                                            samples=sum(record['samples'] for record in epoch))
+            except StopSolving as stop:
+                logging.info('Stopping the workers: {}'.format(stop))
+                stop_event.set()
+        return stats
+
+    def stats(self):
+        """
+        Returns the per-worker statistics of the last solve: a list of dictionaries with keys 'worker', 'samples',
+        'time', 'samples_per_sec' and 'last_epoch_loss'.
+        """
+        return self._stats
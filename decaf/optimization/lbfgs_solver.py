@@ -1,13 +1,11 @@
 import logging
 
 import typing
-from scipy import optimize
 import numpy as np
 
 from decaf import net
-from decaf.base import Solver, Blob
-
-_FMIN = optimize.fmin_l_bfgs_b
+from decaf.base import DecafError, Solver, Blob
+from decaf.optimization.monitor import SolverMonitor, StopSolving
 
 
 class LBFGSSolver(Solver):
@@ -21,15 +19,32 @@ class LBFGSSolver(Solver):
         """
         The LBFGS solver. Necessary args is:
             lbfgs_args: a dictionary containing the parameters to be passed to lbfgs.
+        Optional args:
+            chunk_size: if given, every evaluation of the objective runs the net on chunks of chunk_size data points
+                and accumulates the loss and gradient over the chunks, so that the activations never hold more than
+                chunk_size data points. The data layers of the net should support DataLayer.set_range(). Since the
+                regularizers are scaled by the number of data points, summing over the chunks counts them exactly
+                once. Default None, which runs the net on all the data at once.
+            monitor: a decaf.optimization.monitor.SolverMonitor that receives the telemetry of every function
+                evaluation and iteration, and may stop the solver early. When it does, the net gets the parameters of
+                the last iteration. Default None.
         """
         Solver.__init__(self, **kwargs)
         self._lbfgs_args: dict = self.spec.get('lbfgs_args', {})
+        self._chunk_size: typing.Optional[int] = self.spec.get('chunk_size', None)
+        self._monitor: typing.Optional[SolverMonitor] = self.spec.get('monitor', None)
         self._param: typing.Optional[Blob] = None
         self._net: typing.Optional[net.Net] = None
+        self._info: dict = {}
+        # the loss of the last evaluation, and the last iterate with its loss.
+        self._last_loss: float = 0.
+        self._last_iterate: typing.Optional[np.ndarray] = None
+        self._last_iterate_loss: float = 0.
 
-    def _collect_params(self, re_alloc=False):
+    def _collect_params(self, re_alloc=False, accumulate=False):
         """
-        Collect the network parameters into a long vector
+        Collect the network parameters into a long vector. If accumulate is True, the gradients are added to the
+        collected ones instead of replacing them.
         """
         params_list = self._net.params()
         if self._param is None or re_alloc:
@@ -40,10 +55,37 @@ class LBFGSSolver(Solver):
         current = 0
         for param in params_list:
             size = param.data().size
-            self._param.data()[current: current + size] = param.data().flat
-            self._param.diff()[current: current + size] = param.diff().flat
+            if accumulate:
+                self._param.diff()[current: current + size] += param.diff().flat
+            else:
+                self._param.data()[current: current + size] = param.data().flat
+                self._param.diff()[current: current + size] = param.diff().flat
             current += size
 
+    def _execute(self, re_alloc=False):
+        """
+        Run the net, either on all the data or chunk by chunk, and collect the parameters and their gradients.
+        """
+        if self._chunk_size is None:
+            loss = self._net.execute()
+            self._collect_params(re_alloc)
+            return loss
+        data_layers = [layer for layer in self._net.data_layers() if layer.num_data() is not None]
+        if not data_layers:
+            raise DecafError('Chunked execution needs data layers that support set_range().')
+        num_data = data_layers[0].num_data()
+        loss = 0.
+        try:
+            for start in range(0, num_data, self._chunk_size):
+                for layer in data_layers:
+                    layer.set_range(start, start + self._chunk_size)
+                loss += self._net.execute()
+                self._collect_params(re_alloc and start == 0, accumulate=start > 0)
+        finally:
+            for layer in data_layers:
+                layer.set_range()
+        return loss
+
     def _distribute_params(self):
         """
         Distribute the parameter to the net
@@ -53,6 +95,7 @@ class LBFGSSolver(Solver):
         for param in params_list:
             size = param.data().size
             param.data().flat = self._param.data()[current: current+size]
+            param.mark_changed()
             current += size
 
     def obj(self,
@@ -62,8 +105,10 @@ class LBFGSSolver(Solver):
         """
         self._param.data()[:] = variable
         self._distribute_params()
-        loss = self._net.execute()
-        self._collect_params()
+        loss = self._execute()
+        self._last_loss = loss
+        if self._monitor is not None:
+            self._monitor.evaluation(loss, self._param.diff())
         return loss, self._param.diff()
 
     def solve(self,
@@ -73,12 +118,48 @@ class LBFGSSolver(Solver):
         """
         # first, run an execute pass to initialize all the parameters
         self._net = my_net
-        initial_loss = my_net.execute()
+        initial_loss = self._execute(True)
         logging.info('Initial loss: {}'.format(initial_loss))
-        self._collect_params(True)
-        # now, run LBFGS
-        result = _FMIN(lambda x: self.obj(x), self._param.data(), **self._lbfgs_args)
+        # now, run LBFGS. scipy is imported here so that importing the solvers stays cheap.
+        from scipy import optimize
+        lbfgs_args = dict(self._lbfgs_args)
+        monitor = self._monitor
+        if monitor is not None:
+            monitor.start()
+            lbfgs_args['callback'] = self._iteration_callback(lbfgs_args.get('callback', None))
+        self._last_iterate = self._param.data().copy()
+        self._last_iterate_loss = initial_loss
+        try:
+            result = optimize.fmin_l_bfgs_b(lambda x: self.obj(x), self._param.data(), **lbfgs_args)
+        except StopSolving as stop:
+            result = (self._last_iterate, self._last_iterate_loss,
+                      {'nit': monitor.num_iterations, 'funcalls': monitor.num_evaluations,
+                       'task': 'STOPPED: {}'.format(stop)})
         # put the optimized result to the net
         self._param.data()[:] = result[0]
         self._distribute_params()
+        self._info = result[2]
         logging.info('Final function value: {}'.format(result[1]))
+
+    def _iteration_callback(self,
+                            user_callback: typing.Optional[typing.Callable]):
+        """
+        Returns the per-iteration callback for scipy, which reports the iteration to the monitor and keeps the iterate.
+        """
+        def callback(variable):
+            step_size = float(np.sqrt(np.sum((variable - self._last_iterate) ** 2)))
+            self._last_iterate = variable.copy()
+            self._last_iterate_loss = self._last_loss
+            if user_callback is not None:
+                user_callback(variable)
+            gradient = self._param.diff()
+            self._monitor.iteration(self._last_loss, float(np.sqrt(np.dot(gradient, gradient))), step_size)
+        return callback
+
+    def info(self):
+        """
+        Returns the information dictionary of the last solve, as returned by scipy's fmin_l_bfgs_b. It contains, among
+        others, the number of iterations 'nit' and the number of function evaluations 'funcalls'. If the monitor
+        stopped the solver, 'task' starts with 'STOPPED:' followed by the reason.
+        """
+        return self._info
@@ -0,0 +1,136 @@
+"""Implements the telemetry and the budgets shared by the solvers."""
+import typing
+
+import numpy as np
+
+from decaf.base import DecafError
+from decaf.util import util
+
+
+class StopSolving(DecafError):
+    """Raised by a SolverMonitor when a budget is exhausted or a callback asks the solver to stop."""
+    pass
+
+
+class SolverMonitor(object):
+    """
+    SolverMonitor receives a record for every function evaluation and every iteration of a solver, passes it to the
+    callbacks, and stops the solver when a budget is exhausted.
+
+    A record is a dictionary with the keys
+        'kind': 'evaluation' or 'iteration'.
+        'index': the number of evaluations or iterations so far, including this one.
+        'loss': the objective value.
+        'gradient_norm': the norm of the gradient, or None if the solver does not report it.
+        'step_size': (iterations only) the norm of the parameter change, or None.
+        'time': the wall time in seconds since the solver started.
+        'samples_per_sec': (stochastic solvers only) the number of data points processed per second since the last
+            record of the same kind.
+    The records are also kept in monitor.records. Pass the monitor to a solver with the 'monitor' keyword.
+    """
+
+    def __init__(self,
+                 callbacks: typing.Optional[typing.List[typing.Callable]] = None,
+                 max_time: typing.Optional[float] = None,
+                 max_evaluations: typing.Optional[int] = None,
+                 min_improvement: typing.Optional[float] = None):
+        """
+        Initializes the monitor.
+
+        Input:
+            callbacks: (optional) a list of functions that take a record. If a callback returns True, the solver stops.
+            max_time: (optional) the wall-clock budget in seconds.
+            max_evaluations: (optional) the budget of function evaluations. For stochastic solvers, every mini-batch
+                counts as one evaluation.
+            min_improvement: (optional) the solver stops when an iteration decreases the loss by less than this
+                fraction of the previous loss.
+        """
+        self._callbacks: typing.List[typing.Callable] = callbacks or []
+        self.max_time: typing.Optional[float] = max_time
+        self.max_evaluations: typing.Optional[int] = max_evaluations
+        self.min_improvement: typing.Optional[float] = min_improvement
+        self._timer: util.Timer = util.Timer()
+        self._last_time: dict = {}
+        self._last_loss: typing.Optional[float] = None
+        self.num_evaluations: int = 0
+        self.num_iterations: int = 0
+        self.records: typing.List[dict] = []
+        self.stop_reason: typing.Optional[str] = None
+
+    def start(self):
+        """Resets the clock and the counters. Solvers call this when they start solving."""
+        self._timer.reset()
+        self._last_time = {'evaluation': 0., 'iteration': 0.}
+        self._last_loss = None
+        self.num_evaluations = 0
+        self.num_iterations = 0
+        self.records = []
+        self.stop_reason = None
+
+    def elapsed(self):
+        """Returns the wall time in seconds since the solver started."""
+        return self._timer.total(False)
+
+    def _stop(self,
+              reason: str):
+        self.stop_reason = reason
+        raise StopSolving(reason)
+
+    def _emit(self,
+              record: dict,
+              samples: typing.Optional[int]):
+        now = record['time']
+        if samples is not None:
+            record['samples_per_sec'] = samples / max(now - self._last_time[record['kind']], 1e-12)
+        self._last_time[record['kind']] = now
+        self.records.append(record)
+        for callback in self._callbacks:
+            if callback(record) is True:
+                self._stop('A callback asked to stop.')
+
+    def check(self):
+        """Raises StopSolving if the wall-clock budget is exhausted."""
+        if self.max_time is not None and self.elapsed() >= self.max_time:
+            self._stop('The time budget of {0}s is exhausted.'.format(self.max_time))
+
+    def evaluation(self,
+                   loss: float,
+                   gradient: typing.Optional[np.ndarray] = None,
+                   samples: typing.Optional[int] = None):
+        """
+        Records a function evaluation. Raises StopSolving if a budget is exhausted.
+        """
+        self.num_evaluations += 1
+        record = {'kind': 'evaluation',
+                  'index': self.num_evaluations,
+                  'loss': float(loss),
+                  'gradient_norm': None if gradient is None else float(np.sqrt(np.dot(gradient, gradient))),
+                  'time': self.elapsed()}
+        self._emit(record, samples)
+        if self.max_evaluations is not None and self.num_evaluations >= self.max_evaluations:
+            self._stop('The budget of {0} function evaluations is exhausted.'.format(self.max_evaluations))
+        self.check()
+
+    def iteration(self,
+                  loss: float,
+                  gradient_norm: typing.Optional[float] = None,
+                  step_size: typing.Optional[float] = None,
+                  samples: typing.Optional[int] = None):
+        """
+        Records an iteration. Raises StopSolving if a budget is exhausted or the loss stopped improving.
+        """
+        self.num_iterations += 1
+        record = {'kind': 'iteration',
+                  'index': self.num_iterations,
+                  'loss': float(loss),
+                  'gradient_norm': gradient_norm,
+                  'step_size': step_size,
+                  'time': self.elapsed()}
+        self._emit(record, samples)
+        last_loss = self._last_loss
+        self._last_loss = float(loss)
+        if self.min_improvement is not None and last_loss is not None:
+            improvement = (last_loss - loss) / max(abs(last_loss), 1e-12)
+            if improvement < self.min_improvement:
+                self._stop('The relative improvement {0:.3g} is below {1}.'.format(improvement, self.min_improvement))
+        self.check()
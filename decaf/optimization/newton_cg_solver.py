@@ -0,0 +1,177 @@
+"""Implements a truncated Newton-CG (Hessian-free) solver that uses Hessian-vector products through the net."""
+import logging
+import typing
+
+import numpy as np
+
+from decaf import net
+from decaf.base import DecafError
+from decaf.optimization.arena_lbfgs_solver import ArenaLBFGSSolver
+from decaf.optimization.monitor import StopSolving
+
+
+class NewtonCGSolver(ArenaLBFGSSolver):
+    """
+    A truncated Newton solver (Martens, Deep learning via Hessian-free optimization, ICML 2010).
+
+    Every iteration approximately solves the Newton system H d = -g with the conjugate gradient method, where the
+    products of H with a vector are computed exactly through the net with the R operator (see Net.execute_r()), so the
+    Hessian is never formed. The step is then taken with the strong Wolfe line search of ArenaLBFGSSolver, which
+    accepts the full Newton step whenever it is good enough. Unlike L-BFGS, the curvature information is exact at
+    every iteration, so badly scaled problems do not need many passes to learn it.
+
+    Every layer of the net with parameters must implement the R operator. With gauss_newton set (the default), the
+    Gauss-Newton matrix is used, which is positive semi-definite for the convex losses and thus always gives a descent
+    direction. One Hessian-vector product costs about as much as one gradient evaluation.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        The Newton-CG solver. Optional args are:
+            gauss_newton: if True, use Gauss-Newton-vector products instead of Hessian-vector products. Default True.
+            max_iter: the maximum number of Newton iterations. Default 100.
+            cg_iter: the maximum number of conjugate gradient steps in one iteration. Default 50.
+            damping: a multiple of the identity added to the curvature matrix. Default 0.
+            tol, gtol, c1, c2, max_linesearch, monitor: see ArenaLBFGSSolver.
+        """
+        if kwargs.get('chunk_size', None) is not None:
+            raise DecafError('NewtonCGSolver does not support chunk_size.')
+        ArenaLBFGSSolver.__init__(self, **kwargs)
+        self._gauss_newton: bool = self.spec.get('gauss_newton', True)
+        self._max_iter: int = self.spec.get('max_iter', 100)
+        self._cg_iter: int = self.spec.get('cg_iter', 50)
+        self._damping: float = self.spec.get('damping', 0.)
+        # no L-BFGS history is kept.
+        self._memory = 0
+        # the direction of the parameters and the curvature-vector product, mirrored by net.r_params().
+        self._direction_r: typing.Optional[np.ndarray] = None
+        self._product: typing.Optional[np.ndarray] = None
+        self._num_products: int = 0
+
+    def _build_arena(self):
+        """
+        Moves the parameters of the net into the arena, and the R operator blobs of the parameters into a second one.
+        """
+        ArenaLBFGSSolver._build_arena(self)
+        params = self._net.params()
+        r_params = self._net.r_params()
+        if len(r_params) != len(params):
+            raise DecafError('Some layers of the net do not implement the R operator.')
+        self._direction_r = np.zeros_like(self._variable)
+        self._product = np.zeros_like(self._variable)
+        current = 0
+        for param, r_param in zip(params, r_params):
+            shape = param.data().shape
+            r_param.mirror(self._direction_r[current:current + param.data().size], shape)
+            r_param.mirror_diff(self._product[current:current + param.data().size], shape)
+            current += param.data().size
+
+    def _curvature_product(self,
+                           vector: np.ndarray,
+                           out: np.ndarray):
+        """
+        Computes the product of the curvature matrix at the parameters in the arena with vector into out. The net must
+        have been executed at these parameters.
+        """
+        self._num_products += 1
+        self._direction_r[:] = vector
+        self._net.execute_r(self._gauss_newton)
+        out[:] = self._product
+        if self._damping:
+            out += self._damping * vector
+        if self._monitor is not None:
+            self._monitor.check()
+
+    def _conjugate_gradient(self,
+                            out: np.ndarray,
+                            initial_norm: float):
+        """
+        Approximately solves H d = -g for the gradient g in the arena into out, starting from zero. The iterations stop
+        when the residual falls below min(0.5, sqrt(|g| / |g0|)) * |g|, where g0 is the initial gradient (Nocedal and
+        Wright, Algorithm 7.1, made invariant to the scale of the loss), or at the first direction of non-positive
+        curvature, in which case the steepest descent is used if no step was taken yet.
+        """
+        out[:] = 0
+        residual = self._gradient.astype(out.dtype, copy=True)
+        search = -residual
+        product = np.empty_like(out)
+        residual_norm = float(np.dot(residual, residual))
+        gradient_norm = np.sqrt(residual_norm)
+        tolerance = min(0.5, np.sqrt(gradient_norm / initial_norm)) * gradient_norm
+        for step in range(self._cg_iter):
+            if np.sqrt(residual_norm) <= tolerance:
+                break
+            self._curvature_product(search, product)
+            curvature = float(np.dot(search, product))
+            if curvature <= 0:
+                if step == 0:
+                    out[:] = search
+                break
+            alpha = residual_norm / curvature
+            out += alpha * search
+            residual += alpha * product
+            new_residual_norm = float(np.dot(residual, residual))
+            search *= new_residual_norm / residual_norm
+            search -= residual
+            residual_norm = new_residual_norm
+
+    def solve(self,
+              my_net: net.Net):
+        """
+        Solves the net.
+        """
+        self._net = my_net
+        # run an execute pass to initialize all the parameters
+        my_net.execute()
+        self._build_arena()
+        self._num_evaluations = 0
+        self._num_products = 0
+        if self._monitor is not None:
+            self._monitor.start()
+        origin = self._variable.copy()
+        direction = np.empty_like(self._gradient)
+        tol = max(self._tol, 10 * np.finfo(self._variable.dtype).eps)
+        loss = origin_loss = 0.
+        message = 'Maximum number of iterations reached.'
+        iteration = 0
+        try:
+            loss = origin_loss = self._evaluate()
+            logging.info('Initial loss: {}'.format(loss))
+            initial_norm = max(float(np.sqrt(np.dot(self._gradient, self._gradient))), 1e-300)
+            for iteration in range(1, self._max_iter + 1):
+                if np.abs(self._gradient).max() <= self._gtol:
+                    message = 'The gradient is below gtol.'
+                    break
+                self._conjugate_gradient(direction, initial_norm)
+                slope = float(np.dot(self._gradient, direction))
+                if slope >= 0:
+                    np.negative(self._gradient, out=direction)
+                    slope = float(np.dot(self._gradient, direction))
+                step_size, new_loss = self._line_search(origin, direction, loss, slope, 1.)
+                if step_size is None:
+                    message = 'The line search failed.'
+                    break
+                decrease = (loss - new_loss) / max(abs(loss), abs(new_loss), 1.)
+                loss = origin_loss = new_loss
+                origin[:] = self._variable
+                if self._monitor is not None:
+                    self._monitor.iteration(loss, float(np.sqrt(np.dot(self._gradient, self._gradient))),
+                                            step_size * float(np.sqrt(np.dot(direction, direction))))
+                if decrease <= tol:
+                    message = 'The relative decrease of the loss is below tol.'
+                    break
+        except StopSolving as stop:
+            message = 'STOPPED: {}'.format(stop)
+        self._variable[:] = origin
+        self._mark_params_changed()
+        loss = origin_loss
+        self._info = {'nit': iteration, 'funcalls': self._num_evaluations, 'hessian_products': self._num_products,
+                      'loss': loss, 'task': message}
+        logging.info('Final loss: {0} ({1})'.format(loss, message))
+
+    def info(self):
+        """
+        Returns the information dictionary of the last solve, with the same keys as ArenaLBFGSSolver, and the number
+        of curvature-vector products 'hessian_products'.
+        """
+        return self._info
@@ -0,0 +1,212 @@
+"""Implements the orthant-wise limited-memory quasi-Newton (OWL-QN) solver for L1 regularized objectives."""
+import logging
+import typing
+
+import numpy as np
+
+from decaf import net
+from decaf.base import DecafError
+from decaf.optimization.lbfgs_solver import LBFGSSolver
+from decaf.optimization.monitor import StopSolving
+
+
+def _two_loop(gradient: np.ndarray,
+              steps: typing.List[np.ndarray],
+              changes: typing.List[np.ndarray]):
+    """
+    The L-BFGS two-loop recursion: returns the product of the inverse Hessian approximation, defined by the parameter
+    steps and the gradient changes (oldest first), with the gradient.
+    """
+    direction = gradient.copy()
+    alphas = []
+    rhos = [1. / np.dot(step, change) for step, change in zip(steps, changes)]
+    for step, change, rho in reversed(list(zip(steps, changes, rhos))):
+        alpha = rho * np.dot(step, direction)
+        direction -= alpha * change
+        alphas.append(alpha)
+    if steps:
+        direction *= np.dot(steps[-1], changes[-1]) / np.dot(changes[-1], changes[-1])
+    for step, change, rho, alpha in zip(steps, changes, rhos, reversed(alphas)):
+        beta = rho * np.dot(change, direction)
+        direction += (alpha - beta) * step
+    return direction
+
+
+class OWLQNSolver(LBFGSSolver):
+    """
+    The OWL-QN solver (Andrew and Gao, Scalable training of L1-regularized log-linear models, ICML 2007).
+
+    It minimizes the loss of the net plus l1_weight * num_data * |w|_1 over the chosen parameters. The L1 term is
+    handled by the solver itself: the search directions are computed from the pseudo-gradient, and every step is kept
+    within one orthant, so that parameters that cross zero are set to exactly zero. The L1 term should therefore not
+    also be added as a regularizer in the net.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        The OWL-QN solver. Necessary args is:
+            l1_weight: the weight of the L1 term. Like decaf.layers.regularization.L1Regularizer, it is scaled by the
+                number of data points.
+        Optional args:
+            l1_params: the indices of the parameters in net.params() that the L1 term applies to. Default all.
+            num_data: the number of data points. Default the num_data() of the data layers of the net.
+            memory: the number of past updates used to approximate the Hessian. Default 10.
+            max_iter: the maximum number of iterations. Default 100.
+            tol: the solver stops when the relative decrease of the objective falls below tol. Default 1e-7.
+            chunk_size: see LBFGSSolver.
+            monitor: see LBFGSSolver. The monitor receives the objective including the L1 term, and the norm of the
+                pseudo-gradient at every iteration.
+        """
+        LBFGSSolver.__init__(self, **kwargs)
+        self._l1_weight: float = self.spec['l1_weight']
+        self._l1_params: typing.Optional[typing.List[int]] = self.spec.get('l1_params', None)
+        self._num_data: typing.Optional[int] = self.spec.get('num_data', None)
+        self._memory: int = self.spec.get('memory', 10)
+        self._max_iter: int = self.spec.get('max_iter', 100)
+        self._tol: float = self.spec.get('tol', 1e-7)
+        self._num_evaluations: int = 0
+
+    def _l1_vector(self):
+        """Returns the per-entry weight of the L1 term on the flattened parameter vector."""
+        num_data = self._num_data
+        if num_data is None:
+            sizes = [layer.num_data() for layer in self._net.data_layers() if layer.num_data() is not None]
+            if not sizes:
+                raise DecafError('Pass num_data to the OWL-QN solver if the data layers do not report it.')
+            num_data = sizes[0]
+        params = self._net.params()
+        indices = range(len(params)) if self._l1_params is None else self._l1_params
+        l1_vector = np.zeros(self._param.data().size)
+        offsets = np.cumsum([0] + [param.data().size for param in params])
+        for index in indices:
+            l1_vector[offsets[index]:offsets[index + 1]] = self._l1_weight * num_data
+        return l1_vector
+
+    def _evaluate(self,
+                  variable: np.ndarray):
+        """Returns the smooth loss and a copy of its gradient at variable."""
+        self._num_evaluations += 1
+        self._param.data()[:] = variable
+        self._distribute_params()
+        loss = self._execute()
+        return loss, self._param.diff().copy()
+
+    @staticmethod
+    def pseudo_gradient(variable: np.ndarray,
+                        gradient: np.ndarray,
+                        l1_vector: np.ndarray):
+        """
+        Returns the pseudo-gradient of loss + |l1_vector * variable|_1: the gradient where the variable is nonzero,
+        and the one-sided derivative of steepest descent where it is zero (or zero if neither side descends).
+        """
+        pseudo = gradient + l1_vector * np.sign(variable)
+        zero = (variable == 0)
+        right = gradient + l1_vector
+        left = gradient - l1_vector
+        pseudo[zero] = np.where(right[zero] < 0, right[zero], np.where(left[zero] > 0, left[zero], 0.))
+        return pseudo
+
+    def solve(self,
+              my_net: net.Net):
+        """
+        Solves the net.
+        """
+        self._net = my_net
+        self._execute(True)
+        l1_vector = self._l1_vector()
+        self._num_evaluations = 0
+        monitor = self._monitor
+        if monitor is not None:
+            monitor.start()
+        variable = self._param.data().copy()
+        loss, gradient = self._evaluate(variable)
+        objective = loss + np.dot(l1_vector, np.abs(variable))
+        logging.info('Initial objective: {}'.format(objective))
+        self._last_iterate, self._last_iterate_loss = variable, objective
+        try:
+            if monitor is not None:
+                monitor.evaluation(objective, gradient)
+            iteration, message, variable, objective = self._iterate(variable, gradient, objective, l1_vector)
+        except StopSolving as stop:
+            iteration, message, variable, objective = (monitor.num_iterations, 'STOPPED: {}'.format(stop),
+                                                       self._last_iterate, self._last_iterate_loss)
+        # put the optimized result to the net
+        self._param.data()[:] = variable
+        self._distribute_params()
+        self._info = {'nit': iteration,
+                      'funcalls': self._num_evaluations,
+                      'objective': objective,
+                      'num_zeros': int(np.sum((variable == 0) & (l1_vector > 0))),
+                      'task': message}
+        logging.info('Final objective: {0} ({1})'.format(objective, message))
+
+    def _iterate(self,
+                 variable: np.ndarray,
+                 gradient: np.ndarray,
+                 objective: float,
+                 l1_vector: np.ndarray):
+        """
+        Runs the OWL-QN iterations from the given point.
+
+        Output:
+            iteration: the number of iterations.
+            message: the reason the iterations stopped.
+            variable, objective: the final point and its objective.
+        """
+        monitor = self._monitor
+        steps = []
+        changes = []
+        message = 'Maximum number of iterations reached.'
+        iteration = 0
+        for iteration in range(1, self._max_iter + 1):
+            pseudo = self.pseudo_gradient(variable, gradient, l1_vector)
+            if not pseudo.any():
+                message = 'The pseudo-gradient is zero.'
+                break
+            direction = -_two_loop(pseudo, steps, changes)
+            # keep only the components that descend along the pseudo-gradient.
+            direction[direction * pseudo >= 0] = 0.
+            # the orthant of the step: the sign of the variable, or of the steepest descent where it is zero.
+            orthant = np.where(variable != 0, np.sign(variable), -np.sign(pseudo))
+            step_size = 1. / np.sqrt(np.dot(pseudo, pseudo)) if not steps else 1.
+            while True:
+                candidate = variable + step_size * direction
+                candidate[np.sign(candidate) != orthant] = 0.
+                new_loss, new_gradient = self._evaluate(candidate)
+                new_objective = new_loss + np.dot(l1_vector, np.abs(candidate))
+                if monitor is not None:
+                    monitor.evaluation(new_objective, new_gradient)
+                if new_objective <= objective + 1e-4 * np.dot(pseudo, candidate - variable):
+                    break
+                step_size *= 0.5
+                if step_size < 1e-20:
+                    break
+            if new_objective > objective:
+                message = 'The line search failed.'
+                break
+            step = candidate - variable
+            change = new_gradient - gradient
+            if np.dot(step, change) > 1e-10:
+                steps.append(step)
+                changes.append(change)
+                if len(steps) > self._memory:
+                    steps.pop(0)
+                    changes.pop(0)
+            decrease = (objective - new_objective) / max(abs(objective), 1.)
+            variable, gradient, objective = candidate, new_gradient, new_objective
+            self._last_iterate, self._last_iterate_loss = variable, objective
+            if monitor is not None:
+                monitor.iteration(objective, float(np.sqrt(np.dot(pseudo, pseudo))),
+                                  float(np.sqrt(np.dot(step, step))))
+            if decrease < self._tol:
+                message = 'The relative decrease of the objective is below tol.'
+                break
+        return iteration, message, variable, objective
+
+    def info(self):
+        """
+        Returns the information dictionary of the last solve, with the number of iterations 'nit', the number of
+        function evaluations 'funcalls', the final 'objective', the number of L1 regularized parameters that are
+        exactly zero 'num_zeros', and the reason the solver stopped 'task'.
+        """
+        return self._info
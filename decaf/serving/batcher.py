@@ -0,0 +1,227 @@
+"""
+Implements an asyncio based micro-batcher that coalesces concurrent prediction requests into a single forward pass.
+"""
+import asyncio
+import collections
+from concurrent import futures
+import logging
+import numpy as np
+import time
+import typing
+
+from decaf import net
+from decaf.base import DecafError, PHASE_TEST
+
+
+class InvalidRequestError(DecafError):
+    """Raised when the input of a request does not match the input of the net."""
+    pass
+
+
+class BatcherStats(object):
+    """
+    BatcherStats records the queueing metrics of a MicroBatcher.
+
+    The latencies are kept for the most recent `window` requests, and the percentiles are computed over that window.
+    """
+
+    def __init__(self,
+                 window: int = 10000):
+        self.num_requests: int = 0
+        self.num_batches: int = 0
+        self.num_errors: int = 0
+        self.max_queue_depth: int = 0
+        self.batch_sizes: collections.Counter = collections.Counter()
+        self._queue_wait: collections.deque = collections.deque(maxlen=window)
+        self._service_time: collections.deque = collections.deque(maxlen=window)
+        self._latency: collections.deque = collections.deque(maxlen=window)
+
+    def record_batch(self,
+                     batch_size: int,
+                     service_time: float):
+        self.num_batches += 1
+        self.batch_sizes[batch_size] += 1
+        self._service_time.append(service_time)
+
+    def record_request(self,
+                       queue_wait: float,
+                       latency: float):
+        self.num_requests += 1
+        self._queue_wait.append(queue_wait)
+        self._latency.append(latency)
+
+    def record_queue_depth(self,
+                           depth: int):
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    @staticmethod
+    def _percentiles(values: collections.deque):
+        if not values:
+            return {'p50': 0., 'p99': 0., 'mean': 0.}
+        values = np.asarray(values)
+        return {'p50': float(np.percentile(values, 50)),
+                'p99': float(np.percentile(values, 99)),
+                'mean': float(values.mean())}
+
+    def summary(self):
+        """
+        Returns the metrics as a json-serializable dictionary. Times are in seconds.
+        """
+        num_rows = sum(size * count for size, count in self.batch_sizes.items())
+        return {'num_requests': self.num_requests,
+                'num_batches': self.num_batches,
+                'num_errors': self.num_errors,
+                'max_queue_depth': self.max_queue_depth,
+                'mean_batch_size': num_rows / float(max(self.num_batches, 1)),
+                'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                'queue_wait': self._percentiles(self._queue_wait),
+                'service_time': self._percentiles(self._service_time),
+                'latency': self._percentiles(self._latency)}
+
+
+class MicroBatcher(object):
+    """
+    MicroBatcher wraps a finished Net for serving. Incoming requests are queued, and coalesced into one batch until
+    either max_batch_size rows are collected or the oldest request has waited for max_wait seconds. The batch then goes
+    through a single forward pass, and the output rows are split back to the callers.
+
+    The forward pass runs in a single worker thread, so the event loop keeps accepting requests while the net computes
+    (numpy releases the GIL inside BLAS calls).
+    """
+
+    def __init__(self,
+                 decaf_net: net.Net,
+                 input_layer: str,
+                 output_blob: str,
+                 max_batch_size: int = 64,
+                 max_wait: float = 0.002):
+        """
+        Initializes the micro batcher.
+
+        Input:
+            decaf_net: a finished decaf.net.Net that does not contain loss layers. It is switched to the test phase.
+            input_layer: the name of the NdArrayDataLayer in the net that emits the input.
+            output_blob: the name of the blob to be returned to the callers.
+            max_batch_size: (optional) the maximum number of rows in a batch. Default 64.
+            max_wait: (optional) the maximum time in seconds a request waits for other requests to join its batch.
+                Default 0.002.
+        """
+        self._net: net.Net = decaf_net
+        self._net.set_phase(PHASE_TEST)
+        self._input_layer = decaf_net.layers()[input_layer]
+        # the shape of one row of the input, taken from the sources the net was built with.
+        self._row_shape: tuple = tuple(self._input_layer.output_shapes([])[0][1:])
+        self._output_blob = decaf_net.blob(output_blob)
+        self._max_batch_size: int = max_batch_size
+        self._max_wait: float = max_wait
+        self._queue: typing.Optional[asyncio.Queue] = None
+        self._task: typing.Optional[asyncio.Task] = None
+        self._executor: typing.Optional[futures.ThreadPoolExecutor] = None
+        self._pending: typing.Optional[tuple] = None
+        self.stats: BatcherStats = BatcherStats()
+
+    async def start(self):
+        """Starts the batching loop on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._executor = futures.ThreadPoolExecutor(max_workers=1)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stops the batching loop. Requests still in the queue are cancelled."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending is not None:
+            self._pending[1].cancel()
+            self._pending = None
+        while not self._queue.empty():
+            self._queue.get_nowait()[1].cancel()
+        self._executor.shutdown(wait=True)
+
+    async def predict(self,
+                      inputs: np.ndarray):
+        """
+        Submits a request and waits for its output.
+
+        Input:
+            inputs: an array whose first dimension is the number of rows in the request.
+        Output:
+            the rows of the output blob corresponding to the input rows.
+        Raises an InvalidRequestError if the rows do not have the shape of the input of the net, so that a bad request
+        fails alone instead of failing the whole batch it would be coalesced into.
+        """
+        if self._queue is None:
+            raise RuntimeError('Call start() before submitting requests.')
+        inputs = np.asarray(inputs)
+        if inputs.ndim != len(self._row_shape) + 1 or inputs.shape[1:] != self._row_shape:
+            raise InvalidRequestError('The input should have shape (num,) + {0}, got {1}.'.format(
+                self._row_shape, inputs.shape))
+        future = asyncio.get_event_loop().create_future()
+        self._queue.put_nowait((inputs, future, time.time()))
+        self.stats.record_queue_depth(self._queue.qsize())
+        return await future
+
+    async def _next_batch(self):
+        """Collects the requests for the next batch."""
+        loop = asyncio.get_event_loop()
+        if self._pending is not None:
+            batch = [self._pending]
+            self._pending = None
+        else:
+            batch = [await self._queue.get()]
+        num_rows = batch[0][0].shape[0]
+        deadline = loop.time() + self._max_wait
+        while num_rows < self._max_batch_size:
+            timeout = deadline - loop.time()
+            try:
+                if timeout <= 0:
+                    request = self._queue.get_nowait()
+                else:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if num_rows + request[0].shape[0] > self._max_batch_size:
+                # keep it for the next batch.
+                self._pending = request
+                break
+            batch.append(request)
+            num_rows += request[0].shape[0]
+        return batch
+
+    def _forward(self,
+                 inputs: np.ndarray):
+        """Runs the net on one batch. This is called in the worker thread."""
+        self._input_layer.set_sources([inputs])
+        self._net.forward()
+        return self._output_blob.data().copy()
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [request for request in await self._next_batch() if not request[1].cancelled()]
+            if not batch:
+                continue
+            start = time.time()
+            try:
+                inputs = np.concatenate([request[0] for request in batch])
+                outputs = await loop.run_in_executor(self._executor, self._forward, inputs)
+            except Exception as error:
+                logging.exception('Forward pass failed.')
+                self.stats.num_errors += len(batch)
+                for request in batch:
+                    if not request[1].done():
+                        request[1].set_exception(error)
+                continue
+            finish = time.time()
+            self.stats.record_batch(inputs.shape[0], finish - start)
+            current = 0
+            for request_inputs, future, arrival in batch:
+                size = request_inputs.shape[0]
+                if not future.done():
+                    future.set_result(outputs[current:current + size])
+                self.stats.record_request(start - arrival, finish - arrival)
+                current += size
@@ -0,0 +1,149 @@
+"""
+A load generator for the prediction server. For each target request rate it sends requests open-loop (the send times do
+not depend on the responses) over a pool of keep-alive connections, and reports the achieved throughput together with
+the p50/p99 latencies measured from the scheduled send time.
+
+Example:
+    python -m decaf.serving.server --port 8000 &
+    python -m decaf.serving.loadgen --port 8000 --rates 100,500,1000,2000
+"""
+import argparse
+import asyncio
+import json
+import numpy as np
+import time
+import typing
+
+
+class _Connection(object):
+    """A keep-alive HTTP connection to the prediction server."""
+
+    def __init__(self,
+                 reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    @staticmethod
+    async def open(host: str,
+                   port: int,
+                   path: typing.Optional[str] = None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return _Connection(reader, writer)
+
+    async def request(self,
+                      method: str,
+                      target: str,
+                      payload: typing.Optional[dict] = None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self._writer.write('{0} {1} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {2}\r\n\r\n'
+                           .format(method, target, len(body)).encode('latin-1') + body)
+        await self._writer.drain()
+        status = int((await self._reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            key, value = line.decode('latin-1').split(':', 1)
+            if key.strip().lower() == 'content-length':
+                length = int(value)
+        return status, json.loads((await self._reader.readexactly(length)).decode('utf-8'))
+
+    def close(self):
+        self._writer.close()
+
+
+async def run_rate(rate: float,
+                   duration: float,
+                   inputs: np.ndarray,
+                   host: str = '127.0.0.1',
+                   port: int = 8000,
+                   path: typing.Optional[str] = None,
+                   num_connections: int = 64):
+    """
+    Sends requests at the given rate (requests per second) for the given duration.
+
+    Output:
+        a dictionary with the offered rate, the achieved throughput, the p50/p99 latencies in seconds and the number
+        of errors.
+    """
+    pool = asyncio.Queue()
+    for _ in range(num_connections):
+        pool.put_nowait(await _Connection.open(host, port, path))
+    payload = {'inputs': inputs.tolist()}
+    latencies = []
+    errors = [0]
+
+    async def one_request(scheduled: float):
+        connection = await pool.get()
+        try:
+            status, _ = await connection.request('POST', '/predict', payload)
+            if status != 200:
+                errors[0] += 1
+        finally:
+            pool.put_nowait(connection)
+        latencies.append(time.time() - scheduled)
+
+    tasks = []
+    start = time.time()
+    num_requests = int(rate * duration)
+    for i in range(num_requests):
+        scheduled = start + i / rate
+        delay = scheduled - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one_request(scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.time() - start
+    while not pool.empty():
+        pool.get_nowait().close()
+    latencies = np.asarray(latencies)
+    return {'rate': rate,
+            'throughput': num_requests / elapsed,
+            'p50': float(np.percentile(latencies, 50)),
+            'p99': float(np.percentile(latencies, 99)),
+            'errors': errors[0]}
+
+
+async def fetch_metrics(host: str = '127.0.0.1',
+                        port: int = 8000,
+                        path: typing.Optional[str] = None):
+    """Returns the queueing metrics reported by the server."""
+    connection = await _Connection.open(host, port, path)
+    try:
+        return (await connection.request('GET', '/metrics'))[1]
+    finally:
+        connection.close()
+
+
+async def _main(args):
+    inputs = np.random.randn(args.rows, args.input_dim)
+    print('{0:>10} {1:>12} {2:>10} {3:>10} {4:>7}'.format('rate', 'throughput', 'p50(ms)', 'p99(ms)', 'errors'))
+    for rate in [float(r) for r in args.rates.split(',')]:
+        result = await run_rate(rate, args.duration, inputs, args.host, args.port, args.unix, args.connections)
+        print('{rate:>10.0f} {throughput:>12.1f} {0:>10.2f} {1:>10.2f} {errors:>7}'.format(
+            result['p50'] * 1000, result['p99'] * 1000, **result))
+    metrics = await fetch_metrics(args.host, args.port, args.unix)
+    print('server: mean batch size {0:.1f}, max queue depth {1}, p99 queue wait {2:.2f}ms'.format(
+        metrics['mean_batch_size'], metrics['max_queue_depth'], metrics['queue_wait']['p99'] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure latency against throughput of a prediction server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', default=None, help='connect to this unix socket instead of TCP.')
+    parser.add_argument('--input_dim', type=int, default=1024)
+    parser.add_argument('--rows', type=int, default=1, help='number of rows per request.')
+    parser.add_argument('--rates', default='100,200,500,1000', help='comma separated request rates to test.')
+    parser.add_argument('--duration', type=float, default=5., help='seconds to run each rate.')
+    parser.add_argument('--connections', type=int, default=64)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Implements a minimal HTTP/1.1 endpoint around a MicroBatcher, listening on a local TCP port or a unix socket.
+
+Endpoints:
+    POST /predict   body {"inputs": [[...], ...]}, returns {"outputs": [[...], ...]}
+    GET /metrics    returns the queueing metrics of the batcher.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import numpy as np
+import typing
+
+from decaf import net
+from decaf.layers import core_layers
+from decaf.serving import batcher
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+class PredictionServer(object):
+    """
+    A local prediction server. Connections are kept alive, so a client can send many requests over one connection.
+    """
+
+    def __init__(self,
+                 micro_batcher: batcher.MicroBatcher,
+                 host: str = '127.0.0.1',
+                 port: int = 8000,
+                 path: typing.Optional[str] = None):
+        """
+        Initializes the server.
+
+        Input:
+            micro_batcher: the MicroBatcher that computes the predictions.
+            host, port: (optional) the TCP address to listen on. Default 127.0.0.1:8000.
+            path: (optional) if given, listen on this unix socket instead of TCP.
+        """
+        self._batcher: batcher.MicroBatcher = micro_batcher
+        self._host: str = host
+        self._port: int = port
+        self._path: typing.Optional[str] = path
+        self._server: typing.Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        await self._batcher.start()
+        if self._path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=self._path)
+        else:
+            self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        logging.info('Serving on {}'.format(self.address()))
+
+    def address(self):
+        """Returns the address the server listens on."""
+        if self._path is not None:
+            return self._path
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        await self._batcher.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _respond(self,
+                       method: str,
+                       target: str,
+                       body: bytes):
+        if method == 'GET' and target == '/metrics':
+            return 200, self._batcher.stats.summary()
+        if method == 'POST' and target == '/predict':
+            try:
+                inputs = np.asarray(json.loads(body.decode('utf-8'))['inputs'], dtype=np.float64)
+            except (ValueError, KeyError, TypeError) as error:
+                return 400, {'error': str(error)}
+            try:
+                outputs = await self._batcher.predict(inputs)
+            except batcher.InvalidRequestError as error:
+                return 400, {'error': str(error)}
+            except Exception as error:
+                return 500, {'error': str(error)}
+            return 200, {'outputs': outputs.tolist()}
+        return 404, {'error': 'Unknown endpoint {0} {1}'.format(method, target)}
+
+    async def _handle(self,
+                      reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload = await self._respond(method, target, body)
+                content = json.dumps(payload).encode('utf-8')
+                writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\n\r\n'
+                             .format(status, _REASONS[status], len(content)).encode('latin-1') + content)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def demo_net(input_dim: int,
+             num_output: int):
+    """
+    Builds a random single inner product net for benchmarking the serving stack.
+    """
+    decaf_net = net.Net()
+    decaf_net.add_layer(core_layers.NdArrayDataLayer(name='input', sources=[np.zeros((1, input_dim))]),
+                        provides=['features'])
+    decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=num_output),
+                        needs=['features'], provides=['output'])
+    decaf_net.finish()
+    decaf_net.forward()
+    for param in decaf_net.params():
+        param.data()[:] = np.random.randn(*param.data().shape)
+    return decaf_net
+
+
+def main():
+    """Serves a random inner product net."""
+    parser = argparse.ArgumentParser(description='Serve a random inner product net with micro-batching.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', default=None, help='listen on this unix socket instead of TCP.')
+    parser.add_argument('--input_dim', type=int, default=1024)
+    parser.add_argument('--num_output', type=int, default=1000)
+    parser.add_argument('--max_batch_size', type=int, default=64)
+    parser.add_argument('--max_wait', type=float, default=0.002)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+    micro_batcher = batcher.MicroBatcher(demo_net(args.input_dim, args.num_output), 'input', 'output',
+                                         max_batch_size=args.max_batch_size, max_wait=args.max_wait)
+    server = PredictionServer(micro_batcher, host=args.host, port=args.port, path=args.unix)
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,10 @@ class COMM(object):
     def allgather(sendobj):
         return [copy.copy(sendobj)]
 
+    @staticmethod
+    def Allgather(sendbuf, recvbuf):
+        recvbuf[:] = sendbuf
+
     @staticmethod
     def Allreduce(sendbuf, recvbuf, op=None):
         recvbuf[:] = sendbuf[:]
@@ -46,6 +50,14 @@ class COMM(object):
     def gather(sendobj, root=0):
         return [copy.copy(sendobj)]
 
+    @staticmethod
+    def Gather(sendbuf, recvbuf, root=0):
+        recvbuf[:] = sendbuf[:]
+
     @staticmethod
     def Reduce(sendbuf, recvbuf, op=None, root=0):
         recvbuf[:] = sendbuf[:]
+
+    @staticmethod
+    def Barrier():
+        pass
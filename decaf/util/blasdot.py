@@ -1,6 +1,16 @@
 import numpy as np
 import typing
-from scipy.linalg import blas
+
+# scipy's blas module, imported on the first call so that importing decaf does not pay for importing scipy.
+_blas = None
+
+
+def _get_blas():
+    global _blas
+    if _blas is None:
+        from scipy.linalg import blas
+        _blas = blas
+    return _blas
 
 
 def _gemm_f_contiguous(alpha: float,
@@ -17,6 +27,7 @@ def _gemm_f_contiguous(alpha: float,
         raise ValueError('Incorrect output data type.')
     if A.dtype != B.dtype:
         raise TypeError('The data type of the matrices should be the same')
+    blas = _get_blas()
     if A.dtype == np.float32:
         gemm = blas.sgemm
     elif A.dtype == np.float64:
@@ -0,0 +1,168 @@
+"""
+compression implements the exchange of compressed gradients between the mpi instances.
+"""
+import typing
+
+import numpy as np
+
+from decaf.util import mpi
+
+# the dtype of the indices of the top-k entries on the wire.
+_INDEX_DTYPE = np.dtype(np.int32)
+
+
+class GradientCompressor(object):
+    """
+    GradientCompressor sums gradients over all the mpi instances like mpi.mpi_allreduce(), but sends them in a
+    compressed form.
+
+    The gradients are concatenated and split into buckets of about bucket_bytes bytes, and every bucket is exchanged
+    with a single Allgather, so that many small parameters do not cost a message each. Within a bucket, the values are
+    sent in the wire dtype (e.g. float16 or float32), and with a density below 1 only the largest entries in magnitude
+    are sent, together with their int32 indices. Every instance then decodes the buckets of all the instances and sums
+    them in the dtype of the gradients.
+
+    With error feedback (the default), what a call did not send, i.e. the dropped entries and the rounding error of the
+    wire dtype, is kept in a local residual and added to the gradient of the next call, so that no part of the gradient
+    is lost, only delayed. The compressor keeps this state, so use one compressor for the same list of gradients.
+
+    Allgather sends every bucket to all the instances, so compression only pays off when the buckets are small enough:
+    with n instances, a top-k bucket is worth it when its size times n is well below the size of the dense gradient.
+    """
+
+    def __init__(self,
+                 wire_dtype: np.dtype = np.float32,
+                 density: float = 1.,
+                 bucket_bytes: int = 2 ** 22,
+                 error_feedback: bool = True):
+        """
+        Initializes the compressor.
+
+        Input:
+            wire_dtype: (optional) the floating point dtype the values are sent in. Default np.float32.
+            density: (optional) the fraction of the entries of every bucket that is sent. Default 1, which sends the
+                bucket densely, without indices.
+            bucket_bytes: (optional) the approximate number of bytes of the gradients in one bucket, before
+                compression. Default 4 megabytes.
+            error_feedback: (optional) if True, keep what was not sent in a residual for the next call. Default True.
+        """
+        self._wire_dtype: np.dtype = np.dtype(wire_dtype)
+        if self._wire_dtype.kind != 'f':
+            raise ValueError('The wire dtype should be a floating point dtype.')
+        if not 0. < density <= 1.:
+            raise ValueError('The density should be in (0, 1].')
+        self._density: float = density
+        self._bucket_bytes: int = bucket_bytes
+        self._error_feedback: bool = error_feedback
+        # the concatenated gradients, the residual, and the values sent by this instance.
+        self._flat: typing.Optional[np.ndarray] = None
+        self._residual: typing.Optional[np.ndarray] = None
+        self._sent: typing.Optional[np.ndarray] = None
+        self._raw_bytes: int = 0
+        self._wire_bytes: int = 0
+        self._num_messages: int = 0
+        self._relative_error: float = 0.
+
+    def _buckets(self,
+                 size: int,
+                 itemsize: int):
+        """Yields the (start, stop) ranges of the buckets, each within the mpi buffer limit once gathered."""
+        limit = min(self._bucket_bytes, mpi._MPI_BUFFER_LIMIT // max(mpi.SIZE, 1))
+        step = max(1, limit // itemsize)
+        for start in range(0, size, step):
+            yield start, min(start + step, size)
+
+    def _num_sent(self,
+                  size: int):
+        """Returns the number of entries sent for a bucket of the given size."""
+        return int(np.ceil(self._density * size))
+
+    def _encode(self,
+                bucket: np.ndarray,
+                sent: np.ndarray):
+        """
+        Returns the message of a bucket as a uint8 array, and writes the values it carries, as decoded by the
+        receivers, into sent.
+        """
+        wire_dtype = self._wire_dtype
+        num_sent = self._num_sent(bucket.size)
+        if num_sent == bucket.size:
+            message = np.empty(bucket.size * wire_dtype.itemsize, np.uint8)
+            values = message.view(wire_dtype)
+            values[:] = bucket
+            sent[:] = values
+            return message
+        message = np.empty(num_sent * (_INDEX_DTYPE.itemsize + wire_dtype.itemsize), np.uint8)
+        indices = message[:num_sent * _INDEX_DTYPE.itemsize].view(_INDEX_DTYPE)
+        values = message[num_sent * _INDEX_DTYPE.itemsize:].view(wire_dtype)
+        indices[:] = np.argpartition(np.abs(bucket), bucket.size - num_sent)[bucket.size - num_sent:]
+        values[:] = bucket[indices]
+        sent[:] = 0
+        sent[indices] = values
+        return message
+
+    def _decode(self,
+                message: np.ndarray,
+                out: np.ndarray):
+        """Adds the values carried by the message of a bucket to out."""
+        wire_dtype = self._wire_dtype
+        num_sent = self._num_sent(out.size)
+        if num_sent == out.size:
+            out += message.view(wire_dtype)
+            return
+        indices = message[:num_sent * _INDEX_DTYPE.itemsize].view(_INDEX_DTYPE)
+        # the indices within one message are distinct, so the fancy-indexed addition does not lose any value.
+        out[indices] += message[num_sent * _INDEX_DTYPE.itemsize:].view(wire_dtype)
+
+    def allreduce(self,
+                  arrays: typing.List[np.ndarray]):
+        """
+        Replaces each array, in place, by the sum of the compressed arrays over all the instances. All the instances
+        should pass arrays of the same shapes and dtypes, e.g. the diffs of the parameters of the same net.
+        """
+        size = sum(array.size for array in arrays)
+        dtype = np.result_type(*arrays)
+        if self._flat is None or self._flat.size != size or self._flat.dtype != dtype:
+            self._flat = np.empty(size, dtype)
+            self._residual = np.zeros(size, dtype)
+            self._sent = np.empty(size, dtype)
+        flat = self._flat
+        current = 0
+        for array in arrays:
+            flat[current:current + array.size] = array.flat
+            current += array.size
+        if self._error_feedback:
+            flat += self._residual
+        flat_norm = float(np.sqrt(np.dot(flat, flat)))
+        for start, stop in self._buckets(size, dtype.itemsize):
+            message = self._encode(flat[start:stop], self._sent[start:stop])
+            gathered = np.empty((mpi.SIZE, message.size), np.uint8)
+            mpi.COMM.Allgather(message, gathered)
+            self._raw_bytes += (stop - start) * dtype.itemsize
+            self._wire_bytes += message.size
+            self._num_messages += 1
+            # flat is not needed any more, so it receives the sum.
+            bucket = flat[start:stop]
+            np.subtract(bucket, self._sent[start:stop], out=self._residual[start:stop])
+            bucket[:] = 0
+            for rank_message in gathered:
+                self._decode(rank_message, bucket)
+        self._relative_error = float(np.sqrt(np.dot(self._residual, self._residual))) / max(flat_norm, 1e-300)
+        current = 0
+        for array in arrays:
+            array.flat = flat[current:current + array.size]
+            current += array.size
+        return arrays
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of bytes of the gradients 'raw_bytes' and of the messages this instance
+        sent 'wire_bytes' so far, their ratio 'compression_ratio', the number of messages 'num_messages', and the norm
+        of what the last call did not send relative to that of the gradient 'relative_error', which tells how much of
+        the gradient is delayed (with error feedback) or lost (without).
+        """
+        return {'raw_bytes': self._raw_bytes,
+                'wire_bytes': self._wire_bytes,
+                'compression_ratio': self._raw_bytes / float(max(self._wire_bytes, 1)),
+                'num_messages': self._num_messages,
+                'relative_error': self._relative_error}
@@ -60,6 +60,97 @@ def mpi_all(decision):
     return all(COMM.allgather(decision))
 
 
+def root_decide(decision):
+    """
+    returns the decision made on the root, on all instances
+    """
+    return COMM.bcast(decision)
+
+
+def _chunks(size, itemsize):
+    """
+    yields the (start, stop) ranges that split size elements into messages of at most _MPI_BUFFER_LIMIT bytes.
+    """
+    step = max(1, _MPI_BUFFER_LIMIT // itemsize)
+    for start in range(0, size, step):
+        yield start, min(start + step, size)
+
+
+def _flat_view(array):
+    """
+    returns a flat view of a c-contiguous array, which buffer-based communications can read from and write to.
+    """
+    if not array.flags.c_contiguous:
+        raise ValueError('The array should be c-contiguous.')
+    return array.reshape(array.size)
+
+
+def mpi_allreduce(array, out=None, op=None):
+    """
+    Allreduces a numpy array of arbitrary size using buffer-based communication. The array is sent in chunks, each no
+    larger than _MPI_BUFFER_LIMIT bytes.
+
+    Input:
+        array: the local array.
+        out: (optional) the c-contiguous output array, with the same shape and dtype as array. It can be the array
+            itself, in which case the reduction is carried out in place. Default None, which allocates a new array.
+        op: (optional) the MPI reduce operation. Default None, which uses MPI's default, the sum.
+    Output:
+        out: the reduced array.
+    """
+    if out is None:
+        out = np.empty_like(array, order='C')
+    if out.shape != array.shape or out.dtype != array.dtype:
+        raise ValueError('The output should have the same shape and dtype as the input.')
+    recvbuf = _flat_view(out)
+    in_place = np.may_share_memory(array, out)
+    sendbuf = np.ascontiguousarray(array).reshape(array.size)
+    for start, stop in _chunks(array.size, array.itemsize):
+        send = sendbuf[start:stop].copy() if in_place else sendbuf[start:stop]
+        if op is None:
+            COMM.Allreduce(send, recvbuf[start:stop])
+        else:
+            COMM.Allreduce(send, recvbuf[start:stop], op=op)
+    return out
+
+
+def mpi_bcast(array, root=0):
+    """
+    Broadcasts a c-contiguous numpy array of arbitrary size in place from the root, in chunks no larger than
+    _MPI_BUFFER_LIMIT bytes. All instances should pass an array of the same shape and dtype.
+
+    Output:
+        array: the array, now holding the content of the root's array.
+    """
+    buf = _flat_view(array)
+    for start, stop in _chunks(array.size, array.itemsize):
+        COMM.Bcast(buf[start:stop], root=root)
+    return array
+
+
+def mpi_gather(array, root=0):
+    """
+    Gathers numpy arrays of the same shape and dtype from all instances to the root, in chunks no larger than
+    _MPI_BUFFER_LIMIT bytes per instance.
+
+    Output:
+        on the root, an array of shape (SIZE,) + array.shape where the i-th slice is the array of rank i. On the other
+        instances, None.
+    """
+    sendbuf = np.ascontiguousarray(array).reshape(array.size)
+    output = None
+    if RANK == root:
+        output = np.empty((SIZE,) + array.shape, dtype=array.dtype)
+    for start, stop in _chunks(array.size, array.itemsize):
+        if RANK == root:
+            recvbuf = np.empty((SIZE, stop - start), dtype=array.dtype)
+            COMM.Gather(sendbuf[start:stop], recvbuf, root=root)
+            output.reshape(SIZE, array.size)[:, start:stop] = recvbuf
+        else:
+            COMM.Gather(sendbuf[start:stop], None, root=root)
+    return output
+
+
 def elect():
     """
     elect() randomly chooses a node from all the nodes as the president.
@@ -85,9 +176,30 @@ def is_root():
     return RANK == 0
 
 
-def barrier(tag=0, sleep=0.01):
+def _wait_for_message(source, tag, sleep, spin):
+    """
+    waits until a message from source with the given tag arrives. We first poll in a tight loop for spin seconds, and
+    then sleep between the polls, doubling the sleep time up to sleep seconds.
+    """
+    start = time.time()
+    delay = max(spin, 1e-6)
+    while not COMM.Iprobe(source, tag):
+        if time.time() - start < spin:
+            continue
+        time.sleep(delay)
+        delay = min(delay * 2, sleep)
+
+
+def barrier(tag=0, sleep=0.001, spin=0.0001):
     """
     The original MPI.comm.barrier() may cause idle processes to still occupy the CPU, while this barrier waits.
+
+    Input:
+        tag: (optional) the message tag to use. Default 0.
+        sleep: (optional) the longest time to sleep between two polls, which bounds the latency the barrier adds once
+            it has backed off. Default 0.001.
+        spin: (optional) the time to poll without sleeping before backing off, so that short waits, such as per-step
+            gradient synchronizations, return within microseconds. Default 0.0001.
     """
     if SIZE == 1:
         return
@@ -96,8 +208,7 @@ def barrier(tag=0, sleep=0.01):
         dst = (RANK + mask) % SIZE
         src = (RANK - mask + SIZE) % SIZE
         req = COMM.isend(None, dst, tag)
-        while not COMM.Iprobe(src, tag):
-            time.sleep(sleep)
+        _wait_for_message(src, tag, sleep, spin)
         COMM.recv(None, src, tag)
         req.Wait()
         mask <<= 1
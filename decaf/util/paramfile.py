@@ -0,0 +1,127 @@
+"""
+paramfile implements a compact file format to store the parameters of a net.
+
+The file starts with a small header:
+    magic (8 bytes) | index length (8 bytes, little endian) | index (utf-8 json)
+followed by the raw parameter arrays, each starting at an offset aligned to _ALIGNMENT bytes. The index records, for
+every parameter, the layer name, the position of the parameter in layer.param(), its dtype, shape and offset. Since the
+arrays are stored raw, a file can be memory-mapped and its arrays used directly as the data of the parameter blobs:
+loading does not copy or unpickle anything, and processes loading the same file share the same physical pages.
+"""
+
+import json
+import numpy as np
+import struct
+
+from decaf.base import DecafError
+
+_MAGIC = b'DECAFPRM'
+_ALIGNMENT = 64
+_HEADER_STRUCT = struct.Struct('<8sQ')
+
+
+def _align(offset: int):
+    """Round the offset up to the next multiple of _ALIGNMENT."""
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _collect(decaf_net):
+    """
+    Collect the (layer name, param index, blob) tuples of a net in a deterministic order.
+    """
+    layers = decaf_net.layers()
+    return [(name, index, blob)
+            for name in sorted(layers)
+            for index, blob in enumerate(layers[name].param())]
+
+
+def save(decaf_net,
+         filename: str):
+    """
+    Save the parameters of a net to a file.
+
+    Input:
+        decaf_net: a decaf.net.Net instance. All its parameters should have been initialized, e.g. by running the net
+            once.
+        filename: the output filename.
+    """
+    entries = []
+    arrays = []
+    for name, index, blob in _collect(decaf_net):
+        if not blob.has_data():
+            raise DecafError('Parameter {0} of layer {1} is not initialized.'.format(index, name))
+        array = np.ascontiguousarray(blob.data())
+        entries.append({'layer': name,
+                        'index': index,
+                        'dtype': array.dtype.str,
+                        'shape': list(array.shape)})
+        arrays.append(array)
+    # The offsets depend on the length of the index itself, so we compute them with a placeholder first and iterate
+    # until the index length is stable.
+    index_bytes = b''
+    while True:
+        offset = _align(_HEADER_STRUCT.size + len(index_bytes))
+        for entry, array in zip(entries, arrays):
+            entry['offset'] = offset
+            offset = _align(offset + array.nbytes)
+        new_index_bytes = json.dumps({'params': entries}).encode('utf-8')
+        if len(new_index_bytes) == len(index_bytes):
+            break
+        index_bytes = new_index_bytes
+    with open(filename, 'wb') as fid:
+        fid.write(_HEADER_STRUCT.pack(_MAGIC, len(index_bytes)))
+        fid.write(index_bytes)
+        for entry, array in zip(entries, arrays):
+            fid.seek(entry['offset'])
+            fid.write(array.data)
+        fid.truncate(_align(fid.tell()))
+
+
+def read_index(filename: str):
+    """
+    Read the index of a parameter file.
+
+    Output:
+        a list of dictionaries, each with keys 'layer', 'index', 'dtype', 'shape' and 'offset'.
+    """
+    with open(filename, 'rb') as fid:
+        magic, length = _HEADER_STRUCT.unpack(fid.read(_HEADER_STRUCT.size))
+        if magic != _MAGIC:
+            raise DecafError('{} is not a decaf parameter file.'.format(filename))
+        return json.loads(fid.read(length).decode('utf-8'))['params']
+
+
+def load(decaf_net,
+         filename: str,
+         mmap_mode: str = 'r'):
+    """
+    Load the parameters stored in a file into an already constructed net.
+
+    Input:
+        decaf_net: a decaf.net.Net instance with the same layers as the net that was saved.
+        filename: the parameter file.
+        mmap_mode: (optional) how the file is mapped. 'r' maps the file read-only, which is the fastest option and
+            shares memory between processes, but the parameters can then not be updated. 'c' maps the file
+            copy-on-write, so the parameters can be trained without modifying the file. 'r+' writes updates back to
+            the file. None reads the parameters into memory. Default 'r'.
+    """
+    entries = read_index(filename)
+    if mmap_mode is None:
+        buffer = np.fromfile(filename, dtype=np.uint8)
+    else:
+        buffer = np.memmap(filename, dtype=np.uint8, mode=mmap_mode)
+    layers = decaf_net.layers()
+    for entry in entries:
+        if entry['layer'] not in layers:
+            raise DecafError('Layer {} is not found in the net.'.format(entry['layer']))
+        params = layers[entry['layer']].param()
+        if entry['index'] >= len(params):
+            raise DecafError('Layer {0} does not have parameter {1}.'.format(entry['layer'], entry['index']))
+        blob = params[entry['index']]
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        if blob.has_data() and blob.data().shape != shape:
+            raise DecafError('Shape mismatch for parameter {0} of layer {1}: {2} vs {3}.'.format(
+                entry['index'], entry['layer'], blob.data().shape, shape))
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        blob.mirror(buffer[entry['offset']:entry['offset'] + nbytes].view(dtype), shape)
@@ -1,20 +1,25 @@
 """A code to perform logistic regression."""
+from concurrent import futures
+from multiprocessing import shared_memory
 import numpy as np
+from scipy import sparse
+import typing
 
 from decaf import net
 from decaf.layers import core_layers, regularization
 from decaf.optimization import core_solvers
-from decaf.util import blasdot
+from decaf.util import blasdot, util
 
 
-def logistic_regression(features: np.ndarray,
-                        target: np.ndarray,
-                        reg_weight=0.):
+def _logistic_regression_net(features,
+                             target: np.ndarray,
+                             reg_weight: float):
     """
-    Carry out a logistic regression given features and target value.
+    Construct the network of a logistic regression.
 
-    If you actually want to do logistic regression, this is probably not what you want to use. It is here just for
-    demonstration purpose
+    Output:
+        decaf_net: the finished network.
+        ip_layer: the inner product layer holding the weight and bias.
     """
     if target.ndim == 1:
         num_output = target.max() + 1
@@ -36,6 +41,20 @@ def logistic_regression(features: np.ndarray,
     decaf_net.add_layer(loss_layer, needs=['output', 'target'])
     # finish
     decaf_net.finish()
+    return decaf_net, ip_layer
+
+
+def logistic_regression(features: np.ndarray,
+                        target: np.ndarray,
+                        reg_weight=0.):
+    """
+    Carry out a logistic regression given features and target value. The features may be a dense array or a
+    scipy.sparse matrix.
+
+    If you actually want to do logistic regression, this is probably not what you want to use. It is here just for
+    demonstration purpose
+    """
+    decaf_net, ip_layer = _logistic_regression_net(features, target, reg_weight)
     # now, try to solve it
     solver = core_solvers.LBFGSSolver(lbfgs_args={'iprint': 1})
     solver.solve(decaf_net)
@@ -44,6 +63,125 @@ def logistic_regression(features: np.ndarray,
     return param[0].data().copy(), param[1].data().copy()
 
 
+def _solve_path(features,
+                target: np.ndarray,
+                reg_weights: typing.List[float]):
+    """
+    Solve the logistic regressions for a decreasing sequence of regularization weights, warm starting each fit from
+    the previous solution.
+    """
+    results = []
+    init = None
+    for reg_weight in reg_weights:
+        timer = util.Timer()
+        decaf_net, ip_layer = _logistic_regression_net(features, target, reg_weight)
+        param = ip_layer.param()
+        if init is not None:
+            for blob, value in zip(param, init):
+                blob.init_data(value.shape, value.dtype)[:] = value
+        solver = core_solvers.LBFGSSolver(lbfgs_args={'iprint': -1})
+        solver.solve(decaf_net)
+        init = [blob.data().copy() for blob in param]
+        results.append({'reg_weight': reg_weight,
+                        'weight': init[0],
+                        'bias': init[1],
+                        'time': timer.total(False),
+                        'iterations': solver.info()['nit'],
+                        'evaluations': solver.info()['funcalls']})
+    return results
+
+
+def _share(arrays: typing.List[np.ndarray]):
+    """
+    Copy the arrays into one block of shared memory.
+
+    Output:
+        shm: the SharedMemory instance. The caller is responsible for unlinking it.
+        layout: a picklable list of (offset, shape, dtype) tuples describing the arrays in the block.
+    """
+    layout = []
+    offset = 0
+    for array in arrays:
+        layout.append((offset, array.shape, array.dtype.str))
+        offset += (array.nbytes + 63) // 64 * 64
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for array, (offset, shape, dtype) in zip(arrays, layout):
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = array
+    return shm, layout
+
+
+def _attach(name: str,
+            layout: list):
+    """
+    Attach to a block created by _share(), and return the block together with the arrays in it.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, [np.ndarray(shape, dtype, buffer=shm.buf, offset=offset) for offset, shape, dtype in layout]
+
+
+def _solve_path_shared(name: str,
+                       layout: list,
+                       feature_shape: typing.Optional[tuple],
+                       reg_weights: typing.List[float]):
+    """
+    The worker function of logistic_regression_path: solve a segment of the path on the data in shared memory.
+    """
+    shm, arrays = _attach(name, layout)
+    try:
+        if feature_shape is not None:
+            arrays = [sparse.csr_matrix(tuple(arrays[:3]), shape=feature_shape), arrays[3]]
+        return _solve_path(arrays[0], arrays[1], reg_weights)
+    finally:
+        # the arrays should be released before the shared memory can be closed.
+        del arrays
+        shm.close()
+
+
+def logistic_regression_path(features,
+                             target: np.ndarray,
+                             reg_weights: typing.List[float],
+                             num_workers: int = 1):
+    """
+    Carry out logistic regressions for a grid of regularization weights.
+
+    The weights are solved in decreasing order, and each fit is warm-started from the solution of the previous, more
+    regularized one. With num_workers > 1, the sorted grid is split into num_workers contiguous segments that are
+    solved in parallel by a process pool. The data is copied once into shared memory, from which every worker reads it.
+
+    Input:
+        features: the features, as a dense array or a scipy.sparse matrix.
+        target: the target, as in logistic_regression().
+        reg_weights: the list of regularization weights.
+        num_workers: (optional) the number of worker processes. Default 1, which solves the path in this process.
+    Output:
+        a list of dictionaries sorted by decreasing regularization weight, with keys 'reg_weight', 'weight', 'bias',
+        'time' (the wall time of the fit in seconds), 'iterations' and 'evaluations' (the number of L-BFGS iterations
+        and function evaluations).
+    """
+    reg_weights = sorted(reg_weights, reverse=True)
+    num_workers = max(1, min(num_workers, len(reg_weights)))
+    if num_workers == 1:
+        return _solve_path(features, target, reg_weights)
+    if sparse.issparse(features):
+        features = features.tocsr()
+        arrays = [features.data, features.indices, features.indptr, target]
+        feature_shape = features.shape
+    else:
+        arrays = [np.ascontiguousarray(features), target]
+        feature_shape = None
+    shm, layout = _share(arrays)
+    try:
+        segments = np.array_split(np.arange(len(reg_weights)), num_workers)
+        with futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+            jobs = [executor.submit(_solve_path_shared, shm.name, layout, feature_shape,
+                                    [reg_weights[i] for i in segment])
+                    for segment in segments]
+            return sum((job.result() for job in jobs), [])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
 def main():
     """
     The main demo for the ridge regression problem.
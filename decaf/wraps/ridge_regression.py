@@ -1,5 +1,7 @@
 """A code to perform ridge regression."""
 import numpy as np
+from scipy import linalg, sparse
+import typing
 
 from decaf import net
 from decaf.layers import core_layers, regularization
@@ -10,7 +12,8 @@ def ridge_regression(features: np.ndarray,
                      target: np.ndarray,
                      reg_weight: float = 0.):
     """
-    Carry out a ridge regression given features and target value
+    Carry out a ridge regression given features and target value. The features may be a dense array or a
+    scipy.sparse matrix.
 
     If you actually want to do linear regression, this is probably not what you want to use. It is here just for
     demonstration purpose
@@ -41,6 +44,164 @@ def ridge_regression(features: np.ndarray,
     return param[0].data().copy(), param[1].data().copy()
 
 
+class RidgeStatistics(object):
+    """
+    RidgeStatistics accumulates the sufficient statistics of a ridge regression, so that the exact solution can be
+    computed after a single pass over the data, which may be streamed in chunks or shards.
+
+    The solution minimizes the same objective as ridge_regression(), i.e. the squared loss summed over the data points
+    plus reg_weight * num_data * ||weight||^2, with an unregularized bias.
+    """
+
+    def __init__(self):
+        self._num_data: int = 0
+        self._xtx: typing.Optional[np.ndarray] = None
+        self._xty: typing.Optional[np.ndarray] = None
+        self._sum_x: typing.Optional[np.ndarray] = None
+        self._sum_y: typing.Optional[np.ndarray] = None
+        # The statistics are accumulated on data shifted by the mean of the first chunk, which keeps the centering step
+        # numerically stable. If the first chunk is sparse, the features are not shifted to keep them sparse. Sparse
+        # chunks that follow dense ones get the shift applied to their statistics instead of their entries.
+        self._shift_x = None
+        self._shift_y = None
+
+    def update(self,
+               features,
+               target: np.ndarray,
+               chunk_size: int = 10000):
+        """
+        Add a set of data points to the statistics.
+
+        Input:
+            features: a 2-dimensional array (possibly a np.memmap), or a scipy.sparse matrix.
+            target: the target values, as a vector or a 2-dimensional array.
+            chunk_size: (optional) the number of rows processed at a time. Default 10000.
+        """
+        if target.ndim == 1:
+            target = target[:, np.newaxis]
+        if features.shape[0] != target.shape[0]:
+            raise ValueError('features and target should have the same number of data points!')
+        is_sparse = sparse.issparse(features)
+        if is_sparse:
+            features = features.tocsr()
+        if self._xtx is None:
+            dim = features.shape[1]
+            self._xtx = np.zeros((dim, dim))
+            self._xty = np.zeros((dim, target.shape[1]))
+            self._sum_x = np.zeros(dim)
+            self._sum_y = np.zeros(target.shape[1])
+            self._shift_x = (np.zeros(dim) if is_sparse
+                             else np.asarray(features[:chunk_size], dtype=np.float64).mean(axis=0))
+            self._shift_y = np.asarray(target[:chunk_size], dtype=np.float64).mean(axis=0)
+        for start in range(0, features.shape[0], chunk_size):
+            feature_chunk = features[start:start + chunk_size]
+            target_chunk = np.asarray(target[start:start + chunk_size], dtype=np.float64) - self._shift_y
+            if is_sparse:
+                sum_x = np.asarray(feature_chunk.sum(axis=0)).ravel()
+                self._xtx += (feature_chunk.T @ feature_chunk).toarray()
+                self._xty += feature_chunk.T @ target_chunk
+                self._sum_x += sum_x
+                if self._shift_x.any():
+                    # (X - 1 s')'(X - 1 s') = X'X - s sum(X)' - sum(X) s' + n s s', and similarly for X'y and sum(X).
+                    num = feature_chunk.shape[0]
+                    shift = self._shift_x
+                    self._xtx -= np.outer(shift, sum_x) + np.outer(sum_x, shift) - num * np.outer(shift, shift)
+                    self._xty -= np.outer(shift, target_chunk.sum(axis=0))
+                    self._sum_x -= num * shift
+            else:
+                feature_chunk = np.asarray(feature_chunk, dtype=np.float64) - self._shift_x
+                self._xtx += np.dot(feature_chunk.T, feature_chunk)
+                self._xty += np.dot(feature_chunk.T, target_chunk)
+                self._sum_x += feature_chunk.sum(axis=0)
+            self._sum_y += target_chunk.sum(axis=0)
+            self._num_data += feature_chunk.shape[0]
+
+    def _centered(self):
+        """Returns the centered statistics (Xc'Xc, Xc'yc) and the means of the (shifted) features and target."""
+        if self._num_data == 0:
+            raise ValueError('No data has been added.')
+        mean_x = self._sum_x / self._num_data
+        mean_y = self._sum_y / self._num_data
+        xtx = self._xtx - self._num_data * np.outer(mean_x, mean_x)
+        xty = self._xty - self._num_data * np.outer(mean_x, mean_y)
+        return xtx, xty, mean_x, mean_y
+
+    def _bias(self,
+              weight: np.ndarray,
+              mean_x: np.ndarray,
+              mean_y: np.ndarray):
+        return mean_y + self._shift_y - np.dot(mean_x + self._shift_x, weight)
+
+    def solve(self,
+              reg_weight: float = 0.):
+        """
+        Solve the ridge regression with a Cholesky factorization.
+
+        Output:
+            weight, bias: the same as ridge_regression().
+        """
+        xtx, xty, mean_x, mean_y = self._centered()
+        xtx[np.diag_indices_from(xtx)] += reg_weight * self._num_data
+        weight = linalg.cho_solve(linalg.cho_factor(xtx), xty)
+        return weight, self._bias(weight, mean_x, mean_y)
+
+    def solve_path(self,
+                   reg_weights: typing.List[float]):
+        """
+        Solve the ridge regression for a list of regularization weights from a single eigendecomposition.
+
+        Output:
+            a list of dictionaries with keys 'reg_weight', 'weight' and 'bias', in the order of reg_weights.
+        """
+        xtx, xty, mean_x, mean_y = self._centered()
+        eigval, eigvec = linalg.eigh(xtx)
+        projected = np.dot(eigvec.T, xty)
+        results = []
+        for reg_weight in reg_weights:
+            weight = np.dot(eigvec, projected / (eigval + reg_weight * self._num_data)[:, np.newaxis])
+            results.append({'reg_weight': reg_weight,
+                            'weight': weight,
+                            'bias': self._bias(weight, mean_x, mean_y)})
+        return results
+
+
+def ridge_statistics(features,
+                     target,
+                     chunk_size: int = 10000):
+    """
+    Compute the RidgeStatistics of the data. features and target may either be arrays (dense, memory-mapped or
+    sparse), or lists of such arrays for data stored in shards.
+    """
+    if not isinstance(features, (list, tuple)):
+        features, target = [features], [target]
+    statistics = RidgeStatistics()
+    for feature_shard, target_shard in zip(features, target):
+        statistics.update(feature_shard, target_shard, chunk_size)
+    return statistics
+
+
+def ridge_regression_direct(features,
+                            target,
+                            reg_weight: float = 0.,
+                            chunk_size: int = 10000):
+    """
+    Carry out a ridge regression exactly, in a single pass over the data. The arguments are the same as
+    ridge_regression(), except that the data may be given as lists of shards (see ridge_statistics()).
+    """
+    return ridge_statistics(features, target, chunk_size).solve(reg_weight)
+
+
+def ridge_regression_path(features,
+                          target,
+                          reg_weights: typing.List[float],
+                          chunk_size: int = 10000):
+    """
+    Carry out ridge regressions exactly for a list of regularization weights, in a single pass over the data. See
+    RidgeStatistics.solve_path() for the output.
+    """
+    return ridge_statistics(features, target, chunk_size).solve_path(reg_weights)
+
+
 def main():
     """
     The main demo for the ridge regression problem.
@@ -0,0 +1,62 @@
+"""
+Compares the forward and backward time of a convolution on channel-first input for several channel counts: the
+channels-last layer after transposing the input to (num, height, width, channels), and the channel-first layer run
+natively on (num, channels, height, width).
+
+Example:
+    python benchmark_conv_layout.py --num_data 16 --size 32 --channels 3 16 64
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from decaf import base
+from decaf.layers import convolution
+
+
+def time_per_call(function, number):
+    """Returns the best time per call over 3 repeats, in milliseconds."""
+    return min(timeit.repeat(function, number=number, repeat=3)) / number * 1e3
+
+
+def make_step(layer, bottom_data, to_layer):
+    """Returns a function that runs the forward and backward pass of the layer on channel-first data."""
+    bottom = [base.Blob()]
+    top = [base.Blob()]
+
+    def step():
+        bottom[0].mirror(to_layer(bottom_data))
+        layer.forward(bottom, top)
+        top[0].init_diff()[:] = 1.
+        layer.backward(bottom, top, True)
+
+    return step
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the channels-last and channel-first convolutions.')
+    parser.add_argument('--num_data', type=int, default=16)
+    parser.add_argument('--size', type=int, default=32)
+    parser.add_argument('--channels', type=int, nargs='+', default=[3, 16, 64])
+    parser.add_argument('--num_kernels', type=int, default=32)
+    parser.add_argument('--ksize', type=int, default=3)
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+
+    np.random.seed(1701)
+    print('{0:>10} {1:>22} {2:>22}'.format('channels', 'NHWC + transpose (ms)', 'NCHW (ms)'))
+    for channels in args.channels:
+        # the data arrives channel-first.
+        bottom_data = np.random.randn(args.num_data, channels, args.size, args.size)
+        times = []
+        for layout, to_layer in [(base.LAYOUT_NHWC, lambda data: np.ascontiguousarray(data.transpose(0, 2, 3, 1))),
+                                 (base.LAYOUT_NCHW, lambda data: data)]:
+            layer = convolution.ConvolutionLayer(name='conv', num_kernels=args.num_kernels, ksize=args.ksize,
+                                                 stride=1, mode='same', layout=layout)
+            times.append(time_per_call(make_step(layer, bottom_data, to_layer), args.number))
+        print('{0:>10} {1:>22.3f} {2:>22.3f}'.format(channels, *times))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compares the forward time and the weight size of a float InnerProductLayer, in float64 and float32, with its int8
+QuantizedInnerProductLayer, for several batch sizes.
+
+Example:
+    python benchmark_quantization.py --num_input 4096 --num_output 4096 --batch_sizes 1 8 64
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from decaf import base
+from decaf.layers import innerproduct, quantization
+
+
+def time_per_call(function, number):
+    """Returns the best time per call over 3 repeats, in milliseconds."""
+    return min(timeit.repeat(function, number=number, repeat=3)) / number * 1e3
+
+
+def make_forward(layer, features):
+    """Returns a function that runs the forward pass of the layer."""
+    bottom = [base.Blob()]
+    bottom[0].mirror(features)
+    top = [base.Blob()]
+    return lambda: layer.forward(bottom, top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the float and int8 inner product layers.')
+    parser.add_argument('--num_input', type=int, default=4096)
+    parser.add_argument('--num_output', type=int, default=4096)
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+
+    np.random.seed(1701)
+    weight = np.random.randn(args.num_input, args.num_output) / np.sqrt(args.num_input)
+    bias = np.random.randn(args.num_output)
+    layers = {}
+    for dtype in [np.float64, np.float32]:
+        layer = innerproduct.InnerProductLayer(name='ip', num_output=args.num_output)
+        make_forward(layer, np.zeros((1, args.num_input), dtype))()
+        layer.param()[0].data()[:] = weight
+        layer.param()[1].data()[:] = bias
+        layers[np.dtype(dtype).name] = layer
+    # every input is drawn from the same distribution, so the calibration uses the same scale.
+    layers['int8'] = quantization.QuantizedInnerProductLayer(name='ip', weight=weight, bias=bias,
+                                                             input_scale=4. / 127)
+    print('{0:>10} {1:>14}'.format('layer', 'weight bytes'))
+    for name, layer in layers.items():
+        size = layer.quantized_bytes() if name == 'int8' else sum(param.data().nbytes for param in layer.param())
+        print('{0:>10} {1:>14}'.format(name, size))
+    print('{0:>10} {1:>14} {2:>14} {3:>14}'.format('batch', 'float64 (ms)', 'float32 (ms)', 'int8 (ms)'))
+    for batch_size in args.batch_sizes:
+        features = np.clip(np.random.randn(batch_size, args.num_input), -4, 4)
+        times = [time_per_call(make_forward(layer, features.astype(layer.param()[0].data().dtype)), args.number)
+                 for layer in [layers['float64'], layers['float32']]]
+        times.append(time_per_call(make_forward(layers['int8'], features.astype(np.float32)), args.number))
+        print('{0:>10} {1:>14.3f} {2:>14.3f} {3:>14.3f}'.format(batch_size, *times))
+
+
+if __name__ == '__main__':
+    main()
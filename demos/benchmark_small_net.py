@@ -0,0 +1,53 @@
+"""
+Measures the per-step Python overhead of a tiny network: a 2-feature logistic regression, where the arithmetic is
+negligible and the time goes to the layer and blob bookkeeping.
+
+Example:
+    python benchmark_small_net.py --num_data 100 --steps 20000
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from decaf import base
+from decaf.wraps import logistic_regression
+
+
+def time_per_call(function, number):
+    """Returns the best time per call over 3 repeats, in microseconds."""
+    return min(timeit.repeat(function, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the per-step overhead of a tiny decaf net.')
+    parser.add_argument('--num_data', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=20000)
+    args = parser.parse_args()
+
+    np.random.seed(1701)
+    features = np.random.randn(args.num_data, 2)
+    target = (features.sum(axis=1) > 0).astype(np.int64)
+    decaf_net, _ = logistic_regression._logistic_regression_net(features, target, 0.01)
+    decaf_net.execute()
+
+    blob = base.Blob((args.num_data, 2))
+    blob.init_diff()
+    print('{0:>24} {1:>10}'.format('operation', 'us/call'))
+    print('{0:>24} {1:>10.3f}'.format('Blob.data()', time_per_call(blob.data, args.steps * 10)))
+    print('{0:>24} {1:>10.3f}'.format('Blob.diff()', time_per_call(blob.diff, args.steps * 10)))
+    print('{0:>24} {1:>10.3f}'.format('Net.forward()', time_per_call(decaf_net.forward, args.steps)))
+    print('{0:>24} {1:>10.3f}'.format('Net.execute()', time_per_call(decaf_net.execute, args.steps)))
+    params = decaf_net.params()
+
+    def sgd_step():
+        decaf_net.execute()
+        for param in params:
+            param.diff()[...] *= -0.1 / args.num_data
+        decaf_net.update()
+
+    print('{0:>24} {1:>10.3f}'.format('SGD step', time_per_call(sgd_step, args.steps)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Trains a logistic regression with gradient descent, where every mpi instance computes the gradient on its shard of the
+data and the gradients are summed with decaf.util.compression.GradientCompressor, and reports the compression ratio
+and the final loss of several wire formats against the uncompressed exchange.
+
+Example:
+    mpirun -n 4 python compressed_gradients.py --num_data 4000 --dim 500 --steps 200
+It also runs without mpi, as a single instance.
+"""
+import argparse
+
+import numpy as np
+
+from decaf.util import compression, mpi
+from decaf.wraps import logistic_regression
+
+CONFIGS = [('float64, uncompressed', None),
+           ('float32', {'wire_dtype': np.float32}),
+           ('float16', {'wire_dtype': np.float16}),
+           ('float16, top 10%', {'wire_dtype': np.float16, 'density': 0.1}),
+           ('float16, top 1%', {'wire_dtype': np.float16, 'density': 0.01}),
+           ('float16, top 1%, no feedback', {'wire_dtype': np.float16, 'density': 0.01, 'error_feedback': False})]
+
+
+def train(features, target, num_data, steps, learning_rate, compressor):
+    """Runs gradient descent and returns the total loss over all the instances at every step."""
+    decaf_net, _ = logistic_regression._logistic_regression_net(features, target, 0.001)
+    decaf_net.execute()
+    params = decaf_net.params()
+    # every instance starts from the same point.
+    for param in params:
+        param.data()[:] = 0
+    losses = []
+    for _ in range(steps):
+        loss = decaf_net.execute()
+        losses.append(mpi.COMM.allreduce(loss))
+        diffs = [param.diff() for param in params]
+        if compressor is None:
+            for diff in diffs:
+                mpi.mpi_allreduce(diff, out=diff)
+        else:
+            compressor.allreduce(diffs)
+        for diff in diffs:
+            diff *= -learning_rate / num_data
+        decaf_net.update()
+    return losses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare compressed gradient exchanges.')
+    parser.add_argument('--num_data', type=int, default=4000)
+    parser.add_argument('--dim', type=int, default=500)
+    parser.add_argument('--num_classes', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--learning_rate', type=float, default=1.)
+    args = parser.parse_args()
+
+    # every instance generates the same data and takes its own shard.
+    np.random.seed(1701)
+    features = np.random.randn(args.num_data, args.dim)
+    target = (np.dot(features, np.random.randn(args.dim, args.num_classes)) +
+              np.random.randn(args.num_data, args.num_classes)).argmax(axis=1)
+    shard = slice(mpi.RANK, None, mpi.SIZE)
+    features, target = features[shard], target[shard]
+
+    if mpi.is_root():
+        print('{0:>30} {1:>12} {2:>12} {3:>14}'.format('wire format', 'ratio', 'final loss', 'loss vs fp64'))
+    reference = None
+    for name, config in CONFIGS:
+        compressor = None if config is None else compression.GradientCompressor(**config)
+        losses = train(features, target, args.num_data, args.steps, args.learning_rate, compressor)
+        if reference is None:
+            reference = losses[-1]
+        ratio = 1. if compressor is None else compressor.stats()['compression_ratio']
+        if mpi.is_root():
+            print('{0:>30} {1:>12.2f} {2:>12.4f} {3:>+14.4%}'.format(name, ratio, losses[-1],
+                                                                    losses[-1] / reference - 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ import numpy as np
 import numpy.testing as npt
 import unittest
 
+from decaf import base
 from decaf.base import Blob
 
 
@@ -34,6 +35,30 @@ class TestBlob(unittest.TestCase):
         output = np.dot(blob_a.data().T, blob_c.data())
         self.assertEqual(output.shape, (3, 4))
 
+    def testBlobAccessors(self):
+        blob = Blob((4, 3))
+        blob.init_diff()
+        # the accessors return the stored arrays without allocating views.
+        self.assertIs(blob.data(), blob.data())
+        self.assertIs(blob.diff(), blob.diff())
+        with self.assertRaises(AttributeError):
+            blob.extra = None
+
+    def testBlobCapacity(self):
+        blob = Blob((4, 3))
+        blob.init_diff()[:] = 1.
+        num_allocations = base.num_allocations()
+        data = blob.init_data((2, 3))
+        diff = blob.init_diff()
+        self.assertEqual(data.shape, (2, 3))
+        npt.assert_array_equal(diff, 0.)
+        blob.init_data((4, 3))
+        self.assertEqual(base.num_allocations(), num_allocations)
+        # growing beyond the capacity, or changing the dtype, allocates.
+        blob.init_data((5, 3))
+        blob.init_data((5, 3), np.float32)
+        self.assertEqual(base.num_allocations(), num_allocations + 2)
+
 
 if __name__ == '__main__':
     unittest.main()
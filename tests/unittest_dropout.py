@@ -1,7 +1,7 @@
 import numpy as np
 import unittest
 
-from decaf.base import Blob
+from decaf.base import Blob, PHASE_TEST, PHASE_TRAIN
 from decaf.layers import dropout, fillers
 
 
@@ -17,12 +17,54 @@ class TestDropout(unittest.TestCase):
         # simulate a diff
         fillers.RandFiller().fill(top.init_diff())
         layer.backward([bottom], [top], True)
-        np.testing.assert_array_equal(top.data()[top.data() != 0],
-                                      bottom.data()[top.data() != 0])
+        # the kept values are scaled by 1 / ratio.
+        np.testing.assert_array_almost_equal(top.data()[top.data() != 0],
+                                             bottom.data()[top.data() != 0] * 2.)
         np.testing.assert_array_equal(bottom.diff()[top.data() == 0],
                                       0)
-        np.testing.assert_array_equal(bottom.diff()[top.data() != 0],
-                                      top.diff()[top.data() != 0])
+        np.testing.assert_array_almost_equal(bottom.diff()[top.data() != 0],
+                                             top.diff()[top.data() != 0] * 2.)
+
+    def testdropoutlayertestphase(self):
+        layer = dropout.DropoutLayer(name='dropout', ratio=0.5)
+        layer.set_phase(PHASE_TEST)
+        bottom = Blob((100, 4), filler=fillers.RandFiller(min=1, max=2))
+        top = Blob()
+        layer.forward([bottom], [top])
+        np.testing.assert_array_equal(top.data(), bottom.data())
+        fillers.RandFiller().fill(top.init_diff())
+        layer.backward([bottom], [top], True)
+        np.testing.assert_array_equal(bottom.diff(), top.diff())
+
+    def testdropoutlayerphaseswitch(self):
+        # the test phase aliases the blobs, which should not leak into the following train phase.
+        layer = dropout.DropoutLayer(name='dropout', ratio=0.5)
+        np.random.seed(1701)
+        bottom = Blob((100, 4), filler=fillers.RandFiller(min=1, max=2))
+        features = bottom.data().copy()
+        top = Blob()
+        for phase in [PHASE_TRAIN, PHASE_TEST, PHASE_TRAIN]:
+            layer.set_phase(phase)
+            layer.forward([bottom], [top])
+            top_diff = top.init_diff()
+            fillers.RandFiller(min=1, max=2).fill(top_diff)
+            expected_top_diff = top_diff.copy()
+            layer.backward([bottom], [top], True)
+            np.testing.assert_array_equal(bottom.data(), features)
+            np.testing.assert_array_equal(top.diff(), expected_top_diff)
+            self.assertGreater(np.abs(top.data()).sum(), 0)
+            self.assertGreater(np.abs(bottom.diff()).sum(), 0)
+        np.testing.assert_array_almost_equal(top.data()[top.data() != 0], features[top.data() != 0] * 2.)
+        np.testing.assert_array_almost_equal(bottom.diff(), top.diff() * (top.data() != 0) * 2.)
+
+    def testrandombits(self):
+        np.random.seed(1701)
+        for ratio in [0.5, 0.2, 0.9]:
+            bits = fillers.random_bits(ratio, 100001)
+            self.assertEqual(bits.dtype, np.uint8)
+            self.assertEqual(bits.size, 12501)
+            mask = np.unpackbits(bits, count=100001)
+            self.assertAlmostEqual(mask.mean(), ratio, places=2)
 
 
 if __name__ == '__main__':
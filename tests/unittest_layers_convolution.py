@@ -0,0 +1,138 @@
+import numpy as np
+import unittest
+
+from decaf import base
+from decaf.base import Blob
+from decaf.layers import convolution
+
+
+class TestConvolution(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+
+    @staticmethod
+    def reference(features, kernels, pad, stride):
+        padded = np.pad(features, ((0, 0), (pad, pad), (pad, pad), (0, 0)))
+        ksize = kernels.shape[1]
+        size = (padded.shape[1] - ksize) // stride + 1
+        weight = kernels.reshape(-1, kernels.shape[0])
+        output = np.zeros((features.shape[0], size, size, kernels.shape[0]))
+        for i in range(size):
+            for j in range(size):
+                patch = padded[:, i * stride:i * stride + ksize, j * stride:j * stride + ksize]
+                output[:, i, j] = patch.reshape(features.shape[0], -1).dot(weight)
+        return output
+
+    def testForwardBackward(self):
+        for mode, pad in [('valid', 0), ('same', 1), ('full', 2)]:
+            features = np.random.randn(2, 6, 6, 3)
+            bottom_blob = Blob()
+            bottom_blob.mirror(features)
+            top_blob = Blob()
+            layer = convolution.ConvolutionLayer(name='conv', num_kernels=4, ksize=3, stride=2, mode=mode)
+            layer.forward([bottom_blob], [top_blob])
+            kernels = layer.param()[0].data()
+            kernels[:] = np.random.randn(*kernels.shape)
+            layer.forward([bottom_blob], [top_blob])
+            np.testing.assert_array_almost_equal(top_blob.data(), self.reference(features, kernels, pad, 2))
+            # the convolution is linear, so the gradients can be checked against the forward pass.
+            top_diff = np.random.randn(*top_blob.data().shape)
+            top_blob.init_diff()[:] = top_diff
+            layer.backward([bottom_blob], [top_blob], True)
+            kernel_diff = layer.param()[0].diff()
+            index = (1, 2, 3, 1)
+            unit = np.zeros_like(features)
+            unit[index] = 1.
+            self.assertAlmostEqual(bottom_blob.diff()[index],
+                                   (self.reference(unit, kernels, pad, 2) * top_diff).sum())
+            index = (2, 1, 0, 2)
+            unit = np.zeros_like(kernels)
+            unit[index] = 1.
+            self.assertAlmostEqual(kernel_diff[index], (self.reference(features, unit, pad, 2) * top_diff).sum())
+
+    @staticmethod
+    def to_channel_first(kernels):
+        # the channels-last layer uses its kernels as the flat (ksize * ksize * channels, num_kernels) weight.
+        num_kernels, ksize, _, channels = kernels.shape
+        return kernels.reshape(ksize, ksize, channels, num_kernels).transpose(3, 2, 0, 1)
+
+    def testChannelFirst(self):
+        for mode, stride, channels in [('valid', 1, 3), ('same', 2, 1), ('full', 2, 2)]:
+            features = np.random.randn(2, 7, 6, channels)
+            blobs = {}
+            for layout in [base.LAYOUT_NHWC, base.LAYOUT_NCHW]:
+                bottom_blob, top_blob = Blob(), Blob()
+                # a single channel may also be given without the channel axis.
+                data = features if layout == base.LAYOUT_NHWC else features.transpose(0, 3, 1, 2).copy()
+                bottom_blob.mirror(data[:, 0] if channels == 1 and layout == base.LAYOUT_NCHW else data)
+                layer = convolution.ConvolutionLayer(name='conv', num_kernels=4, ksize=3, stride=stride, mode=mode,
+                                                     layout=layout)
+                layer.forward([bottom_blob], [top_blob])
+                kernels = layer.param()[0].data()
+                if layout == base.LAYOUT_NHWC:
+                    kernels[:] = np.random.randn(*kernels.shape)
+                    expected_kernels = kernels
+                else:
+                    self.assertEqual(kernels.shape, (4, channels, 3, 3))
+                    kernels[:] = self.to_channel_first(expected_kernels)
+                layer.forward([bottom_blob], [top_blob])
+                self.assertEqual(top_blob.data().shape, layer.output_shapes([bottom_blob.data().shape])[0])
+                top_diff = np.random.RandomState(0).randn(*top_blob.data().shape)
+                if layout == base.LAYOUT_NCHW:
+                    np.testing.assert_array_almost_equal(top_blob.data(), blobs['output'].transpose(0, 3, 1, 2))
+                    top_diff = top_diff_nhwc.transpose(0, 3, 1, 2).copy()
+                top_blob.init_diff()[:] = top_diff
+                layer.backward([bottom_blob], [top_blob], True)
+                if layout == base.LAYOUT_NHWC:
+                    blobs = {'output': top_blob.data().copy(), 'kernel_diff': layer.param()[0].diff().copy(),
+                             'bottom_diff': bottom_blob.diff().copy()}
+                    top_diff_nhwc = top_diff
+                else:
+                    np.testing.assert_array_almost_equal(layer.param()[0].diff(),
+                                                         self.to_channel_first(blobs['kernel_diff']))
+                    np.testing.assert_array_almost_equal(bottom_blob.diff().reshape(2, channels, 7, 6),
+                                                         blobs['bottom_diff'].transpose(0, 3, 1, 2))
+
+    def testDirect(self):
+        # 1x1 kernels and non-overlapping patches skip im2col; 7 rows do not fit a stride of 2 or 3.
+        for ksize, stride, mode in [(1, 1, 'same'), (1, 2, 'full'), (2, 2, 'valid'), (3, 3, 'valid')]:
+            for layout in [base.LAYOUT_NHWC, base.LAYOUT_NCHW]:
+                features = nhwc_features = np.random.randn(2, 7, 7, 3)
+                layer = convolution.ConvolutionLayer(name='conv', num_kernels=4, ksize=ksize, stride=stride,
+                                                     mode=mode, layout=layout)
+                self.assertTrue(layer._direct)
+                kernels = np.random.randn(4, ksize, ksize, 3)
+                expected = self.reference(features, kernels, 0, stride)
+                top_diff = np.random.randn(*expected.shape)
+                direction = np.random.randn(*features.shape)
+                if layout == base.LAYOUT_NCHW:
+                    features = features.transpose(0, 3, 1, 2).copy()
+                    expected = expected.transpose(0, 3, 1, 2)
+                    top_diff = top_diff.transpose(0, 3, 1, 2).copy()
+                bottom_blob, top_blob = Blob(), Blob()
+                bottom_blob.mirror(features)
+                layer.forward([bottom_blob], [top_blob])
+                layer_kernels = layer.param()[0].data()
+                layer_kernels[:] = kernels if layout == base.LAYOUT_NHWC else self.to_channel_first(kernels)
+                layer.forward([bottom_blob], [top_blob])
+                self.assertEqual(top_blob.data().shape, layer.output_shapes([features.shape])[0])
+                np.testing.assert_array_almost_equal(top_blob.data(), expected)
+                top_blob.init_diff()[:] = top_diff
+                layer.backward([bottom_blob], [top_blob], True)
+                # the convolution is linear, so the gradients are checked along random directions.
+                if layout == base.LAYOUT_NCHW:
+                    top_diff = top_diff.transpose(0, 2, 3, 1)
+                    kernel_diff = layer.param()[0].diff().transpose(2, 3, 1, 0).reshape(kernels.shape)
+                    bottom_diff = bottom_blob.diff().transpose(0, 2, 3, 1)
+                else:
+                    kernel_diff = layer.param()[0].diff()
+                    bottom_diff = bottom_blob.diff()
+                self.assertAlmostEqual((bottom_diff * direction).sum(),
+                                       (self.reference(direction, kernels, 0, stride) * top_diff).sum())
+                unit = np.random.randn(*kernels.shape)
+                self.assertAlmostEqual((kernel_diff * unit).sum(),
+                                       (self.reference(nhwc_features, unit, 0, stride) * top_diff).sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
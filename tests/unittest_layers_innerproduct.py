@@ -1,8 +1,9 @@
 import unittest
 import numpy as np
+from scipy import sparse
 
-from decaf.base import Blob
-from decaf.layers import innerproduct
+from decaf.base import Blob, InvalidLayerError
+from decaf.layers import innerproduct, regularization
 
 
 class TestLayerInnerproduct(unittest.TestCase):
@@ -33,6 +34,101 @@ class TestLayerInnerproduct(unittest.TestCase):
                 self.assertTrue(blob.has_diff())
                 self.assertEqual(blob.diff().shape, blob.data().shape)
 
+    def testSparseInput(self):
+        np.random.seed(1701)
+        dense = np.random.rand(20, 30)
+        dense[dense < 0.9] = 0.
+        top_diff = np.random.rand(20, 4)
+        results = []
+        for features in [dense, sparse.csr_matrix(dense)]:
+            layer = innerproduct.InnerProductLayer(name='ip', num_output=4,
+                                                   reg=regularization.L2Regularizer(weight=0.1))
+            bottom = Blob()
+            bottom.mirror(features)
+            top = Blob()
+            layer.forward([bottom], [top])
+            layer.param()[0].data()[:] = np.arange(120).reshape(30, 4) / 100.
+            layer.forward([bottom], [top])
+            top.init_diff()[:] = top_diff
+            loss = layer.backward([bottom], [top], propagate_down=False)
+            results.append((top.data().copy(), loss, [param.diff().copy() for param in layer.param()]))
+        np.testing.assert_array_almost_equal(results[0][0], results[1][0])
+        self.assertAlmostEqual(results[0][1], results[1][1])
+        for diff, diff_sparse in zip(results[0][2], results[1][2]):
+            np.testing.assert_array_almost_equal(diff, diff_sparse)
+
+    def testCompact(self):
+        np.random.seed(1701)
+        features = np.random.randn(10, 30)
+        layer = innerproduct.InnerProductLayer(name='ip', num_output=4)
+        bottom = Blob()
+        bottom.mirror(features)
+        top = Blob()
+        layer.forward([bottom], [top])
+        weight = layer.param()[0].data()
+        weight[:] = np.random.randn(30, 4)
+        weight[np.arange(120).reshape(30, 4) % 5 != 0] = 1e-4
+        # the density is above the cutoff, so the weight is only thresholded.
+        self.assertAlmostEqual(layer.compact(threshold=1e-3, max_density=0.1), 0.2)
+        self.assertIsNone(layer._sparse_weight)
+        self.assertAlmostEqual(layer.compact(threshold=1e-3, max_density=0.3), 0.2)
+        self.assertIsNotNone(layer._sparse_weight)
+        layer.forward([bottom], [top])
+        np.testing.assert_array_almost_equal(top.data(), np.dot(features, weight) + layer.param()[1].data())
+        # updating the weight drops the sparse copy.
+        top.init_diff()[:] = 1.
+        layer.backward([bottom], [top], propagate_down=False)
+        layer.update()
+        self.assertIsNone(layer._sparse_weight)
+
+    def testCompactStale(self):
+        # changing the weight without update(), like solvers and parameter loading do, falls back to the dense weight.
+        np.random.seed(1701)
+        features = np.random.randn(10, 30)
+        layer = innerproduct.InnerProductLayer(name='ip', num_output=4)
+        bottom = Blob()
+        bottom.mirror(features)
+        top = Blob()
+        layer.forward([bottom], [top])
+        weight = layer.param()[0].data()
+        bias = layer.param()[1].data()
+        for change in ['in_place', 'mirror']:
+            weight[:] = np.random.randn(30, 4) * (np.arange(120).reshape(30, 4) % 5 == 0)
+            layer.compact(max_density=0.3)
+            self.assertIsNotNone(layer._sparse_weight)
+            layer.forward([bottom], [top])
+            np.testing.assert_array_almost_equal(top.data(), np.dot(features, weight) + bias)
+            if change == 'in_place':
+                weight[0, 1] = 1.
+                layer.param()[0].mark_changed()
+            else:
+                layer.param()[0].mirror(np.random.randn(30, 4))
+                weight = layer.param()[0].data()
+            layer.forward([bottom], [top])
+            self.assertIsNone(layer._sparse_weight)
+            np.testing.assert_array_almost_equal(top.data(), np.dot(features, weight) + bias)
+
+    def testCompactInferenceOnly(self):
+        np.random.seed(1701)
+        features = np.random.randn(10, 30)
+        layer = innerproduct.InnerProductLayer(name='ip', num_output=4)
+        bottom = Blob()
+        bottom.mirror(features)
+        top = Blob()
+        layer.forward([bottom], [top])
+        weight = np.random.randn(30, 4) * (np.arange(120).reshape(30, 4) % 5 == 0)
+        layer.param()[0].data()[:] = weight
+        layer.compact(max_density=0.3, inference_only=True)
+        self.assertFalse(layer.param()[0].has_data())
+        layer.forward([bottom], [top])
+        np.testing.assert_array_almost_equal(top.data(), np.dot(features, weight) + layer.param()[1].data())
+        top.init_diff()[:] = 1.
+        self.assertRaises(InvalidLayerError, layer.backward, [bottom], [top], False)
+        # loading new weights makes the layer dense again.
+        layer.param()[0].mirror(weight)
+        layer.forward([bottom], [top])
+        self.assertIsNone(layer._sparse_weight)
+        layer.backward([bottom], [top], False)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,132 @@
+import numpy as np
+import unittest
+
+from decaf import base, net
+from decaf.base import Blob
+from decaf.layers import core_layers, loss, sampled_softmax
+
+
+def _reference(pred, label):
+    prob = np.exp(pred - pred.max(axis=1)[:, np.newaxis])
+    prob /= prob.sum(axis=1)[:, np.newaxis]
+    if label.ndim == 1:
+        dense = np.zeros_like(pred)
+        dense[np.arange(pred.shape[0]), label] = 1.
+        label = dense
+    return -(np.log(prob) * label).sum(), prob - label
+
+
+class TestLayerLoss(unittest.TestCase):
+    """
+    Test the loss layers
+    """
+
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        self.pred = np.random.randn(37, 11) * 10
+        self.sparse_label = np.random.randint(11, size=37)
+        self.dense_label = np.random.rand(37, 11)
+        self.dense_label /= self.dense_label.sum(axis=1)[:, np.newaxis]
+
+    def testMultinomialLogisticLoss(self):
+        for label in [self.sparse_label, self.dense_label]:
+            loss_ref, diff_ref = _reference(self.pred, label)
+            # small budgets force the rows to be processed in several chunks.
+            for memory in [1, 200, 1e6]:
+                layer = loss.MultinomialLogisticLossLayer(name='loss', memory=memory)
+                bottom = [Blob(self.pred.shape), Blob(label.shape, label.dtype)]
+                bottom[0].data()[:] = self.pred
+                bottom[1].data()[:] = label
+                layer.forward(bottom, [])
+                self.assertAlmostEqual(layer.backward(bottom, [], False), loss_ref)
+                np.testing.assert_array_almost_equal(bottom[0].diff(), diff_ref)
+
+
+class TestSampledSoftmaxLoss(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        self.features = np.random.randn(20, 6)
+        self.label = np.random.randint(50, size=20)
+
+    def _layer(self, **kwargs):
+        layer = sampled_softmax.SampledSoftmaxLossLayer(name='loss', num_output=50, **kwargs)
+        bottom = [Blob(), Blob()]
+        bottom[0].mirror(self.features)
+        bottom[1].mirror(self.label)
+        layer.forward(bottom, [])
+        for param in layer.param():
+            param.data()[:] = np.random.randn(*param.data().shape)
+        return layer, bottom
+
+    def testFullSoftmax(self):
+        # in the test phase, the layer is an inner product followed by the multinomial logistic loss.
+        layer, bottom = self._layer(num_sampled=5)
+        layer.set_phase(base.PHASE_TEST)
+        weight, bias = [param.data() for param in layer.param()]
+        loss_ref, diff_ref = _reference(self.features.dot(weight) + bias, self.label)
+        layer.forward(bottom, [])
+        self.assertAlmostEqual(layer.backward(bottom, [], True), loss_ref)
+        np.testing.assert_array_almost_equal(bottom[0].diff(), diff_ref.dot(weight.T))
+        np.testing.assert_array_almost_equal(layer.param()[0].diff(), self.features.T.dot(diff_ref))
+        np.testing.assert_array_almost_equal(layer.param()[1].diff(), diff_ref.sum(0))
+
+    def testSampledGradient(self):
+        probabilities = np.random.rand(50) + 0.1
+        for sampler in ['uniform', 'log_uniform', probabilities]:
+            layer, bottom = self._layer(num_sampled=8, sampler=sampler)
+            weight, bias = [param.data() for param in layer.param()]
+            # the same seed draws the same negatives, so the gradient can be checked with finite differences.
+            np.random.seed(4)
+            layer.forward(bottom, [])
+            touched = layer._touched
+            weight_diff, bias_diff = [param.diff().copy() for param in layer.param()]
+            bottom_diff = bottom[0].diff().copy()
+            untouched = np.setdiff1d(np.arange(50), touched)
+            self.assertTrue(np.all(weight_diff[:, untouched] == 0))
+            self.assertTrue(np.all(bias_diff[untouched] == 0))
+            eps = 1e-6
+            for array, diff, index in [(weight, weight_diff, (2, touched[0])), (weight, weight_diff, (4, touched[-1])),
+                                       (bias, bias_diff, touched[1]), (self.features, bottom_diff, (3, 5))]:
+                losses = []
+                for sign in [1, -1]:
+                    array[index] += sign * eps
+                    np.random.seed(4)
+                    layer.forward(bottom, [])
+                    losses.append(layer.backward(bottom, [], True))
+                    array[index] -= sign * eps
+                self.assertAlmostEqual(diff[index], (losses[0] - losses[1]) / (2 * eps), places=5)
+            # only the touched columns are updated, and the next pass clears them.
+            np.random.seed(4)
+            layer.forward(bottom, [])
+            before = weight.copy()
+            layer.update()
+            np.testing.assert_array_equal(weight[:, untouched], before[:, untouched])
+            np.random.seed(5)
+            layer.forward(bottom, [])
+            untouched = np.setdiff1d(np.arange(50), layer._touched)
+            self.assertTrue(np.all(layer.param()[0].diff()[:, untouched] == 0))
+
+    def testTraining(self):
+        # sampled softmax training lowers the full softmax loss.
+        features = np.random.randn(500, 10)
+        label = (features.dot(np.random.randn(10, 50) * 3)).argmax(axis=1)
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[features, label]),
+                            provides=['features', 'label'])
+        decaf_net.add_layer(core_layers.SampledSoftmaxLossLayer(name='loss', num_output=50, num_sampled=10),
+                            needs=['features', 'label'])
+        decaf_net.finish()
+        decaf_net.set_phase(base.PHASE_TEST)
+        initial = decaf_net.execute()
+        decaf_net.set_phase(base.PHASE_TRAIN)
+        for _ in range(200):
+            decaf_net.execute()
+            for param in decaf_net.params():
+                param.diff()[...] *= -0.5 / features.shape[0]
+            decaf_net.update()
+        decaf_net.set_phase(base.PHASE_TEST)
+        self.assertLess(decaf_net.execute(), 0.5 * initial)
+
+
+if __name__ == '__main__':
+    unittest.main()
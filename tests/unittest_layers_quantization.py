@@ -0,0 +1,63 @@
+import numpy as np
+import unittest
+
+from decaf import net
+from decaf.base import Blob, DecafError
+from decaf.layers import convolution, core_layers, quantization, relu
+
+
+class TestQuantization(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+
+    def testInt8Dot(self):
+        # few rows run on the int8 kernel, and more rows on float32 BLAS over blocks of the weight.
+        for num in [1, 4, quantization._INT8_KERNEL_ROWS + 5]:
+            for k in [5, quantization._EXACT_CHUNK * 2 + 3]:
+                features = np.random.randint(-127, 128, (num, k)).astype(np.int8)
+                weight = np.random.randint(-127, 128, (k, 3)).astype(np.int8)
+                product = quantization.int8_dot(features, weight)
+                self.assertEqual(product.dtype, np.int32)
+                np.testing.assert_array_equal(product, np.dot(features.astype(np.int64), weight.astype(np.int64)))
+
+    def testQuantizedInnerProduct(self):
+        features = np.random.randn(10, 20)
+        weight = np.random.randn(20, 5)
+        bias = np.random.randn(5)
+        layer = quantization.QuantizedInnerProductLayer(name='ip', weight=weight, bias=bias,
+                                                        input_scale=np.abs(features).max() / 127)
+        self.assertEqual(layer._weight.dtype, np.int8)
+        bottom_blob = Blob()
+        bottom_blob.mirror(features)
+        top_blob = Blob()
+        layer.forward([bottom_blob], [top_blob])
+        np.testing.assert_allclose(top_blob.data(), np.dot(features, weight) + bias, atol=0.5)
+        self.assertRaises(DecafError, layer.backward, [bottom_blob], [top_blob], False)
+
+    def testQuantizeNet(self):
+        images = np.random.randn(40, 8, 8, 3)
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[images]), provides=['images'])
+        decaf_net.add_layer(convolution.ConvolutionLayer(name='conv', num_kernels=6, ksize=3, stride=1, mode='same'),
+                            needs=['images'], provides=['conv_out'])
+        decaf_net.add_layer(relu.ReLULayer(name='relu'), needs=['conv_out'], provides=['relu_out'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=10), needs=['relu_out'],
+                            provides=['output'])
+        decaf_net.finish()
+        decaf_net.forward()
+        for param in decaf_net.params():
+            param.data()[:] = np.random.randn(*param.data().shape) * 0.1
+        decaf_net.forward()
+        float_output = decaf_net.blob('output').data().copy()
+        report = quantization.quantize_net(decaf_net, 'data', 'output', [images[:20], images[20:]])
+        self.assertEqual(report['layers'], ['conv', 'ip'])
+        self.assertIsInstance(decaf_net.layers()['conv'], quantization.QuantizedConvolutionLayer)
+        self.assertIsInstance(decaf_net.layers()['ip'], quantization.QuantizedInnerProductLayer)
+        self.assertLess(report['quantized_bytes'] * 4, report['float_bytes'])
+        self.assertGreaterEqual(report['top1_agreement'], 0.9)
+        self.assertLess(report['mean_abs_error'], 0.05 * np.abs(float_output).mean())
+        self.assertEqual(decaf_net.params(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import numpy as np
+import unittest
+
+from decaf.base import Blob
+from decaf.layers import relu
+
+
+class TestLayerReLU(unittest.TestCase):
+    def testReLULayer(self):
+        np.random.seed(1701)
+        layer = relu.ReLULayer(name='relu')
+        bottom = Blob((10, 3, 7))
+        bottom.data()[:] = np.random.randn(10, 3, 7)
+        top = Blob()
+        layer.forward([bottom], [top])
+        np.testing.assert_array_equal(top.data(), np.maximum(bottom.data(), 0))
+        top_diff = top.init_diff()
+        top_diff[:] = np.random.randn(10, 3, 7)
+        layer.backward([bottom], [top], True)
+        np.testing.assert_array_equal(bottom.diff(), top_diff * (bottom.data() > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import numpy as np
+import subprocess
+import sys
+import unittest
+
+from decaf import net
+from decaf import base
+from decaf.base import DecafError
+from decaf.layers import convolution, core_layers, dropout, relu
+
+
+class TestNet(unittest.TestCase):
+    def testOrderAndExecute(self):
+        decaf_net = net.Net()
+        # add the layers in reverse order.
+        decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip2', num_output=3),
+                            needs=['hidden_relu'], provides=['output'])
+        decaf_net.add_layer(relu.ReLULayer(name='relu'), needs=['hidden'], provides=['hidden_relu'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip1', num_output=4),
+                            needs=['features'], provides=['hidden'])
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[np.random.rand(5, 2),
+                                                                              np.arange(5) % 3]),
+                            provides=['features', 'target'])
+        decaf_net.finish()
+        self.assertEqual([name for name, _, _, _ in decaf_net._forward_order],
+                         ['data', 'ip1', 'relu', 'ip2', 'loss'])
+        # the data layer does not need backward, and ip1 does not need to propagate down.
+        self.assertEqual([(name, propagate_down) for name, _, _, _, propagate_down in decaf_net._backward_order],
+                         [('loss', True), ('ip2', True), ('relu', True), ('ip1', False)])
+        self.assertGreater(decaf_net.execute(), 0.)
+        self.assertEqual(set(decaf_net.graph().successors('hidden')), {'relu'})
+
+    def testInvalidNet(self):
+        decaf_net = net.Net()
+        decaf_net.add_layer(relu.ReLULayer(name='relu1'), needs=['a'], provides=['b'])
+        decaf_net.add_layer(relu.ReLULayer(name='relu2'), needs=['b'], provides=['a'])
+        self.assertRaises(DecafError, decaf_net.finish)
+        decaf_net = net.Net()
+        decaf_net.add_layer(relu.ReLULayer(name='relu'), needs=['a'], provides=['b'])
+        self.assertRaises(DecafError, decaf_net.finish)
+
+    def testVariableBatchSize(self):
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[np.random.rand(25, 6),
+                                                                              np.arange(25) % 3]),
+                            provides=['features', 'target'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip1', num_output=5),
+                            needs=['features'], provides=['hidden'])
+        decaf_net.add_layer(relu.ReLULayer(name='relu'), needs=['hidden'], provides=['hidden_relu'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip2', num_output=3),
+                            needs=['hidden_relu'], provides=['output'])
+        decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+        decaf_net.finish()
+        data_layer = decaf_net.layers()['data']
+        data_layer.set_range(0, 10)
+        decaf_net.execute()
+        num_allocations = base.num_allocations()
+        # smaller batches reuse the buffers of the largest batch.
+        for start, stop in [(20, 25), (10, 20), (20, 25)]:
+            data_layer.set_range(start, stop)
+            decaf_net.execute()
+            decaf_net.update()
+            self.assertEqual(decaf_net.blob('hidden').data().shape, (stop - start, 5))
+        self.assertEqual(base.num_allocations(), num_allocations)
+
+    def testShapeInference(self):
+        features = np.random.rand(6, 9, 9, 2)
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[features, np.arange(6) % 4]),
+                            provides=['features', 'target'])
+        decaf_net.add_layer(convolution.ConvolutionLayer(name='conv', num_kernels=3, ksize=3, stride=2, mode='same'),
+                            needs=['features'], provides=['conv_output'])
+        decaf_net.add_layer(relu.ReLULayer(name='relu'), needs=['conv_output'], provides=['conv_relu'])
+        decaf_net.add_layer(dropout.DropoutLayer(name='dropout', ratio=0.5), needs=['conv_relu'],
+                            provides=['conv_dropout'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=4),
+                            needs=['conv_dropout'], provides=['output'])
+        decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+        # the data layer tells its own shapes, so no input shapes need to be given.
+        decaf_net.finish(input_shapes={})
+        # the parameters are allocated before the first execution.
+        self.assertEqual([param.data().shape for param in decaf_net.params()], [(3, 3, 3, 2), (75, 4), (4,)])
+        report = decaf_net.memory_report()
+        decaf_net.execute()
+        for blob_name, blob_report in report['blobs'].items():
+            blob = decaf_net.blob(blob_name)
+            self.assertEqual(blob.data().shape, blob_report['shape'])
+            self.assertEqual(blob.diff().nbytes if blob.has_diff() else 0, blob_report['diff_bytes'])
+        self.assertEqual(report['layers']['ip']['data_bytes'], (75 * 4 + 4) * 8)
+        report = decaf_net.memory_report({'features': (600, 9, 9, 2), 'target': (600,)}, np.float32)
+        self.assertEqual(report['blobs']['output']['data_bytes'], 600 * 4 * 4)
+        self.assertRaises(net.InvalidNetworkError, decaf_net.memory_report, {'output': (6, 4)})
+        # oversized configurations are rejected when the net is finished.
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[features, np.arange(6) % 4]),
+                            provides=['features', 'target'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=4),
+                            needs=['features'], provides=['output'])
+        decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+        self.assertRaises(net.InvalidNetworkError, decaf_net.finish,
+                          input_shapes={'features': (10 ** 6, 9, 9, 2), 'target': (10 ** 6,)}, memory_limit=1e9)
+
+    def testShapeInferenceFloat32(self):
+        # the parameters are allocated in the dtype of the data.
+        features = np.random.rand(6, 9, 9, 2).astype(np.float32)
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[features, np.arange(6) % 4]),
+                            provides=['features', 'target'])
+        decaf_net.add_layer(convolution.ConvolutionLayer(name='conv', num_kernels=3, ksize=3, stride=2, mode='same'),
+                            needs=['features'], provides=['conv_output'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=4),
+                            needs=['conv_output'], provides=['output'])
+        decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+        decaf_net.finish(input_shapes={})
+        self.assertEqual([param.data().dtype for param in decaf_net.params()], [np.float32] * 3)
+        decaf_net.forward()
+        self.assertEqual(decaf_net.blob('output').data().dtype, np.float32)
+        decaf_net.execute()
+
+    def testLazyImports(self):
+        code = ('import sys; import decaf.net, decaf.layers.core_layers, decaf.optimization.core_solvers; '
+                'print(any(name in sys.modules for name in ["scipy", "networkx"]))')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import numpy as np
+import unittest
+
+from decaf import net
+from decaf.layers import core_layers, regularization
+from decaf.optimization import core_solvers
+from decaf.optimization.monitor import SolverMonitor
+
+
+class TestArenaLBFGSSolver(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        self.features = np.random.randn(300, 10)
+        self.target = (np.dot(self.features, np.random.randn(10, 3)) + np.random.randn(300, 3)).argmax(axis=1)
+
+    def _build_net(self, features):
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[features, self.target]),
+                            provides=['features', 'target'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=3,
+                                                          reg=regularization.L2Regularizer(weight=0.01)),
+                            needs=['features'], provides=['output'])
+        decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+        decaf_net.finish()
+        return decaf_net
+
+    def testSolve(self):
+        reference = self._build_net(self.features)
+        core_solvers.LBFGSSolver(lbfgs_args={'factr': 10., 'pgtol': 1e-8}).solve(reference)
+        for dtype, chunk_size, decimal in [(np.float64, None, 4), (np.float64, 70, 4), (np.float32, None, 2)]:
+            decaf_net = self._build_net(self.features.astype(dtype))
+            solver = core_solvers.ArenaLBFGSSolver(chunk_size=chunk_size)
+            solver.solve(decaf_net)
+            for param, expected in zip(decaf_net.params(), reference.params()):
+                self.assertEqual(param.data().dtype, dtype)
+                # the parameters are views of the arena.
+                self.assertTrue(np.shares_memory(param.data(), solver._variable))
+                np.testing.assert_array_almost_equal(param.data(), expected.data(), decimal=decimal)
+            self.assertEqual(solver._steps.dtype, dtype)
+
+    def testMonitor(self):
+        monitor = SolverMonitor(max_evaluations=4)
+        decaf_net = self._build_net(self.features)
+        solver = core_solvers.ArenaLBFGSSolver(monitor=monitor)
+        solver.solve(decaf_net)
+        self.assertTrue(solver.info()['task'].startswith('STOPPED'))
+        self.assertEqual(solver.info()['funcalls'], 4)
+        # the net holds the last accepted point.
+        self.assertAlmostEqual(decaf_net.execute(), solver.info()['loss'])
+
+
+if __name__ == '__main__':
+    unittest.main()
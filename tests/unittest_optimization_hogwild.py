@@ -0,0 +1,61 @@
+import numpy as np
+import os
+import unittest
+
+from decaf import net
+from decaf.base import DecafError
+from decaf.layers import core_layers, regularization
+from decaf.optimization import core_solvers
+
+
+class ExitingInnerProductLayer(core_layers.InnerProductLayer):
+    """An inner product layer that kills the process when it runs in any other process than its creator."""
+
+    def __init__(self, **kwargs):
+        core_layers.InnerProductLayer.__init__(self, **kwargs)
+        self._pid = os.getpid()
+
+    def forward(self, bottom, top):
+        if os.getpid() != self._pid:
+            os._exit(3)
+        return core_layers.InnerProductLayer.forward(self, bottom, top)
+
+
+def make_net(ip_layer):
+    np.random.seed(1701)
+    data = np.random.randn(500, 2)
+    features = np.vstack((data + np.array([2, 2]), data - np.array([2, 2])))
+    target = np.hstack((np.ones(500), np.zeros(500))).astype(int)
+    decaf_net = net.Net()
+    decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[features, target]),
+                        provides=['features', 'target'])
+    decaf_net.add_layer(ip_layer, needs=['features'], provides=['output'])
+    decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+    decaf_net.finish()
+    return decaf_net, features, target
+
+
+class TestHogwildSolver(unittest.TestCase):
+    def testSolve(self):
+        ip_layer = core_layers.InnerProductLayer(name='ip', num_output=2,
+                                                 reg=regularization.L2Regularizer(weight=0.001))
+        decaf_net, features, target = make_net(ip_layer)
+        solver = core_solvers.HogwildSolver(num_workers=2, base_lr=0.1, batch_size=20, num_epochs=2)
+        solver.solve(decaf_net)
+        stats = solver.stats()
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(sum(record['samples'] for record in stats), 2000)
+        # the solved parameters should be back in the net and classify the data.
+        weight, bias = [param.data() for param in ip_layer.param()]
+        pred = (np.dot(features, weight) + bias).argmax(axis=1)
+        self.assertGreater((pred == target).mean(), 0.95)
+
+    def testDeadWorker(self):
+        decaf_net, _, _ = make_net(ExitingInnerProductLayer(name='ip', num_output=2))
+        solver = core_solvers.HogwildSolver(num_workers=2, base_lr=0.1, batch_size=20, num_epochs=2)
+        with self.assertRaisesRegex(DecafError, 'worker [01] \\(exit code 3\\)'):
+            solver.solve(decaf_net)
+
+
+if __name__ == '__main__':
+    unittest.main()
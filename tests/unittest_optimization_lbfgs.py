@@ -0,0 +1,53 @@
+import numpy as np
+import unittest
+
+from decaf import net
+from decaf.layers import core_layers, regularization
+from decaf.optimization import core_solvers
+
+
+def _build_net(features, target):
+    decaf_net = net.Net()
+    decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[features, target]),
+                        provides=['features', 'target'])
+    decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=3,
+                                                      reg=regularization.L2Regularizer(weight=0.1)),
+                        needs=['features'], provides=['output'])
+    decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+    decaf_net.finish()
+    return decaf_net
+
+
+class TestLBFGSSolver(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        self.features = np.random.randn(47, 5)
+        self.target = np.random.randint(3, size=47)
+
+    def testChunkedObjective(self):
+        full = core_solvers.LBFGSSolver()
+        chunked = core_solvers.LBFGSSolver(chunk_size=10)
+        full._net = _build_net(self.features, self.target)
+        chunked._net = _build_net(self.features, self.target)
+        full._execute(True)
+        chunked._execute(True)
+        variable = np.random.randn(full._param.data().size)
+        loss, gradient = full.obj(variable)
+        loss_chunked, gradient_chunked = chunked.obj(variable)
+        self.assertAlmostEqual(loss, loss_chunked)
+        np.testing.assert_array_almost_equal(gradient, gradient_chunked)
+        # after the chunked run, the data layer should emit the full data again.
+        chunked._net.execute()
+        self.assertEqual(chunked._net.blob('output').data().shape[0], 47)
+
+    def testChunkedSolve(self):
+        results = []
+        for chunk_size in [None, 10]:
+            decaf_net = _build_net(self.features, self.target)
+            core_solvers.LBFGSSolver(chunk_size=chunk_size).solve(decaf_net)
+            results.append(decaf_net.params()[0].data())
+        np.testing.assert_array_almost_equal(results[0], results[1], decimal=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import numpy as np
+import unittest
+
+from decaf import net
+from decaf.layers import core_layers, regularization
+from decaf.optimization import core_solvers
+from decaf.optimization.monitor import SolverMonitor, StopSolving
+
+
+class TestSolverMonitor(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        data = np.random.randn(100, 2)
+        self.features = np.vstack((data + 1, data - 1))
+        self.target = np.hstack((np.ones(100), np.zeros(100))).astype(int)
+
+    def _build_net(self):
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[self.features, self.target]),
+                            provides=['features', 'target'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=2,
+                                                          reg=regularization.L2Regularizer(weight=0.01)),
+                            needs=['features'], provides=['output'])
+        decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+        decaf_net.finish()
+        return decaf_net
+
+    def testBudgets(self):
+        monitor = SolverMonitor(max_evaluations=3)
+        monitor.start()
+        monitor.evaluation(1., np.array([3., 4.]))
+        self.assertEqual(monitor.records[0]['gradient_norm'], 5.)
+        monitor.evaluation(1.)
+        self.assertRaises(StopSolving, monitor.evaluation, 1.)
+        monitor = SolverMonitor(min_improvement=0.1)
+        monitor.start()
+        monitor.iteration(1., samples=10)
+        self.assertIn('samples_per_sec', monitor.records[0])
+        monitor.iteration(0.5)
+        self.assertRaises(StopSolving, monitor.iteration, 0.49)
+        monitor = SolverMonitor(max_time=0.)
+        monitor.start()
+        self.assertRaises(StopSolving, monitor.check)
+
+    def testLBFGS(self):
+        records = []
+        monitor = SolverMonitor(callbacks=[records.append], max_evaluations=5)
+        decaf_net = self._build_net()
+        solver = core_solvers.LBFGSSolver(monitor=monitor)
+        solver.solve(decaf_net)
+        self.assertTrue(solver.info()['task'].startswith('STOPPED'))
+        self.assertEqual(solver.info()['funcalls'], 5)
+        self.assertEqual(len([record for record in records if record['kind'] == 'evaluation']), 5)
+        iterations = [record for record in records if record['kind'] == 'iteration']
+        self.assertEqual(len(iterations), solver.info()['nit'])
+        self.assertTrue(all(record['step_size'] > 0 for record in iterations))
+
+    def testOWLQN(self):
+        # a callback that stops after the second iteration.
+        monitor = SolverMonitor(callbacks=[lambda record: record['kind'] == 'iteration' and record['index'] == 2])
+        decaf_net = self._build_net()
+        solver = core_solvers.OWLQNSolver(l1_weight=0.01, l1_params=[0], monitor=monitor)
+        solver.solve(decaf_net)
+        self.assertEqual(solver.info()['nit'], 2)
+        self.assertAlmostEqual(solver.info()['objective'], monitor.records[-1]['loss'])
+
+    def testHogwild(self):
+        monitor = SolverMonitor(max_evaluations=20)
+        decaf_net = self._build_net()
+        solver = core_solvers.HogwildSolver(num_workers=2, base_lr=0.1, batch_size=10, num_epochs=5, monitor=monitor)
+        solver.solve(decaf_net)
+        # every worker runs 10 mini-batches, which is one epoch over its half of the data.
+        self.assertEqual(sum(record['samples'] for record in solver.stats()), 200)
+        self.assertEqual(len(monitor.records), 1)
+        self.assertGreater(monitor.records[0]['samples_per_sec'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
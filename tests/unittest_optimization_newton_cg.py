@@ -0,0 +1,121 @@
+import numpy as np
+import unittest
+
+from decaf import net
+from decaf.layers import core_layers, regularization, relu
+from decaf.optimization import core_solvers
+
+
+class TestNewtonCGSolver(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+
+    def _build_net(self, features, target, hidden=None, loss='multinomial', weight=0.01):
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[features, target]),
+                            provides=['features', 'target'])
+        bottom = 'features'
+        if hidden is not None:
+            decaf_net.add_layer(core_layers.InnerProductLayer(name='hidden', num_output=hidden,
+                                                              reg=regularization.L2Regularizer(weight=weight)),
+                                needs=[bottom], provides=['hidden_output'])
+            decaf_net.add_layer(relu.ReLULayer(name='relu'), needs=['hidden_output'], provides=['hidden_relu'])
+            bottom = 'hidden_relu'
+        num_output = 1 if loss == 'squared' else 3
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=num_output,
+                                                          reg=regularization.L2Regularizer(weight=weight)),
+                            needs=[bottom], provides=['output'])
+        if loss == 'squared':
+            decaf_net.add_layer(core_layers.SquaredLossLayer(name='loss'), needs=['output', 'target'])
+        else:
+            decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+        decaf_net.finish()
+        decaf_net.execute()
+        for param in decaf_net.params():
+            param.data()[:] = np.random.randn(*param.data().shape)
+        return decaf_net
+
+    def _hessian_product(self, decaf_net, direction, gauss_newton):
+        decaf_net.execute()
+        for r_param, vector in zip(decaf_net.r_params(), direction):
+            if not r_param.has_data():
+                r_param.init_data(vector.shape, vector.dtype)
+            r_param.data()[:] = vector
+        decaf_net.execute_r(gauss_newton)
+        return [r_param.diff().copy() for r_param in decaf_net.r_params()]
+
+    def testHessianProduct(self):
+        features = np.random.randn(20, 4)
+        target = np.random.randint(3, size=20)
+        decaf_net = self._build_net(features, target, hidden=5)
+        params = decaf_net.params()
+        direction = [np.random.randn(*param.data().shape) for param in params]
+        products = self._hessian_product(decaf_net, direction, False)
+        # compare with the central difference of the gradient along the direction.
+        eps = 1e-5
+        gradients = []
+        for sign in [1, -1]:
+            for param, vector in zip(params, direction):
+                param.data()[:] += sign * eps * vector
+            decaf_net.execute()
+            gradients.append([param.diff().copy() for param in params])
+            for param, vector in zip(params, direction):
+                param.data()[:] -= sign * eps * vector
+        for product, plus, minus in zip(products, *gradients):
+            np.testing.assert_array_almost_equal(product, (plus - minus) / (2 * eps), decimal=5)
+        # the Gauss-Newton matrix is positive semi-definite.
+        products = self._hessian_product(decaf_net, direction, True)
+        self.assertGreaterEqual(sum(np.vdot(vector, product) for vector, product in zip(direction, products)), 0)
+
+    def testGaussNewtonLinear(self):
+        # for a linear model the Gauss-Newton matrix is the Hessian.
+        features = np.random.randn(20, 4)
+        target = np.random.randint(3, size=20)
+        decaf_net = self._build_net(features, target)
+        direction = [np.random.randn(*param.data().shape) for param in decaf_net.params()]
+        exact = self._hessian_product(decaf_net, direction, False)
+        gauss_newton = self._hessian_product(decaf_net, direction, True)
+        for expected, product in zip(exact, gauss_newton):
+            np.testing.assert_array_almost_equal(product, expected)
+
+    def testSolveRidge(self):
+        # unnormalized pixel-like features make the problem badly conditioned.
+        features = np.floor(np.random.rand(400, 10) * 256)
+        target = np.dot(features, np.random.randn(10, 1) / 300) + 0.1 * np.random.randn(400, 1)
+        weight = 0.001
+        # the closed form solution of min |X w + b - y|^2 + weight * num_data * |w|^2.
+        augmented = np.vstack([np.hstack([features, np.ones((400, 1))]),
+                               np.hstack([np.sqrt(weight * 400) * np.eye(10), np.zeros((10, 1))])])
+        solution = np.linalg.lstsq(augmented, np.vstack([target, np.zeros((10, 1))]), rcond=None)[0]
+        decaf_net = self._build_net(features, target, loss='squared', weight=weight)
+        solver = core_solvers.NewtonCGSolver()
+        solver.solve(decaf_net)
+        np.testing.assert_array_almost_equal(decaf_net.params()[0].data(), solution[:10], decimal=5)
+        info = solver.info()
+        lbfgs_net = self._build_net(features, target, loss='squared', weight=weight)
+        lbfgs = core_solvers.ArenaLBFGSSolver()
+        lbfgs.solve(lbfgs_net)
+        # fewer passes over the data than L-BFGS.
+        self.assertLess(info['funcalls'] + info['hessian_products'], lbfgs.info()['funcalls'])
+        self.assertLessEqual(info['loss'], lbfgs.info()['loss'] + 1e-6)
+
+    def testSolveLogistic(self):
+        features = np.random.randn(300, 10)
+        target = (np.dot(features, np.random.randn(10, 3)) + np.random.randn(300, 3)).argmax(axis=1)
+        reference = self._build_net(features, target)
+        core_solvers.LBFGSSolver(lbfgs_args={'factr': 10., 'pgtol': 1e-8}).solve(reference)
+        for gauss_newton in [True, False]:
+            decaf_net = self._build_net(features, target)
+            solver = core_solvers.NewtonCGSolver(gauss_newton=gauss_newton)
+            solver.solve(decaf_net)
+            weight, bias = decaf_net.params()
+            np.testing.assert_array_almost_equal(weight.data(), reference.params()[0].data(), decimal=4)
+            # the softmax does not change when the same constant is added to all the biases.
+            expected = reference.params()[1].data()
+            np.testing.assert_array_almost_equal(bias.data() - bias.data().mean(), expected - expected.mean(),
+                                                 decimal=4)
+            self.assertGreater(solver.info()['hessian_products'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import numpy as np
+import unittest
+
+from decaf import net
+from decaf.layers import core_layers
+from decaf.optimization import core_solvers
+
+
+class TestOWLQNSolver(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        self.features = np.random.randn(200, 40)
+        weight = np.zeros((40, 3))
+        weight[:4] = np.random.randn(4, 3) * 3
+        self.target = (np.dot(self.features, weight) + np.random.randn(200, 3)).argmax(axis=1)
+
+    def _build_net(self):
+        decaf_net = net.Net()
+        decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[self.features, self.target]),
+                            provides=['features', 'target'])
+        decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=3),
+                            needs=['features'], provides=['output'])
+        decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+        decaf_net.finish()
+        return decaf_net
+
+    def testSolve(self):
+        l1_weight = 0.02
+        decaf_net = self._build_net()
+        solver = core_solvers.OWLQNSolver(l1_weight=l1_weight, l1_params=[0])
+        solver.solve(decaf_net)
+        weight, bias = decaf_net.params()
+        self.assertEqual(solver.info()['num_zeros'], np.sum(weight.data() == 0))
+        self.assertGreater(solver.info()['num_zeros'], weight.data().size // 2)
+        # check the optimality conditions with the gradient of the smooth loss.
+        decaf_net.execute()
+        scale = l1_weight * self.features.shape[0]
+        zero = weight.data() == 0
+        self.assertTrue(np.all(np.abs(weight.diff()[zero]) <= scale * 1.01))
+        np.testing.assert_allclose(weight.diff()[~zero], -scale * np.sign(weight.data()[~zero]), atol=0.05 * scale)
+        np.testing.assert_allclose(bias.diff(), 0., atol=0.05 * scale)
+
+    def testPseudoGradient(self):
+        variable = np.array([1., -1., 0., 0., 0.])
+        gradient = np.array([0.5, 0.5, -2., 2., 0.5])
+        pseudo = core_solvers.OWLQNSolver.pseudo_gradient(variable, gradient, np.ones(5))
+        np.testing.assert_array_almost_equal(pseudo, [1.5, -0.5, -1., 1., 0.])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+import numpy as np
+import os
+import tempfile
+import unittest
+
+from decaf.serving import batcher, loadgen, server
+
+
+class TestServing(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        self.net = server.demo_net(5, 3)
+        weight, bias = [param.data() for param in self.net.params()]
+        self.predict = lambda inputs: np.dot(inputs, weight) + bias
+
+    def testMicroBatcher(self):
+        micro_batcher = batcher.MicroBatcher(self.net, 'input', 'output', max_batch_size=8, max_wait=0.01)
+        requests = [np.random.randn(np.random.randint(1, 4), 5) for _ in range(20)]
+
+        async def run():
+            await micro_batcher.start()
+            try:
+                return await asyncio.gather(*[micro_batcher.predict(inputs) for inputs in requests])
+            finally:
+                await micro_batcher.stop()
+
+        outputs = asyncio.run(run())
+        for inputs, output in zip(requests, outputs):
+            np.testing.assert_array_almost_equal(output, self.predict(inputs))
+        stats = micro_batcher.stats.summary()
+        self.assertEqual(stats['num_requests'], len(requests))
+        # the requests should have been coalesced.
+        self.assertLess(stats['num_batches'], len(requests))
+        self.assertTrue(all(int(size) <= 8 for size in stats['batch_sizes']))
+
+    def testInvalidRequest(self):
+        micro_batcher = batcher.MicroBatcher(self.net, 'input', 'output', max_batch_size=8, max_wait=0.01)
+        prediction_server = server.PredictionServer(micro_batcher)
+        inputs = np.random.randn(2, 5)
+        bodies = [b'{"inputs": [[1, 2, 3]]}', b'{"inputs": [1, 2, 3, 4, 5]}',
+                  '{{"inputs": {}}}'.format(inputs.tolist()).encode('utf-8')]
+
+        async def run():
+            await micro_batcher.start()
+            try:
+                return await asyncio.gather(*[prediction_server._respond('POST', '/predict', body) for body in bodies])
+            finally:
+                await micro_batcher.stop()
+
+        responses = asyncio.run(run())
+        # the bad requests fail alone, and the good one is still answered.
+        self.assertEqual([status for status, _ in responses], [400, 400, 200])
+        np.testing.assert_array_almost_equal(responses[2][1]['outputs'], self.predict(inputs))
+        self.assertEqual(micro_batcher.stats.num_errors, 0)
+
+    def testServer(self):
+        path = os.path.join(tempfile.mkdtemp(), 'decaf.sock')
+        micro_batcher = batcher.MicroBatcher(self.net, 'input', 'output')
+        prediction_server = server.PredictionServer(micro_batcher, path=path)
+        inputs = np.random.randn(2, 5)
+
+        async def run():
+            await prediction_server.start()
+            try:
+                result = await loadgen.run_rate(200, 0.1, inputs, path=path, num_connections=4)
+                metrics = await loadgen.fetch_metrics(path=path)
+            finally:
+                await prediction_server.stop()
+            return result, metrics
+
+        result, metrics = asyncio.run(run())
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(metrics['num_requests'], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
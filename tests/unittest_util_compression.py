@@ -0,0 +1,66 @@
+from decaf.util import compression, mpi
+import numpy as np
+import unittest
+
+
+class TestGradientCompressor(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        # every instance holds different gradients.
+        self.arrays = [np.random.randn(40, 30) + mpi.RANK, np.random.randn(30) + mpi.RANK]
+        self.total = [sum(array - mpi.RANK + rank for rank in range(mpi.SIZE)) for array in self.arrays]
+
+    def testWireFormat(self):
+        for wire_dtype, ratio, decimal in [(np.float32, 2., 5), (np.float16, 4., 1)]:
+            compressor = compression.GradientCompressor(wire_dtype=wire_dtype, error_feedback=False)
+            arrays = [array.copy() for array in self.arrays]
+            compressor.allreduce(arrays)
+            for array, expected in zip(arrays, self.total):
+                self.assertEqual(array.dtype, np.float64)
+                np.testing.assert_array_almost_equal(array, expected, decimal=decimal)
+            self.assertEqual(compressor.stats()['compression_ratio'], ratio)
+
+    def testTopK(self):
+        compressor = compression.GradientCompressor(wire_dtype=np.float64, density=0.1, bucket_bytes=8 * 310)
+        arrays = [array.copy() for array in self.arrays]
+        compressor.allreduce(arrays)
+        stats = compressor.stats()
+        # 1230 entries in buckets of 310, each sending 31 values and their indices.
+        self.assertEqual(stats['num_messages'], 4)
+        self.assertEqual(stats['wire_bytes'], (3 * 31 + 30) * 12)
+        if mpi.SIZE == 1:
+            # the largest entries of every bucket are sent exactly, and the rest is dropped.
+            flat = np.concatenate([array.ravel() for array in self.arrays])
+            result = np.concatenate([array.ravel() for array in arrays])
+            for start in range(0, flat.size, 310):
+                bucket = flat[start:start + 310]
+                kept = np.argsort(np.abs(bucket))[-int(np.ceil(0.1 * bucket.size)):]
+                expected = np.zeros_like(bucket)
+                expected[kept] = bucket[kept]
+                np.testing.assert_array_equal(result[start:start + 310], expected)
+
+    def testErrorFeedback(self):
+        # with error feedback, the sum of the exchanged gradients only lags behind by the residual.
+        num_steps = 100
+        for error_feedback in [True, False]:
+            compressor = compression.GradientCompressor(wire_dtype=np.float16, density=0.05,
+                                                        error_feedback=error_feedback)
+            accumulated = [np.zeros_like(array) for array in self.arrays]
+            for _ in range(num_steps):
+                arrays = [array.copy() for array in self.arrays]
+                compressor.allreduce(arrays)
+                for total, array in zip(accumulated, arrays):
+                    total += array
+            error = max(np.abs(total / num_steps - expected).max()
+                        for total, expected in zip(accumulated, self.total))
+            if error_feedback:
+                self.assertLess(error, 0.25 * mpi.SIZE)
+            else:
+                # without error feedback, the small entries are never sent.
+                self.assertGreater(error, 0.25 * mpi.SIZE)
+            self.assertGreater(compressor.stats()['compression_ratio'], 10.)
+            self.assertGreater(compressor.stats()['relative_error'], 0.)
+
+
+if __name__ == '__main__':
+    unittest.main()
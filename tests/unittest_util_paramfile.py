@@ -0,0 +1,58 @@
+import numpy as np
+import os
+import tempfile
+import unittest
+
+from decaf import net
+from decaf.base import DecafError
+from decaf.layers import core_layers
+from decaf.util import paramfile
+
+
+def _build_net(features, target):
+    decaf_net = net.Net()
+    decaf_net.add_layer(core_layers.NdArrayDataLayer(name='data', sources=[features, target]),
+                        provides=['features', 'target'])
+    decaf_net.add_layer(core_layers.InnerProductLayer(name='ip', num_output=3),
+                        needs=['features'], provides=['output'])
+    decaf_net.add_layer(core_layers.MultinomialLogisticLossLayer(name='loss'), needs=['output', 'target'])
+    decaf_net.finish()
+    return decaf_net
+
+
+class TestParamfile(unittest.TestCase):
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        self.features = np.random.rand(10, 5)
+        self.target = np.random.randint(3, size=10)
+        self.filename = os.path.join(tempfile.mkdtemp(), 'params.bin')
+
+    def tearDown(self) -> None:
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def testSaveLoad(self):
+        source = _build_net(self.features, self.target)
+        source.execute()
+        for param in source.params():
+            param.data()[:] = np.random.rand(*param.data().shape)
+        paramfile.save(source, self.filename)
+        index = paramfile.read_index(self.filename)
+        self.assertEqual(len(index), 2)
+        for entry in index:
+            self.assertEqual(entry['offset'] % 64, 0)
+        for mmap_mode in ['r', 'c', None]:
+            target = _build_net(self.features, self.target)
+            paramfile.load(target, self.filename, mmap_mode=mmap_mode)
+            for param, loaded in zip(source.params(), target.params()):
+                np.testing.assert_array_equal(param.data(), loaded.data())
+            # the loaded parameters should be used as is by the net.
+            self.assertAlmostEqual(source.execute(), target.execute())
+
+    def testUninitialized(self):
+        source = _build_net(self.features, self.target)
+        self.assertRaises(DecafError, paramfile.save, source, self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
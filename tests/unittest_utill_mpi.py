@@ -1,4 +1,5 @@
 from decaf.util import mpi
+import numpy as np
 import os
 import unittest
 
@@ -51,6 +52,28 @@ class TestMPI(unittest.TestCase):
         else:
             self.assertFalse(mpi.is_root())
 
+    def testArrayCollectives(self):
+        limit = mpi._MPI_BUFFER_LIMIT
+        # use a tiny buffer limit so the arrays are sent in several chunks.
+        mpi._MPI_BUFFER_LIMIT = 24
+        try:
+            array = np.arange(30, dtype=np.float64).reshape(5, 6) + mpi.RANK
+            total = sum(np.arange(30, dtype=np.float64).reshape(5, 6) + rank for rank in range(mpi.SIZE))
+            np.testing.assert_array_equal(mpi.mpi_allreduce(array), total)
+            mpi.mpi_allreduce(array, out=array)
+            np.testing.assert_array_equal(array, total)
+            array = np.arange(13, dtype=np.int32) * (mpi.RANK + 1)
+            np.testing.assert_array_equal(mpi.mpi_bcast(array), np.arange(13))
+            gathered = mpi.mpi_gather(np.ones((3, 5)) * mpi.RANK)
+            if mpi.is_root():
+                self.assertEqual(gathered.shape, (mpi.SIZE, 3, 5))
+                for rank in range(mpi.SIZE):
+                    np.testing.assert_array_equal(gathered[rank], rank)
+            else:
+                self.assertIsNone(gathered)
+        finally:
+            mpi._MPI_BUFFER_LIMIT = limit
+
     def testBarrier(self):
         import time
         # sleep for a while, and resume
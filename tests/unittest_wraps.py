@@ -0,0 +1,83 @@
+import numpy as np
+from scipy import sparse
+import unittest
+
+from decaf.wraps import logistic_regression, ridge_regression
+
+
+class TestWraps(unittest.TestCase):
+    """
+    Test the linear model wraps
+    """
+
+    def setUp(self) -> None:
+        np.random.seed(1701)
+        data = np.random.randn(100, 2)
+        self.features = np.vstack((data + np.array([2, 2]), data - np.array([2, 2])))
+        self.features[np.abs(self.features) < 1] = 0.
+        self.label = np.hstack((np.ones(100), np.zeros(100))).astype(int)
+
+    def testLogisticRegressionSparse(self):
+        weight, bias = logistic_regression.logistic_regression(self.features, self.label, reg_weight=0.05)
+        weight_sparse, bias_sparse = logistic_regression.logistic_regression(
+            sparse.csr_matrix(self.features), self.label, reg_weight=0.05)
+        np.testing.assert_array_almost_equal(weight, weight_sparse, decimal=4)
+        np.testing.assert_array_almost_equal(bias, bias_sparse, decimal=4)
+
+    def testRidgeRegressionSparse(self):
+        target = self.label * 2. - 1.
+        weight, bias = ridge_regression.ridge_regression(self.features, target, reg_weight=0.05)
+        weight_sparse, bias_sparse = ridge_regression.ridge_regression(
+            sparse.csr_matrix(self.features), target, reg_weight=0.05)
+        np.testing.assert_array_almost_equal(weight, weight_sparse, decimal=4)
+        np.testing.assert_array_almost_equal(bias, bias_sparse, decimal=4)
+
+    def testLogisticRegressionPath(self):
+        reg_weights = [0.001, 0.1, 0.01, 1.]
+        for features in [self.features, sparse.csr_matrix(self.features)]:
+            for num_workers in [1, 2]:
+                path = logistic_regression.logistic_regression_path(features, self.label, reg_weights,
+                                                                    num_workers=num_workers)
+                self.assertEqual([fit['reg_weight'] for fit in path], sorted(reg_weights, reverse=True))
+                for fit in path:
+                    self.assertGreater(fit['iterations'], 0)
+                    self.assertGreaterEqual(fit['time'], 0.)
+                    weight, bias = logistic_regression.logistic_regression(self.features, self.label,
+                                                                           reg_weight=fit['reg_weight'])
+                    np.testing.assert_array_almost_equal(fit['weight'], weight, decimal=3)
+
+    def testRidgeRegressionDirect(self):
+        target = np.vstack((self.label * 2. - 1., self.features.sum(axis=1))).T
+        num = self.features.shape[0]
+        for reg_weight in [0., 0.05]:
+            # reference: least squares on the features augmented with the unregularized bias column.
+            augmented = np.vstack((np.hstack((self.features, np.ones((num, 1)))),
+                                   np.hstack((np.sqrt(reg_weight * num) * np.eye(2), np.zeros((2, 1))))))
+            solution = np.linalg.lstsq(augmented, np.vstack((target, np.zeros((2, 2)))), rcond=None)[0]
+            for features, chunk_size in [(self.features, 10000), (self.features, 7),
+                                         (sparse.csr_matrix(self.features), 7)]:
+                weight, bias = ridge_regression.ridge_regression_direct(features, target, reg_weight, chunk_size)
+                np.testing.assert_array_almost_equal(weight, solution[:2])
+                np.testing.assert_array_almost_equal(bias, solution[2])
+            # shards
+            weight, bias = ridge_regression.ridge_regression_direct(
+                [self.features[:50], self.features[50:]], [target[:50], target[50:]], reg_weight)
+            np.testing.assert_array_almost_equal(weight, solution[:2])
+            # dense and sparse shards can be mixed in any order.
+            for shards in [[self.features[:50], sparse.csr_matrix(self.features[50:])],
+                           [sparse.csr_matrix(self.features[:50]), self.features[50:]]]:
+                weight, bias = ridge_regression.ridge_regression_direct(shards, [target[:50], target[50:]],
+                                                                        reg_weight, 7)
+                np.testing.assert_array_almost_equal(weight, solution[:2])
+                np.testing.assert_array_almost_equal(bias, solution[2])
+        # compare with the iterative solver and the path.
+        weight, bias = ridge_regression.ridge_regression(self.features, target[:, 0], reg_weight=0.05)
+        path = ridge_regression.ridge_regression_path(self.features, target[:, 0], [0.05, 0.5])
+        np.testing.assert_array_almost_equal(path[0]['weight'], weight, decimal=3)
+        np.testing.assert_array_almost_equal(path[0]['bias'], bias, decimal=3)
+        np.testing.assert_array_almost_equal(
+            path[1]['weight'], ridge_regression.ridge_regression_direct(self.features, target[:, 0], 0.5)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()